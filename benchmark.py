@@ -0,0 +1,186 @@
+# Desc: 端到端性能测试
+# 用pty模拟串口设备, 通过MyConfigurablePluginManager加载的插件处理数据, 统计吞吐量、丢失的字节数和延迟
+# 例: python benchmark.py --ports 4 --lines 100000 --ansi 0.3 --runtime asyncio
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from configparser import ConfigParser
+from core.manager import TopicManager, MyConfigurablePluginManager
+from core.aio import use_asyncio_runtime
+from core.plugintype import ConvertActor, SourceActor, StorageActor, FilterActor, HighlightActor
+from core.message import unpack
+from core.metrics import MetricsRegistry, Histogram
+from core.synthetic import SyntheticDevice, TrafficPattern, SEQ_PATTERN
+from core.topics import TOPIC_STATS_MAILBOX
+
+
+class LatencySink:
+    """
+    订阅sink topic, 根据每行的序号计算从写入pty到收到的延迟
+    """
+    def __init__(self, devices):
+        self.devices = {d.port: d for d in devices}
+        self.latency = Histogram()
+        self.lines = 0
+        self.frames = 0
+        self.dropped = {}
+        self._lock = threading.Lock()
+
+    def tell(self, message):
+        now = time.monotonic_ns()
+        topic, frames = unpack(message)
+        if topic is None:
+            if message.get('topic') == TOPIC_STATS_MAILBOX:
+                self.dropped[message['actor']] = message['dropped']
+            return
+        with self._lock:
+            self.frames += len(frames)
+            for frame in frames:
+                device = self.devices.get(frame.source)
+                #AnsiStyleActor输出的StyledText
+                data = getattr(frame.data, 'text', frame.data)
+                if isinstance(data, str):
+                    data = data.encode('utf-8', 'ignore')
+                for seq in SEQ_PATTERN.findall(data):
+                    self.lines += 1
+                    sent = device.sent.get(int(seq)) if device else None
+                    if sent is not None:
+                        self.latency.add((now - sent) // 1000)
+
+
+def load_plugins(path):
+    config_parser = ConfigParser()
+    plugin_manager = MyConfigurablePluginManager(
+        configparser_instance=config_parser,
+        categories_filter={
+            "Source": SourceActor,
+            "Filter": FilterActor,
+            "Convert": ConvertActor,
+            "Highlight": HighlightActor,
+            "Storage": StorageActor,
+        },
+        directories_list=[path],
+        plugin_info_ext="ini",
+        config_change_trigger=lambda: None
+    )
+    plugin_manager.collectPlugins()
+    return plugin_manager
+
+
+def run(args):
+    if args.runtime == 'asyncio':
+        use_asyncio_runtime()
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "plugins")
+    plugin_manager = load_plugins(path)
+    m = TopicManager.singleton()
+    metrics = MetricsRegistry.singleton()
+    metrics.enable()
+    #和应用相同的流水线
+    source = plugin_manager.getActorByName('SerialSourceActor', "Source")
+    m.connect(source, plugin_manager.getActorByName('LineSegmentActor', "Convert"))
+    m.connect(plugin_manager.getActorByName('LineSegmentActor', "Convert"), plugin_manager.getActorByName('AnsiStyleActor', "Convert"))
+    m.connect(plugin_manager.getActorByName('AnsiStyleActor', "Convert"), plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"))
+    m.connect(plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"), plugin_manager.getActorByName('FileStoreActor', "Storage"))
+    if args.fusion:
+        m.enable_fusion()
+    plugin_manager.activatePluginByName('LineSegmentActor', "Convert", save_state=False)
+    plugin_manager.activatePluginByName('FileStoreActor', "Storage", save_state=False)
+    plugin_manager.activatePluginByName('AnsiStyleActor', "Convert", save_state=False)
+    plugin_manager.activatePluginByName('Ansi2HtmlConverter', "Convert", save_state=False)
+    plugin_manager.activatePluginByName('SerialSourceActor', "Source", save_state=False)
+    source_ref = plugin_manager.getActorRefByName('SerialSourceActor', "Source")
+
+    pattern = TrafficPattern(
+        lines=args.lines, line_rate=args.rate, line_length=args.length, ansi_density=args.ansi,
+        burst_size=args.burst, burst_every=args.burst_every, pause=args.pause, pause_every=args.pause_every,
+        baudrate=args.baudrate,
+    )
+    devices = [SyntheticDevice(pattern) for _ in range(args.ports)]
+    sink = LatencySink(devices)
+    m.subscribe(args.sink, sink)
+    m.subscribe(TOPIC_STATS_MAILBOX, sink)
+    if args.record:
+        m.ask('/cmd', {'cmd': 'open', 'filename': args.record},
+              actor_ref=plugin_manager.getActorRefByName('FileStoreActor', "Storage"), timeout=1, block=True)
+    for device in devices:
+        ret = m.ask('/cmd', {'cmd': 'open', 'port': device.port, 'baudrate': args.baudrate or 115200, 'timeout': 0.05},
+                    actor_ref=source_ref, timeout=1, block=True)
+        if not ret or not ret[0][1]:
+            raise RuntimeError(f'open {device.port} failed')
+
+    start = time.monotonic()
+    for device in devices:
+        device.start()
+    deadline = start + args.timeout
+    for device in devices:
+        device.wait(max(deadline - time.monotonic(), 0))
+    written_time = time.monotonic() - start
+    expected = args.lines * args.ports
+    #等待流水线处理完
+    deadline = time.monotonic() + args.drain
+    while sink.lines < expected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    elapsed = time.monotonic() - start
+
+    stats = metrics.snapshot()
+    written = sum(d.written for d in devices)
+    captured = stats['topics'].get(source.data_output_topic(), {}).get('bytes', 0)
+    print(f'ports: {args.ports}, runtime: {args.runtime}, fusion: {args.fusion}')
+    print(f'written: {written} bytes in {written_time:.3f}s')
+    print(f'captured: {captured} bytes, {captured / elapsed / 1e6:.2f} MB/s, not captured (dropped or in flight): {written - captured}')
+    print(f'sink lines: {sink.lines}/{expected}, frames: {sink.frames}, elapsed: {elapsed:.3f}s')
+    latency = sink.latency.snapshot()
+    print(f'latency us: mean {latency["mean"]:.0f}, p50 <= {latency["p50"]}, p99 <= {latency["p99"]}, max {latency["max"]}')
+    if sink.dropped:
+        print(f'mailbox dropped frames: {sink.dropped}')
+    if args.verbose:
+        for actor, s in stats['actors'].items():
+            print(f'  {actor}: received {s["received"]}, receive us p99 <= {s["receive_us"]["p99"]}, inbox depth max {s["inbox_depth"]["max"]}')
+        ret = m.ask('/cmd', {'cmd': 'stats'}, actor_ref=plugin_manager.getActorRefByName('AnsiStyleActor', "Convert"), timeout=1, block=True)
+        if ret:
+            print(f'  AnsiStyleActor line cache: {ret[0][1]}')
+
+    if sink.lines < expected:
+        #流水线还有积压或者设备还没有写完, 不等待actor处理完
+        print('pipeline did not finish, exiting without draining')
+        sys.stdout.flush()
+        os._exit(1)
+    m.ask('/cmd', {'cmd': 'close'}, actor_ref=source_ref, timeout=1, block=True)
+    for device in devices:
+        device.close()
+    #按流水线的顺序停止, 下游最后停止
+    for name, category in [('SerialSourceActor', "Source"), ('LineSegmentActor', "Convert"), ('AnsiStyleActor', "Convert"),
+                           ('Ansi2HtmlConverter', "Convert"), ('FileStoreActor', "Storage")]:
+        plugin_manager.getActorRefByName(name, category).stop(block=True)
+    m.stop_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SevenSerial end-to-end benchmark with pty devices')
+    parser.add_argument('--ports', type=int, default=1, help='number of pty devices')
+    parser.add_argument('--lines', type=int, default=100000, help='lines per device')
+    parser.add_argument('--rate', type=float, default=0, help='lines per second per device, 0 = max')
+    parser.add_argument('--length', type=int, default=80, help='bytes per line')
+    parser.add_argument('--ansi', type=float, default=0.0, help='fraction of lines with ANSI colors')
+    parser.add_argument('--burst', type=int, default=0, help='binary burst size in bytes')
+    parser.add_argument('--burst-every', type=int, default=0, help='lines between binary bursts')
+    parser.add_argument('--pause', type=float, default=0.0, help='pause in seconds')
+    parser.add_argument('--pause-every', type=int, default=0, help='lines between pauses')
+    parser.add_argument('--baudrate', type=int, default=0, help='emulated baud rate, 0 = unlimited')
+    parser.add_argument('--runtime', choices=['thread', 'asyncio'], default='thread')
+    parser.add_argument('--fusion', action='store_true', help='enable stage fusion')
+    parser.add_argument('--sink', default='/Ansi2HtmlConverter/output', help='topic to measure latency on')
+    parser.add_argument('--record', default=None, help='also store the output with FileStoreActor')
+    parser.add_argument('--drain', type=float, default=10.0, help='seconds to wait for the pipeline after writing')
+    parser.add_argument('--timeout', type=float, default=60.0, help='max seconds for the devices to write all lines')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# Desc: asyncio runtime
+# 所有actor在同一个asyncio事件循环线程中执行, 代替每个actor一个线程
+# 在激活插件之前调用use_asyncio_runtime()选择
+import asyncio
+import logging
+import queue
+import sys
+import threading
+from core.plugintype import MyThreadActor, LoopActor
+
+logger = logging.getLogger('AsyncioRuntime')
+
+
+class _ActorDriver:
+    """
+    在事件循环中驱动一个actor:
+        inbox有新消息时调度drain, 处理完后根据_wait_timeout设置定时器
+        LoopActor如果提供poll_filenos, 用add_reader等待可读, 否则定时调用on_poll
+        poll_write_filenos中的fd用add_writer等待可写
+    """
+    #每次drain最多处理的消息数, 避免一个actor长时间占用事件循环
+    BUDGET = 64
+
+    def __init__(self, runtime, actor):
+        self.runtime = runtime
+        self.loop = runtime.loop
+        self.actor = actor
+        self.polling = isinstance(actor, LoopActor) and not actor.block
+        self.scheduled = False
+        self.timer = None
+        self.reader_fds = frozenset()
+        self.writer_fds = frozenset()
+
+    def start(self):
+        self.actor.actor_inbox.notify = self.wake
+        self.actor.actor_inbox.loop_thread = self.runtime.thread
+        self.actor._actor_loop_setup()
+        self.wake()
+
+    def wake(self):
+        if self.scheduled:
+            return
+        self.scheduled = True
+        self.runtime.call_soon(self.drain)
+
+    def drain(self):
+        self.scheduled = False
+        actor = self.actor
+        for _ in range(self.BUDGET):
+            if actor.actor_stopped.is_set():
+                break
+            try:
+                envelope = actor.actor_inbox.get_nowait()
+            except queue.Empty:
+                break
+            with actor._stage_lock:
+                actor._handle_envelope(envelope)
+                actor._after_receive()
+        else:
+            self.wake()
+        #on_cmd可能关闭后重新打开设备, 新fd可能和旧fd相同, 重新注册
+        self.reschedule(reregister=True)
+
+    def poll(self):
+        actor = self.actor
+        with actor._stage_lock:
+            actor._poll()
+            actor._after_receive()
+        self.reschedule()
+
+    def on_timer(self):
+        self.timer = None
+        actor = self.actor
+        if actor.actor_stopped.is_set():
+            self.reschedule()
+            return
+        with actor._stage_lock:
+            if self.polling and not self.reader_fds:
+                actor._poll()
+            actor._on_idle()
+        self.reschedule()
+
+    def _update_reader(self, reregister=False):
+        fds = frozenset()
+        if self.polling and not self.actor.actor_stopped.is_set():
+            try:
+                fds = frozenset(self.actor.poll_filenos())
+            except Exception:
+                fds = frozenset()
+        if reregister and self.reader_fds:
+            for fd in self.reader_fds:
+                self.loop.remove_reader(fd)
+            self.reader_fds = frozenset()
+        if fds == self.reader_fds:
+            return
+        for fd in self.reader_fds - fds:
+            self.loop.remove_reader(fd)
+        added = set()
+        try:
+            for fd in fds - self.reader_fds:
+                self.loop.add_reader(fd, self.poll)
+                added.add(fd)
+        except (NotImplementedError, ValueError, OSError):
+            #不支持等待该fd(如Windows), 退回定时poll
+            for fd in added | (fds & self.reader_fds):
+                self.loop.remove_reader(fd)
+            fds = frozenset()
+        self.reader_fds = fds
+
+    def _update_writer(self, reregister=False):
+        fds = frozenset()
+        if self.polling and not self.actor.actor_stopped.is_set():
+            try:
+                fds = frozenset(self.actor.poll_write_filenos())
+            except Exception:
+                fds = frozenset()
+        if reregister and self.writer_fds:
+            for fd in self.writer_fds:
+                self.loop.remove_writer(fd)
+            self.writer_fds = frozenset()
+        if fds == self.writer_fds:
+            return
+        for fd in self.writer_fds - fds:
+            self.loop.remove_writer(fd)
+        added = set(fds & self.writer_fds)
+        try:
+            for fd in fds - self.writer_fds:
+                self.loop.add_writer(fd, self.poll)
+                added.add(fd)
+        except (NotImplementedError, ValueError, OSError):
+            #不支持等待可写, 由定时poll发送
+            pass
+        self.writer_fds = frozenset(added)
+
+    def reschedule(self, reregister=False):
+        actor = self.actor
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if actor.actor_stopped.is_set():
+            self.teardown()
+            return
+        self._update_reader(reregister)
+        self._update_writer(reregister)
+        with actor._stage_lock:
+            timeout = actor._next_wait()
+        if self.polling and self.reader_fds:
+            #有数据时由reader回调poll, 只需要处理批处理超时
+            timeout = actor._flush_timeout()
+        if timeout is not None:
+            self.timer = self.loop.call_later(timeout, self.on_timer)
+
+    def teardown(self):
+        if self.actor not in self.runtime.drivers:
+            return
+        self.runtime.drivers.discard(self.actor)
+        self._update_reader()
+        self._update_writer()
+        self.actor.actor_inbox.notify = None
+        self.actor.actor_inbox.loop_thread = None
+        with self.actor._stage_lock:
+            self.actor.flush()
+        self.actor._actor_loop_teardown()
+
+
+class AsyncioRuntime:
+    """
+    在一个后台线程中运行asyncio事件循环, actor通过attach加入
+    """
+    def __init__(self):
+        if sys.platform == 'win32':
+            #add_reader只在SelectorEventLoop中可用
+            self.loop = asyncio.SelectorEventLoop()
+        else:
+            self.loop = asyncio.new_event_loop()
+        self.drivers = set()
+        self.thread = threading.Thread(target=self._run, name='AsyncioRuntime', daemon=True)
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        with self._lock:
+            if not self._started:
+                self._started = True
+                self.thread.start()
+
+    def call_soon(self, callback, *args):
+        if threading.current_thread() is self.thread:
+            self.loop.call_soon(callback, *args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def attach(self, actor):
+        """
+        在事件循环中启动actor, 代替actor._start_actor_loop()
+        """
+        self.start()
+        driver = _ActorDriver(self, actor)
+        self.drivers.add(actor)
+        self.call_soon(driver.start)
+        logger.debug('attach %s', actor)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def use_asyncio_runtime(runtime=None):
+    """
+    之后激活的actor都在同一个asyncio事件循环中运行
+    必须在激活插件之前调用
+    """
+    runtime = runtime or AsyncioRuntime()
+    MyThreadActor.runtime = runtime
+    return runtime
@@ -0,0 +1,423 @@
+# Desc: ANSI转义序列解析和转换为html
+# 样式为元组(前景色, 背景色, 属性), 颜色为None(默认), 0~255(256色)或'#rrggbb'(真彩色)
+# 解析一次得到StyledText(纯文本 + 每段的样式), 各个前端(html, Tk, Qt)只做渲染
+# html中16色和属性使用STYLESHEET中的css class, 其他颜色使用内联样式
+import re
+import sys
+from collections import OrderedDict
+from html import escape
+from typing import NamedTuple
+
+BOLD = 1
+ITALIC = 2
+UNDERLINE = 4
+DEFAULT = (None, None, 0)
+
+#CSI序列(ESC [ 参数 中间字节 结束字节), 其他两字节的ESC序列, 不完整的ESC
+_ESCAPE = re.compile(r'\x1b(?:\[([0-?]*)[ -/]*([@-~])|[@-Z\\-_]|)')
+
+#xterm的16色
+PALETTE = ('#000000', '#cd0000', '#00cd00', '#cdcd00', '#0000ee', '#cd00cd', '#00cdcd', '#e5e5e5',
+           '#7f7f7f', '#ff0000', '#00ff00', '#ffff00', '#5c5cff', '#ff00ff', '#00ffff', '#ffffff')
+
+STYLESHEET = ''.join(
+    [f'.a-f{i}{{color:{c}}}' for i, c in enumerate(PALETTE)]
+    + [f'.a-b{i}{{background-color:{c}}}' for i, c in enumerate(PALETTE)]
+    + ['.a-bold{font-weight:bold}', '.a-italic{font-style:italic}', '.a-underline{text-decoration:underline}']
+)
+#写在html文件开头
+STYLE_TAG = '<style>' + STYLESHEET + '</style>\n'
+
+#LineSegmentActor加在每行开头的时间戳: ESC[32m[时间戳 ESC[0m]
+_TS_HEAD = re.compile(r'\x1b\[32m(\[[^\x1b]*)\x1b\[0m\]')
+
+#缓存的最大数量, 超过时清空
+_CACHE_SIZE = 4096
+#(SGR参数, 样式) -> 新样式
+_sgr_cache = {}
+#样式 -> <span ...>
+_tag_cache = {}
+
+
+class StyleTable:
+    """
+    相同的样式共用一个元组对象, 所有线程共享
+    StyledText中直接保存样式元组而不是本进程内的编号, 可以pickle到其他进程(process执行模式)
+    同一批Frame中重复的样式pickle时只写一次, 前端按样式元组缓存渲染用的格式
+    """
+    def __init__(self):
+        self._styles = {DEFAULT: DEFAULT}
+
+    def intern(self, style):
+        #setdefault是原子的, 多个线程同时加入时得到同一个对象
+        return self._styles.setdefault(style, style)
+
+    def __len__(self):
+        return len(self._styles)
+
+
+STYLES = StyleTable()
+
+
+class StyledText(NamedTuple):
+    """
+    解析后的一行
+        text: 去掉转义序列的文本
+        runs: ((结束位置, 样式), ...), 相邻的段样式不同, 样式为(前景色, 背景色, 属性)
+    """
+    text: str
+    runs: tuple
+
+    def segments(self):
+        """
+        [(文本, 样式), ...]
+        """
+        text = self.text
+        start = 0
+        out = []
+        for end, style in self.runs:
+            out.append((text[start:end], style))
+            start = end
+        return out
+
+
+def color256(n):
+    """
+    256色的编号转为'#rrggbb'
+    """
+    if n < 16:
+        return PALETTE[n]
+    if n < 232:
+        n -= 16
+        r, g, b = n // 36, n // 6 % 6, n % 6
+        return '#%02x%02x%02x' % tuple(v * 40 + 55 if v else 0 for v in (r, g, b))
+    v = (n - 232) * 10 + 8
+    return '#%02x%02x%02x' % (v, v, v)
+
+
+def _extended_color(codes, i):
+    """
+    38;5;n 或 38;2;r;g;b, 返回(颜色, 最后一个参数的位置)
+    """
+    try:
+        if codes[i + 1] == '5':
+            return int(codes[i + 2]) & 0xff, i + 2
+        if codes[i + 1] == '2':
+            r, g, b = (int(c) & 0xff for c in codes[i + 2:i + 5])
+            return '#%02x%02x%02x' % (r, g, b), i + 4
+    except (IndexError, ValueError):
+        pass
+    return None, len(codes)
+
+
+def _apply_sgr(params, style):
+    fg, bg, flags = style
+    codes = params.split(';')
+    i = 0
+    while i < len(codes):
+        code = codes[i]
+        if not code:
+            c = 0
+        elif code.isdigit():
+            c = int(code)
+        else:
+            #不支持的格式(如冒号分隔的参数), 忽略
+            i += 1
+            continue
+        if c == 0:
+            fg, bg, flags = None, None, 0
+        elif c == 1:
+            flags |= BOLD
+        elif c == 3:
+            flags |= ITALIC
+        elif c == 4:
+            flags |= UNDERLINE
+        elif c == 22:
+            flags &= ~BOLD
+        elif c == 23:
+            flags &= ~ITALIC
+        elif c == 24:
+            flags &= ~UNDERLINE
+        elif 30 <= c <= 37:
+            fg = c - 30
+        elif 90 <= c <= 97:
+            fg = c - 82
+        elif c == 39:
+            fg = None
+        elif 40 <= c <= 47:
+            bg = c - 40
+        elif 100 <= c <= 107:
+            bg = c - 92
+        elif c == 49:
+            bg = None
+        elif c == 38:
+            fg, i = _extended_color(codes, i)
+        elif c == 48:
+            bg, i = _extended_color(codes, i)
+        i += 1
+    return (fg, bg, flags)
+
+
+def apply_sgr(params, style):
+    """
+    返回SGR参数(ESC [ params m)作用于style之后的样式
+    """
+    key = (params, style)
+    new = _sgr_cache.get(key)
+    if new is None:
+        if len(_sgr_cache) >= _CACHE_SIZE:
+            _sgr_cache.clear()
+        new = _sgr_cache[key] = _apply_sgr(params, style)
+    return new
+
+
+def parse(text, style=DEFAULT):
+    """
+    解析text中的转义序列, 返回([(文本, 样式), ...], 结束时的样式)
+    相邻的样式相同的文本合并为一段, 只处理SGR(颜色和属性), 其他转义序列丢弃
+    """
+    if '\x1b' not in text:
+        return ([(text, style)] if text else []), style
+    runs = []
+    pending = []
+    pos = 0
+    for m in _ESCAPE.finditer(text):
+        start = m.start()
+        if start > pos:
+            pending.append(text[pos:start])
+        pos = m.end()
+        if m.group(2) != 'm':
+            continue
+        new = apply_sgr(m.group(1), style)
+        if new != style:
+            if pending:
+                _append_run(runs, ''.join(pending), style)
+                pending = []
+            style = new
+    if pos < len(text):
+        pending.append(text[pos:])
+    if pending:
+        _append_run(runs, ''.join(pending), style)
+    return runs, style
+
+
+def strip(text):
+    """
+    去掉text中所有的转义序列, 返回纯文本
+    """
+    if '\x1b' not in text:
+        return text
+    return _ESCAPE.sub('', text)
+
+
+def _append_run(runs, text, style):
+    if runs and runs[-1][1] == style:
+        #样式变化后又变回来, 中间没有文本
+        runs[-1] = (runs[-1][0] + text, style)
+    else:
+        runs.append((text, style))
+
+
+def css_color(color):
+    """
+    颜色转为'#rrggbb', 默认颜色返回None
+    """
+    if color is None or isinstance(color, str):
+        return color
+    return color256(color)
+
+
+def _color_class(prefix, prop, color):
+    if isinstance(color, int) and color < 16:
+        return f'a-{prefix}{color}', None
+    return None, f'{prop}:{css_color(color)}'
+
+
+def span_tag(style):
+    """
+    样式对应的<span>开始标签
+    """
+    tag = _tag_cache.get(style)
+    if tag is None:
+        fg, bg, flags = style
+        classes = []
+        inline = []
+        for prefix, prop, color in (('f', 'color', fg), ('b', 'background-color', bg)):
+            if color is not None:
+                cls, css = _color_class(prefix, prop, color)
+                if cls:
+                    classes.append(cls)
+                else:
+                    inline.append(css)
+        if flags & BOLD:
+            classes.append('a-bold')
+        if flags & ITALIC:
+            classes.append('a-italic')
+        if flags & UNDERLINE:
+            classes.append('a-underline')
+        tag = '<span'
+        if classes:
+            tag += ' class="' + ' '.join(classes) + '"'
+        if inline:
+            tag += ' style="' + ';'.join(inline) + '"'
+        #同一个样式的标签在所有缓存的html中共享一个字符串
+        tag = sys.intern(tag + '>')
+        if len(_tag_cache) >= _CACHE_SIZE:
+            _tag_cache.clear()
+        _tag_cache[style] = tag
+    return tag
+
+
+def _html_body(text, style):
+    """
+    返回(<p>中的html, 结束时的样式)
+    """
+    if '\x1b' not in text:
+        body = escape(text, False)
+        if style != DEFAULT and body:
+            body = span_tag(style) + body + '</span>'
+        return body, style
+    runs, style = parse(text, style)
+    parts = []
+    for run, run_style in runs:
+        if run_style == DEFAULT:
+            parts.append(escape(run, False))
+        else:
+            parts += (span_tag(run_style), escape(run, False), '</span>')
+    return ''.join(parts), style
+
+
+def to_html(text, style=DEFAULT):
+    """
+    一行文本转为html段落, 返回(html, 结束时的样式)
+    没有转义序列的行直接转义输出, 默认样式的文本不加<span>
+    """
+    body, style = _html_body(text, style)
+    return '<p>' + body + '</p><br/>', style
+
+
+def to_styled(text, style=DEFAULT):
+    """
+    一行文本转为StyledText, 返回(StyledText, 结束时的样式)
+    """
+    if '\x1b' not in text:
+        return StyledText(text, ((len(text), STYLES.intern(style)),) if text else ()), style
+    runs, end_style = parse(text, style)
+    pos = 0
+    out = []
+    for run, run_style in runs:
+        pos += len(run)
+        out.append((pos, STYLES.intern(run_style)))
+    return StyledText(''.join([run for run, _ in runs]), tuple(out)), end_style
+
+
+def styled_to_html(styled):
+    """
+    StyledText转为html段落, 和to_html的输出相同
+    """
+    text = styled.text
+    tags = _tag_cache
+    parts = ['<p>']
+    start = 0
+    for end, style in styled.runs:
+        run = escape(text[start:end], False)
+        if style == DEFAULT:
+            parts.append(run)
+        else:
+            parts += (tags.get(style) or span_tag(style), run, '</span>')
+        start = end
+    parts.append('</p><br/>')
+    return ''.join(parts)
+
+
+class LineCache:
+    """
+    LRU缓存: (输入样式, 去掉时间戳的行) -> (转换结果, 输出样式)
+    嵌入式日志中重复的行很多(相同的前缀和颜色, 心跳), 命中时不需要再解析
+    时间戳以ESC[0m结束, 之后的样式总是默认样式, 所以有时间戳的行的key与输入样式无关
+    子类实现_convert(转换去掉时间戳的行)和_join(加上时间戳)
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def convert(self, text, style=DEFAULT):
+        """
+        返回(转换结果, 结束时的样式), 和不使用缓存时的结果相同
+        """
+        m = _TS_HEAD.match(text)
+        if m is None:
+            result, end_style = self._lookup(text, style)
+            return self._join(None, None, result), end_style
+        result, end_style = self._lookup(text[m.end():], DEFAULT)
+        return self._join(m.group(1), apply_sgr('32', style), result), end_style
+
+    def _lookup(self, text, style):
+        key = (style, text)
+        items = self._items
+        item = items.get(key)
+        if item is not None:
+            items.move_to_end(key)
+            self.hits += 1
+            return item
+        self.misses += 1
+        item = items[key] = self._convert(text, style)
+        if len(items) > self.maxsize:
+            items.popitem(last=False)
+        return item
+
+    def _convert(self, text, style):
+        raise NotImplementedError
+
+    def _join(self, head, head_style, result):
+        raise NotImplementedError
+
+    def clear(self):
+        self._items.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._items),
+                'hit_rate': self.hits / total if total else 0.0, 'styles': len(STYLES)}
+
+
+class StyledCache(LineCache):
+    """
+    缓存to_styled的结果
+    """
+    def _convert(self, text, style):
+        return to_styled(text, style)
+
+    def _join(self, head, head_style, styled):
+        if head is None:
+            return styled
+        #时间戳: '[时间戳 ' + 默认样式的']'
+        offset = len(head) + 1
+        head_run = (len(head), STYLES.intern(head_style))
+        body = styled.runs
+        if len(body) == 1 and body[0][1] == DEFAULT:
+            #最常见的情况: 时间戳之后没有颜色
+            runs = (head_run, (body[0][0] + offset, DEFAULT))
+        else:
+            runs = [head_run]
+            if not body or body[0][1] != DEFAULT:
+                runs.append((offset, DEFAULT))
+            runs += [(end + offset, style) for end, style in body]
+            runs = tuple(runs)
+        return StyledText(head + ']' + styled.text, runs)
+
+
+class HtmlCache(LineCache):
+    """
+    缓存to_html的结果
+    """
+    def _convert(self, text, style):
+        return _html_body(text, style)
+
+    def _join(self, head, head_style, body):
+        if head is None:
+            return '<p>' + body + '</p><br/>'
+        #默认样式的文本没有<span>, ']'和后面的文本直接相连
+        return '<p>' + span_tag(head_style) + escape(head, False) + '</span>]' + body + '</p><br/>'
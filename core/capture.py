@@ -0,0 +1,62 @@
+# Desc: 录制文件格式
+# 文件头: MAGIC
+# 之后每条记录: struct '<QI'(时间戳 epoch ns, 数据长度) + 数据
+# 没有文件头的文件当作原始bytes, 没有时间戳
+# CaptureStoreActor录制, ReplaySourceActor回放
+import struct
+from core.timestamp import TimestampFormatter
+
+MAGIC = b'SSCAP\x001\n'
+RECORD = struct.Struct('<QI')
+
+
+class CaptureWriter:
+    """
+    将Frame写入录制文件, 时间戳保存为epoch ns, 回放时可以还原显示时间
+    """
+    def __init__(self, filename):
+        self.f = open(filename, 'wb')
+        self.f.write(MAGIC)
+        self._clock = TimestampFormatter()
+
+    def write(self, ts, data):
+        """
+        写入一条记录, ts为Frame.ts(monotonic ns)
+        """
+        self.f.write(RECORD.pack(self._clock.to_epoch_ns(ts), len(data)))
+        self.f.write(data)
+
+    def write_frame(self, frame):
+        self.write(frame.ts, frame.data)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def is_capture(buf):
+    return buf[:len(MAGIC)] == MAGIC
+
+
+def iter_records(buf, offset=None):
+    """
+    从buf(bytes或mmap)的offset开始遍历记录, 返回(下一条记录的offset, epoch ns, 数据的开始, 数据的结束)
+    不复制数据, 文件末尾不完整的记录被忽略
+    """
+    offset = len(MAGIC) if offset is None else offset
+    end = len(buf)
+    header = RECORD.size
+    unpack_from = RECORD.unpack_from
+    while offset + header <= end:
+        ts, length = unpack_from(buf, offset)
+        start = offset + header
+        stop = start + length
+        if stop > end:
+            return
+        yield stop, ts, start, stop
+        offset = stop
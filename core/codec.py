@@ -0,0 +1,34 @@
+# Desc: 字节流解码
+import codecs
+
+
+class StreamDecoder:
+    """
+    按来源(Frame.source)增量解码字节流
+    多字节字符被拆分到两次读取中时, 前半部分会保留到下一次解码, 不会损坏
+    只有需要文本的actor才使用, source发布的是原始bytes
+    """
+    def __init__(self, encoding='utf-8', errors='ignore'):
+        self._factory = codecs.getincrementaldecoder(encoding)
+        self._errors = errors
+        self._decoders = {}
+
+    def decode(self, source, data, final=False):
+        """
+        解码data(bytes, bytearray, memoryview), 已经是str的数据直接返回
+        """
+        if isinstance(data, str):
+            return data
+        decoder = self._decoders.get(source)
+        if decoder is None:
+            decoder = self._decoders[source] = self._factory(self._errors)
+        return decoder.decode(data, final)
+
+    def reset(self, source=None):
+        """
+        丢弃未完成的字符, source为None时重置所有来源
+        """
+        if source is None:
+            self._decoders.clear()
+        else:
+            self._decoders.pop(source, None)
@@ -0,0 +1,78 @@
+# Desc: 按列保存的数值序列, 用于从日志中提取的遥测数据
+# 时间戳和数值分别保存在可增长的numpy数组中, 追加和按时间范围查询都不需要为每个值创建python对象
+import numpy as np
+
+
+class Column:
+    """
+    (时间戳, 数值)列
+        ts: Frame.ts(time.monotonic_ns()), int64
+        values: float64
+    容量不够时翻倍; 超过max_length时丢弃最早的一半
+    时间戳通常按顺序追加, 乱序时在查询前排序
+    """
+    def __init__(self, capacity=1024, max_length=1 << 24):
+        self.max_length = max_length
+        self._ts = np.empty(capacity, np.int64)
+        self._values = np.empty(capacity, np.float64)
+        self._size = 0
+        self._sorted = True
+        #被丢弃的值的数量
+        self.dropped = 0
+
+    def __len__(self):
+        return self._size
+
+    def extend(self, ts, values):
+        n = len(ts)
+        if not n:
+            return
+        size = self._size
+        if size + n > self.max_length:
+            #保留较新的一半
+            keep = min(size, max(self.max_length // 2 - n, 0))
+            self._compact(keep)
+            size = self._size
+            if n > self.max_length:
+                self.dropped += n - self.max_length
+                ts, values = ts[-self.max_length:], values[-self.max_length:]
+                n = self.max_length
+        end = size + n
+        if end > len(self._ts):
+            capacity = max(end, 2 * len(self._ts))
+            self._ts = np.resize(self._ts, capacity)
+            self._values = np.resize(self._values, capacity)
+        self._ts[size:end] = ts
+        self._values[size:end] = values
+        if self._sorted and ((size and ts[0] < self._ts[size - 1]) or (n > 1 and np.any(np.diff(ts) < 0))):
+            self._sorted = False
+        self._size = end
+
+    def _compact(self, keep):
+        size = self._size
+        self.dropped += size - keep
+        self._ts[:keep] = self._ts[size - keep:size]
+        self._values[:keep] = self._values[size - keep:size]
+        self._size = keep
+
+    def _sort(self):
+        size = self._size
+        order = np.argsort(self._ts[:size], kind='stable')
+        self._ts[:size] = self._ts[:size][order]
+        self._values[:size] = self._values[:size][order]
+        self._sorted = True
+
+    def query(self, start=None, end=None):
+        """
+        返回start <= ts <= end的(ts, values)数组的副本, None表示不限制
+        """
+        if not self._sorted:
+            self._sort()
+        ts = self._ts[:self._size]
+        lo = 0 if start is None else np.searchsorted(ts, start, 'left')
+        hi = len(ts) if end is None else np.searchsorted(ts, end, 'right')
+        return ts[lo:hi].copy(), self._values[lo:hi].copy()
+
+    def clear(self):
+        self._size = 0
+        self._sorted = True
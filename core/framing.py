@@ -0,0 +1,412 @@
+# Desc: 字节流分帧
+# 串口每次读到的数据块和协议的帧(行)没有对应关系, 分帧器按来源保存不完整的部分, 只输出完整的帧
+import binascii
+import time
+
+
+class _Tail:
+    __slots__ = ('data', 'ts', 'last')
+
+    def __init__(self, data, ts, last):
+        #不完整的数据
+        self.data = data
+        #第一个字节到达的时间
+        self.ts = ts
+        #最后一次收到数据的时间
+        self.last = last
+
+
+class _Framer:
+    """
+    按来源保存不完整的帧, 超过idle_timeout没有新数据时由expire输出
+    """
+    def __init__(self, idle_timeout):
+        self.idle_timeout = idle_timeout
+        self._tails = {}
+
+    def expire(self, now=None):
+        """
+        返回超过idle_timeout没有新数据的不完整帧: [(来源, 数据, 时间戳), ...]
+        """
+        if not self._tails:
+            return []
+        now = time.monotonic_ns() if now is None else now
+        deadline = now - int(self.idle_timeout * 1e9)
+        expired = [source for source, tail in self._tails.items() if tail.last <= deadline]
+        return [self._pop(source) for source in expired]
+
+    def next_timeout(self, now=None):
+        """
+        距离最早的不完整帧超时的时间(秒), 没有不完整的帧时返回None
+        """
+        if not self._tails:
+            return None
+        now = time.monotonic_ns() if now is None else now
+        last = min(tail.last for tail in self._tails.values())
+        return max(last / 1e9 + self.idle_timeout - now / 1e9, 0)
+
+    def flush(self):
+        """
+        输出所有不完整的帧
+        """
+        return [self._pop(source) for source in list(self._tails)]
+
+    def _pop(self, source):
+        tail = self._tails.pop(source)
+        return source, bytes(tail.data), tail.ts
+
+    def reset(self):
+        self._tails.clear()
+
+
+class LineSplitter(_Framer):
+    """
+    按来源把bytes切分为完整的行(保留行尾), 行尾为\\n, \\r\\n或\\r
+    不完整的行保存到下一次feed, 超过max_length或者idle_timeout没有新数据时作为一行输出
+    输出(行, 时间戳), 时间戳为该行第一个字节到达的时间
+        max_length: 行的最大字节数, 0表示不限制
+        idle_timeout: 不完整的行等待的最长时间(秒), 由调用者定期调用expire输出
+    """
+    def __init__(self, max_length=4096, idle_timeout=0.1):
+        super().__init__(idle_timeout)
+        self.max_length = max_length
+
+    def feed(self, source, data, ts):
+        """
+        输入一块数据, 返回[(行, 时间戳), ...]
+        """
+        tail = self._tails.pop(source, None)
+        first_ts = ts
+        if tail is not None:
+            data = tail.data + data
+            first_ts = tail.ts
+        #bytes.splitlines只识别\n, \r\n, \r, 在C中扫描
+        lines = data.splitlines(keepends=True)
+        if not lines:
+            return []
+        rest = None
+        if not lines[-1].endswith(b'\n'):
+            #最后一行不完整, 以\r结尾时可能是\r\n的前半部分
+            rest = lines.pop()
+        out = [(line, ts) for line in lines]
+        if out:
+            out[0] = (out[0][0], first_ts)
+        if rest:
+            rest_ts = ts if out else first_ts
+            max_length = self.max_length
+            if max_length:
+                while len(rest) >= max_length:
+                    out.append((rest[:max_length], rest_ts))
+                    rest = rest[max_length:]
+            if rest:
+                self._tails[source] = _Tail(rest, rest_ts, ts)
+        return out
+
+
+class IdleGapFramer(_Framer):
+    """
+    按字节之间的空闲时间分包, 用于二进制数据
+    使用source读取数据时的时间戳, 两次数据之间超过gap秒时开始新的一包
+    输出(包, 时间戳), 时间戳为该包第一块数据到达的时间
+        gap: 空闲时间(秒), None表示根据baudrate计算
+        max_length: 包的最大字节数, 0表示不限制
+    """
+    #USB串口的驱动通常每隔几毫秒才上报一次数据, gap不能小于该值
+    MIN_GAP = 0.02
+
+    def __init__(self, gap=None, baudrate=115200, max_length=1024):
+        super().__init__(gap or self.default_gap(baudrate))
+        self.max_length = max_length
+
+    @classmethod
+    def default_gap(cls, baudrate):
+        """
+        3.5个字符的时间(每个字符按11位计算), 不小于MIN_GAP
+        """
+        return max(3.5 * 11 / baudrate, cls.MIN_GAP) if baudrate else cls.MIN_GAP
+
+    def feed(self, source, data, ts):
+        """
+        输入一块数据, 返回已经结束的包[(包, 时间戳), ...]
+        """
+        out = []
+        tail = self._tails.get(source)
+        if tail is not None and ts - tail.last > self.idle_timeout * 1e9:
+            out.append(self._pop(source)[1:])
+            tail = None
+        if tail is None:
+            tail = self._tails[source] = _Tail(bytearray(data), ts, ts)
+        else:
+            tail.data += data
+            tail.last = ts
+        max_length = self.max_length
+        if max_length and len(tail.data) >= max_length:
+            buf = tail.data
+            start = 0
+            while len(buf) - start >= max_length:
+                out.append((bytes(buf[start:start + max_length]), tail.ts))
+                start += max_length
+            del buf[:start]
+            if not buf:
+                del self._tails[source]
+        return out
+
+
+#CRC算法: 名称 -> (字节数, 函数), 都由binascii在C中计算
+CRC = {
+    'crc16': (2, lambda data: binascii.crc_hqx(data, 0xFFFF)),
+    'crc32': (4, binascii.crc32),
+}
+
+
+class _PacketDecoder:
+    """
+    二进制协议解码器的基类, 增量输入数据, 输出(数据, CRC是否正确, 时间戳)
+    计数:
+        frames: 输出的帧数
+        errors: CRC错误或者格式错误的帧数
+        overruns: 超过max_length被丢弃的帧数
+        discarded: 不属于任何帧被丢弃的字节数
+    """
+    def __init__(self, crc=None, max_length=4096):
+        if crc is not None and crc not in CRC:
+            raise ValueError(f'unsupported crc: {crc}')
+        self.crc = crc
+        self.max_length = max_length
+        self.frames = 0
+        self.errors = 0
+        self.overruns = 0
+        self.discarded = 0
+        self._buf = bytearray()
+        self._start_ts = None
+
+    def feed(self, data, ts):
+        if not self._buf:
+            self._start_ts = ts
+        self._buf += data
+        out = []
+        self._decode(out)
+        if not out:
+            return out
+        #第一帧的时间戳为该帧开始的数据到达的时间
+        first_ts = self._start_ts
+        self._start_ts = ts
+        return [(payload, valid, first_ts if i == 0 else ts) for i, (payload, valid) in enumerate(out)]
+
+    def _decode(self, out):
+        raise NotImplementedError
+
+    def _check(self, payload):
+        """
+        检查并去掉payload末尾的CRC, 返回(数据, 是否正确)
+        """
+        if self.crc is None:
+            return payload, True
+        size, fn = CRC[self.crc]
+        if len(payload) < size:
+            return payload, False
+        body = payload[:-size]
+        return body, fn(body) == int.from_bytes(payload[-size:], 'little')
+
+    def _emit(self, out, payload, valid):
+        if valid:
+            self.frames += 1
+        else:
+            self.errors += 1
+        out.append((bytes(payload), valid))
+
+    def stats(self):
+        return {'frames': self.frames, 'errors': self.errors, 'overruns': self.overruns,
+                'discarded': self.discarded, 'buffered': len(self._buf)}
+
+
+class SlipDecoder(_PacketDecoder):
+    """
+    SLIP(RFC 1055): 以0xC0结束, 0xDB 0xDC表示0xC0, 0xDB 0xDD表示0xDB
+    crc不为None时帧的最后几个字节为CRC(小端)
+    """
+    END = b'\xc0'
+    ESC = b'\xdb'
+
+    def _decode(self, out):
+        buf = self._buf
+        if buf.find(self.END) < 0:
+            if len(buf) > 2 * self.max_length + 8:
+                #转义后最多是原来的两倍, 超过时丢弃直到下一个END
+                self.overruns += 1
+                self.discarded += len(buf)
+                buf.clear()
+            return
+        parts = buf.split(self.END)
+        #最后一部分还没有结束
+        self._buf = parts.pop()
+        for part in parts:
+            if not part:
+                #连续的END, 用于清除线路上的噪声
+                continue
+            raw = bytes(part)
+            if self.ESC in raw:
+                escapes = raw.count(self.ESC)
+                if escapes != raw.count(b'\xdb\xdc') + raw.count(b'\xdb\xdd'):
+                    #错误的转义
+                    self._emit(out, raw, False)
+                    continue
+                raw = raw.replace(b'\xdb\xdc', b'\xc0').replace(b'\xdb\xdd', b'\xdb')
+            if len(raw) > self.max_length:
+                self.overruns += 1
+                self.discarded += len(raw)
+                continue
+            payload, valid = self._check(raw)
+            self._emit(out, payload, valid)
+
+
+class CobsDecoder(_PacketDecoder):
+    """
+    COBS: 以0x00结束, 每个块的第一个字节为到下一个0的距离
+    按块解码, 每个块用一次切片复制
+    """
+    def _decode(self, out):
+        buf = self._buf
+        if buf.find(0) < 0:
+            if len(buf) > self.max_length + self.max_length // 254 + 2:
+                self.overruns += 1
+                self.discarded += len(buf)
+                buf.clear()
+            return
+        parts = buf.split(b'\x00')
+        self._buf = parts.pop()
+        for part in parts:
+            if not part:
+                continue
+            if len(part) > self.max_length + self.max_length // 254 + 1:
+                self.overruns += 1
+                self.discarded += len(part)
+                continue
+            raw, ok = self._unstuff(bytes(part))
+            if not ok:
+                self._emit(out, raw, False)
+                continue
+            payload, valid = self._check(raw)
+            self._emit(out, payload, valid)
+
+    @staticmethod
+    def _unstuff(raw):
+        blocks = []
+        n = len(raw)
+        i = 0
+        with memoryview(raw) as mv:
+            while i < n:
+                code = raw[i]
+                end = i + code
+                if end > n:
+                    #块的长度超过了帧
+                    return raw, False
+                blocks.append(mv[i + 1:end])
+                i = end
+                if code != 0xFF and i < n:
+                    blocks.append(b'\x00')
+            return b''.join(blocks), True
+
+
+class LengthPrefixDecoder(_PacketDecoder):
+    """
+    同步字节 + 长度 + 数据 + CRC
+        sync: 同步字节
+        length_size: 长度字段的字节数(1, 2, 4), 长度为数据的字节数
+        byteorder: 长度和CRC的字节序
+        crc: CRC算法, 范围为长度字段和数据
+    CRC错误时输出错误的帧并跳过整帧, 长度超过max_length时从下一个字节重新同步
+    """
+    #长度字段支持的字节数
+    LENGTH_SIZES = (1, 2, 4)
+
+    def __init__(self, sync=b'\xaa\x55', length_size=2, byteorder='little', crc='crc16', max_length=4096):
+        #参数错误时在创建时抛出ValueError, 不能等到解码时才出错
+        if length_size not in self.LENGTH_SIZES:
+            raise ValueError(f'unsupported length_size: {length_size}')
+        if byteorder not in ('little', 'big'):
+            raise ValueError(f'unsupported byteorder: {byteorder}')
+        super().__init__(crc, max_length)
+        self.sync = bytes(sync)
+        self.length_size = length_size
+        self.byteorder = byteorder
+        self._header = len(self.sync) + length_size
+        self._crc_size = CRC[crc][0] if crc else 0
+
+    def _check(self, payload):
+        if self.crc is None:
+            return payload, True
+        size, fn = CRC[self.crc]
+        body = payload[:-size]
+        return body, fn(body) == int.from_bytes(payload[-size:], self.byteorder)
+
+    def _frame(self, out, mv, start, end):
+        """
+        输出mv[start:end](长度字段 + 数据 + CRC), 切片在返回时释放, 之后才能修改buf
+        """
+        body, valid = self._check(mv[start:end])
+        #去掉长度字段
+        self._emit(out, body[self.length_size:], valid)
+
+    def _decode(self, out):
+        buf = self._buf
+        sync = self.sync
+        sync_len = len(sync)
+        header = self._header
+        pos = 0
+        with memoryview(buf) as mv:
+            while True:
+                idx = buf.find(sync, pos)
+                if idx < 0:
+                    #保留可能是同步字节前半部分的数据
+                    keep = max(len(buf) - (sync_len - 1), pos)
+                    self.discarded += keep - pos
+                    pos = keep
+                    break
+                self.discarded += idx - pos
+                if len(buf) - idx < header:
+                    pos = idx
+                    break
+                length = int.from_bytes(mv[idx + sync_len:idx + header], self.byteorder)
+                if length > self.max_length:
+                    #错误的同步或者长度, 从下一个字节重新同步
+                    self.overruns += 1
+                    self.discarded += 1
+                    pos = idx + 1
+                    continue
+                end = idx + header + length + self._crc_size
+                if len(buf) < end:
+                    pos = idx
+                    break
+                self._frame(out, mv, idx + sync_len, end)
+                pos = end
+        del buf[:pos]
+
+
+class PerSource:
+    """
+    每个来源一个解码器
+        factory: 解码器类, kwargs为创建参数
+    """
+    def __init__(self, factory, **kwargs):
+        self.factory = factory
+        self.kwargs = kwargs
+        self.decoders = {}
+        #检查参数
+        factory(**kwargs)
+
+    def feed(self, source, data, ts):
+        """
+        返回[(来源, 数据, CRC是否正确, 时间戳), ...]
+        """
+        decoder = self.decoders.get(source)
+        if decoder is None:
+            decoder = self.decoders[source] = self.factory(**self.kwargs)
+        return [(source, payload, valid, ts) for payload, valid, ts in decoder.feed(data, ts)]
+
+    def stats(self):
+        total = {}
+        for decoder in self.decoders.values():
+            for key, value in decoder.stats().items():
+                total[key] = total.get(key, 0) + value
+        return total
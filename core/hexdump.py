@@ -0,0 +1,144 @@
+# Desc: hex dump格式化, 和hexdump -C的格式相同
+# 每行: 偏移  16个字节的hex(8个一组)  |可打印字符|
+# 整块数据一次hexlify/translate, 再用numpy按列复制到所有行中, 没有逐字节或逐行的python循环
+import binascii
+import codecs
+import numpy as np
+
+#可打印的ASCII保持不变, 其他字节显示为'.'
+PRINTABLE = bytes(b if 0x20 <= b < 0x7f else 0x2e for b in range(256))
+
+
+class HexDumper:
+    """
+    width: 每行的字节数
+    group: 每组的字节数, 组之间多一个空格
+    """
+    #行数不超过这个值时逐行格式化, 否则按列拼接
+    small_rows = 4
+    #按列拼接时每次处理的行数, 限制临时数组的大小
+    block_rows = 4096
+
+    def __init__(self, width=16, group=8):
+        self.width = width
+        self.group = group
+        #hex部分的宽度(不含末尾空格)
+        self._hex_width = 3 * width - 1 + (width - 1) // group
+        #每个hex字符在行中的位置, 行: 8位偏移 + 2个空格 + hex + 2个空格 + |ascii| + \n
+        self._hex_pos = [10 + 3 * (i // 2) + i // 2 // group + i % 2 for i in range(2 * width)]
+        self._ascii_pos = 10 + self._hex_width + 3
+        self.row_len = self._ascii_pos + width + 2
+        self._template = np.frombuffer(b' ' * (self._ascii_pos - 1) + b'|' + b' ' * width + b'|\n', np.uint8)
+        #hexlify(data, b' ')每个字节3个字符, 每组在行中的位置: (行中的开始, hexlify中的开始, 结束, 定长类型)
+        self._groups = []
+        for start in range(0, width, group):
+            length = 3 * min(group, width - start) - 1
+            self._groups.append((10 + 3 * start + start // group, 3 * start, 3 * start + length, np.dtype(f'V{length}')))
+        self._ascii_type = np.dtype(f'V{width}')
+        #一块内各行偏移(width的整数倍)的8位hex
+        self._offset_table = self._offsets_hex(np.arange(0, self.block_rows * width, width, dtype=np.int64))
+
+    def dump(self, data, offset=0):
+        """
+        返回data的hex dump字符串, offset为第一个字节的偏移, 只显示低32位
+        """
+        width = self.width
+        full = len(data) // width
+        if full <= self.small_rows:
+            return ''.join(self._row(data[i:i + width], offset + i) for i in range(0, len(data), width))
+        end = full * width
+        first = offset // width
+        if offset % width == 0 and first + full <= self.block_rows:
+            #偏移可以查表
+            text = self._rows(data[:end], np.arange(first, first + full), True)
+        else:
+            text = self._format(data[:end], np.arange(offset, offset + end, width, dtype=np.int64))
+        if end < len(data):
+            text += self._row(data[end:], offset + end)
+        return text
+
+    def _row(self, chunk, offset):
+        group = self.group
+        hex_text = '  '.join(chunk[i:i + group].hex(' ') for i in range(0, len(chunk), group))
+        return f'{offset & 0xffffffff:08x}  {hex_text:<{self._hex_width}}  |{chunk.translate(PRINTABLE).decode("ascii")}|\n'
+
+    def dump_many(self, packets):
+        """
+        格式化多个包, 每个包的偏移从0开始, 返回每个包的hex dump字符串
+        所有包的行拼在一起按列格式化, 小包也不需要逐行格式化
+        """
+        width = self.width
+        counts = np.fromiter(((len(packet) + width - 1) // width for packet in packets), np.int64, len(packets))
+        total = int(counts.sum())
+        if total <= self.small_rows:
+            return [self.dump(packet) for packet in packets]
+        #不完整的最后一行用0补齐, 格式化后再截断
+        data = b''.join([packet + bytes(-len(packet) % width) for packet in packets])
+        #每行在所属包中的偏移
+        starts = np.cumsum(counts) - counts
+        rows = np.arange(total, dtype=np.int64) - np.repeat(starts, counts)
+        if counts.max() <= self.block_rows:
+            text = self._format(data, rows, True)
+        else:
+            text = self._format(data, rows * width)
+        row_len = self.row_len
+        ret = []
+        pos = 0
+        for packet, n in zip(packets, counts.tolist()):
+            end = pos + n * row_len
+            tail = len(packet) % width
+            if tail:
+                ret.append(text[pos:end - row_len] + self._truncate(text[end - row_len:end], tail))
+            else:
+                ret.append(text[pos:end])
+            pos = end
+        return ret
+
+    def _truncate(self, row, n):
+        """
+        只保留整行格式化的row中的前n个字节, 和_row的输出相同
+        """
+        cut = self._hex_pos[2 * n - 1] + 1
+        pos = self._ascii_pos
+        return row[:cut] + ' ' * (pos - 1 - cut) + '|' + row[pos:pos + n] + '|\n'
+
+    def _format(self, data, offsets, indexed=False):
+        """
+        data的长度为width的整数倍, offsets为每行的偏移, indexed为True时为每行偏移除以width(查表)
+        """
+        rows = self.block_rows
+        step = self.width * rows
+        return ''.join([self._rows(data[i * step:(i + 1) * step], offsets[i * rows:(i + 1) * rows], indexed)
+                        for i in range((len(data) + step - 1) // step)])
+
+    def _offsets_hex(self, offsets):
+        return np.frombuffer(binascii.hexlify((offsets & 0xffffffff).astype('>u4').tobytes()), 'V8')
+
+    def _rows(self, data, offsets, indexed=False):
+        width = self.width
+        rows = len(data) // width
+        out = np.empty((rows, self.row_len), np.uint8)
+        out[:] = self._template
+        #每列按定长的void类型复制, 每行一次memcpy
+        _put(out, 0, self._offset_table[offsets] if indexed else self._offsets_hex(offsets))
+        #hex, 每个字节两个字符和一个空格, 末尾补一个空格后每行3*width个字符
+        digits = np.frombuffer(binascii.hexlify(data, b' ') + b' ', np.uint8).reshape(rows, 3 * width)
+        for pos, start, end, dtype in self._groups:
+            _put(out, pos, digits[:, start:end].view(dtype)[:, 0])
+        #ascii
+        _put(out, self._ascii_pos, np.frombuffer(data.translate(PRINTABLE), self._ascii_type))
+        return codecs.ascii_decode(out)[0]
+
+
+def _put(out, pos, column):
+    """
+    将column(每行一个定长的void)复制到out每行的pos处
+    """
+    out[:, pos:pos + column.itemsize].view(column.dtype)[:, 0] = column
+
+
+def hexdump(data, offset=0):
+    return _default.dump(data, offset)
+
+
+_default = HexDumper()
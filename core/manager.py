@@ -1,7 +1,60 @@
 from collections import defaultdict
 from pykka import ActorRegistry, ActorRef
 import logging
+import threading
 from yapsy.ConfigurablePluginManager import ConfigurablePluginManager
+from core.message import Batch, Frame, Routed
+
+class _PrefixTrie:
+    """
+    通配符订阅的前缀树, 按字符存储前缀
+    """
+    __slots__ = ('children', 'count')
+
+    def __init__(self):
+        self.children = {}
+        #以该节点结尾的前缀个数
+        self.count = 0
+
+    def insert(self, prefix):
+        node = self
+        for c in prefix:
+            node = node.children.setdefault(c, _PrefixTrie())
+        node.count += 1
+
+    def remove(self, prefix):
+        path = []
+        node = self
+        for c in prefix:
+            path.append((node, c))
+            node = node.children.get(c)
+            if node is None:
+                return
+        if node.count == 0:
+            return
+        node.count -= 1
+        #删除不再使用的节点
+        for parent, c in reversed(path):
+            child = parent.children[c]
+            if child.count or child.children:
+                break
+            del parent.children[c]
+
+    def prefixes_of(self, topic):
+        """
+        返回所有是topic前缀的已注册前缀
+        """
+        ret = []
+        node = self
+        if node.count:
+            ret.append('')
+        for i, c in enumerate(topic):
+            node = node.children.get(c)
+            if node is None:
+                break
+            if node.count:
+                ret.append(topic[:i + 1])
+        return ret
 
 class TopicManager:
 
@@ -15,13 +68,60 @@ class TopicManager:
         self.subscribers = defaultdict(set)
         self.connections = defaultdict(set)
         self.logger = logging.getLogger('TopicManager')
+        #通配符订阅(以*结尾)的前缀树
+        self._wildcards = _PrefixTrie()
+        #路由表缓存: topic -> ((目标topic, (subscriber, ...)), ...)
+        #只在subscribe/unsubscribe/connect时失效
+        self._routes = {}
+        #流水线融合: 可以在上游线程中直接调用的actor, 见fused_stage
+        self.fusion = False
+        self._stages = {}
+        self._fused = {}
+        self._lock = threading.RLock()
+        #统计信息, 见core.metrics.MetricsRegistry, None表示不统计
+        self.metrics = None
 
     def subscribe(self, topic, subscriber):
-        self.subscribers[topic].add(subscriber)
+        with self._lock:
+            #前缀树中每个通配符topic只计数一次, 最后一个订阅者取消时删除
+            if topic.endswith('*') and topic not in self.subscribers:
+                self._wildcards.insert(topic[:-1])
+            self.subscribers[topic].add(subscriber)
+            self._invalidate()
 
     def unsubscribe(self, topic, subscriber):
-        self.subscribers[topic].discard(subscriber)
+        with self._lock:
+            subscribers = self.subscribers.get(topic)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[topic]
+                if topic.endswith('*'):
+                    self._wildcards.remove(topic[:-1])
+            self._invalidate()
     
+    def _invalidate(self):
+        self._routes = {}
+        self._fused = {}
+
+    def register_stage(self, stage):
+        """
+        注册可以融合的actor(ConvertActor, StorageActor)
+        """
+        with self._lock:
+            self._stages[stage.actor_ref] = stage
+            self._invalidate()
+
+    def enable_fusion(self, enable=True):
+        """
+        开启流水线融合:
+        单生产者/单消费者的topic, 数据在发布者的线程中直接交给下游actor处理, 不经过inbox
+        """
+        with self._lock:
+            self.fusion = enable
+            self._invalidate()
+
     def stop_all(self):
         ActorRegistry.stop_all(block=False)
 
@@ -54,46 +154,153 @@ class TopicManager:
         else:
             raise TypeError('input must be MyThreadActor or str or list')
         
-        self.connections[output_topic].update(input_topic)
+        with self._lock:
+            self.connections[output_topic].update(input_topic)
+            self._invalidate()
+
+    def _subscribers_of(self, topic):
+        """
+        topic的所有订阅者: 直接订阅者在前, 通配符订阅者在后
+        """
+        ret = list(self.subscribers.get(topic, ()))
+        for prefix in self._wildcards.prefixes_of(topic):
+            ret.extend(self.subscribers.get(prefix + '*', ()))
+        return tuple(ret)
+
+    def route(self, topic):
+        """
+        返回topic的路由表: ((目标topic, (subscriber, ...)), ...)
+        第一项为topic本身, 之后为connect到的input topic
+        """
+        routes = self._routes
+        route = routes.get(topic)
+        if route is not None:
+            return route
+        with self._lock:
+            route = [(topic, self._subscribers_of(topic))]
+            for input_topic in self.connections.get(topic, ()):
+                route.append((input_topic, self._subscribers_of(input_topic)))
+            route = tuple(route)
+            self._routes[topic] = route
+        return route
 
+    def fused_stage(self, topic):
+        """
+        如果topic可以融合, 返回(下游actor, 下游input topic), 否则返回None
+        条件: topic没有直接订阅者, 只connect到一个input topic,
+        该input topic只有一个订阅者且是已注册的stage, 并且没有其他topic connect到该input topic
+        """
+        fused = self._fused
+        if topic in fused:
+            return fused[topic]
+        with self._lock:
+            ret = None
+            route = self.route(topic)
+            if len(route) == 2 and not route[0][1] and len(route[1][1]) == 1:
+                input_topic, (subscriber,) = route[1]
+                stage = self._stages.get(subscriber)
+                producers = sum(1 for dests in self.connections.values() if input_topic in dests)
+                if stage is not None and producers == 1:
+                    ret = (stage, input_topic)
+            self._fused[topic] = ret
+        return ret
+
+    def _run_fused(self, topic, message_factory, payload):
+        """
+        如果topic可以融合, 在当前线程中交给下游actor处理, 返回True
+        """
+        fused = self.fused_stage(topic)
+        if fused is None:
+            return False
+        stage, input_topic = fused
+        if not stage.is_activated or stage.actor_stopped.is_set():
+            return False
+        stage.receive_inline(message_factory(input_topic, payload))
+        return True
 
     def tell(self, topic, message=None, actor_ref=None):
         #发送消息，不等待返回值
-        #如果message字典中不包含topic, 则添加topic
-        self.logger.debug(f'topic: {topic}, message: {message}, actor_ref: {actor_ref}')
+        #Frame会被包装为Routed, 多个订阅者共享同一个Frame
+        #字典消息如果不包含topic, 则添加topic, 转发到connect的topic时使用副本
+        if isinstance(message, Frame):
+            self._tell_frame(topic, message, actor_ref)
+            return
         if not message:
             message = {}
         if 'topic' not in message:
             message['topic'] = topic
-        
-        self._tell(topic, message, actor_ref)
 
-        if topic in self.connections:
-            for input_topic in self.connections[topic]:
-                #修改message中的topic
-                message['topic'] = input_topic
-                self._tell(input_topic, message, actor_ref)
+        if actor_ref:
+            self._tell(topic, message, actor_ref)
+            for input_topic in self.connections.get(topic, ()):
+                self._tell(input_topic, dict(message, topic=input_topic), actor_ref)
+            return
+
+        first = True
+        for dest_topic, subscribers in self.route(topic):
+            if not subscribers:
+                first = False
+                continue
+            msg = message if first else dict(message, topic=dest_topic)
+            first = False
+            for subscriber in subscribers:
+                subscriber.tell(msg)
 
-    def _tell(self, topic, message=None, actor_ref=None):
-        # 检查actor_ref是否为ActorRef对象,或者list
+    def _tell_frame(self, topic, frame, actor_ref=None):
         if actor_ref:
-            if isinstance(actor_ref, list):
-                for subscriber in actor_ref:
-                    #如果actor_ref订阅了该消息，则发送
-                    if self.subscribers[topic].__contains__(subscriber):
-                        subscriber.tell(message)
-            elif isinstance(actor_ref, ActorRef):
-                if self.subscribers[topic].__contains__(actor_ref):
-                    actor_ref.tell(message)
+            self._tell(topic, Routed(topic, frame), actor_ref)
+            for input_topic in self.connections.get(topic, ()):
+                self._tell(input_topic, Routed(input_topic, frame), actor_ref)
             return
-        for subscriber in self.subscribers[topic]:
-            subscriber.tell(message)
 
-        # Handle wildcard subscriptions
-        for subscribed_topic in self.subscribers:
-            if subscribed_topic.endswith('*') and topic.startswith(subscribed_topic[:-1]):
-                for subscriber in self.subscribers[subscribed_topic]:
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.on_publish(topic, (frame,))
+        if self.fusion and self._run_fused(topic, Routed, frame):
+            return
+        for dest_topic, subscribers in self.route(topic):
+            if not subscribers:
+                continue
+            msg = Routed(dest_topic, frame)
+            for subscriber in subscribers:
+                subscriber.tell(msg)
+
+    def tell_batch(self, topic, items, actor_ref=None):
+        """
+        发送一批消息, 每个订阅者只收到一个Batch
+        items中的消息不会被修改, 接收方根据Batch.topic区分来源
+        """
+        if not items:
+            return
+        if actor_ref:
+            self._tell(topic, Batch(topic, items), actor_ref)
+            for input_topic in self.connections.get(topic, ()):
+                self._tell(input_topic, Batch(input_topic, items), actor_ref)
+            return
+
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.on_publish(topic, items)
+        if self.fusion and self._run_fused(topic, Batch, items):
+            return
+        for dest_topic, subscribers in self.route(topic):
+            if not subscribers:
+                continue
+            batch = Batch(dest_topic, items)
+            for subscriber in subscribers:
+                subscriber.tell(batch)
+
+    def _tell(self, topic, message=None, actor_ref=None):
+        # 检查actor_ref是否为ActorRef对象,或者list
+        subscribers = self.subscribers.get(topic, ())
+        if isinstance(actor_ref, list):
+            for subscriber in actor_ref:
+                #如果actor_ref订阅了该消息，则发送
+                if subscriber in subscribers:
                     subscriber.tell(message)
+        elif isinstance(actor_ref, ActorRef):
+            if actor_ref in subscribers:
+                actor_ref.tell(message)
     
     def ask(self, topic, message, timeout=2, block=True, actor_ref=None):
         #发送消息，等待返回值
@@ -108,17 +315,59 @@ class TopicManager:
             if isinstance(actor_ref, list):
                 for subscriber in actor_ref:
                     #如果actor_ref订阅了该消息，则发送
-                    if self.subscribers[topic].__contains__(subscriber):
+                    if subscriber in self.subscribers.get(topic, ()):
                         ret.append((subscriber,subscriber.ask(message, timeout=timeout, block=block)))
             elif isinstance(actor_ref, ActorRef):
-                if self.subscribers[topic].__contains__(actor_ref):
+                if actor_ref in self.subscribers.get(topic, ()):
                     ret.append((actor_ref, actor_ref.ask(message, timeout=timeout, block=block)))
             return ret
-        for subscriber in self.subscribers[topic]:
+        for subscriber in self.subscribers.get(topic, ()):
             ret.append((subscriber,subscriber.ask(message, timeout=timeout, block=block)))
         return ret
 
 class MyConfigurablePluginManager(ConfigurablePluginManager):
+    def loadPlugins(self, callback=None, callback_after=None):
+        def _after(plugin_info):
+            self._configurePlugin(plugin_info)
+            if callback_after is not None:
+                callback_after(plugin_info)
+        super().loadPlugins(callback, _after)
+
+    def _configurePlugin(self, plugin_info):
+        """
+        根据插件ini文件中的配置设置actor
+            [Batch]
+            size = 输出批处理的最大条数
+            latency = 输出批处理的最大等待时间(秒)
+            [Mailbox]
+            maxsize = inbox中数据消息的上限, 0表示不限制
+            policy = block, drop_oldest, drop_newest, coalesce
+            [Execution]
+            mode = thread, process (只支持ConvertActor)
+            workers = 子进程个数
+        """
+        details = plugin_info.details
+        plugin = plugin_info.plugin_object
+        if plugin is None:
+            return
+        if details.has_section('Batch'):
+            plugin.set_batch(
+                details.getint('Batch', 'size', fallback=1),
+                details.getfloat('Batch', 'latency', fallback=None),
+            )
+        if details.has_section('Mailbox'):
+            plugin.set_inbox_limit(
+                details.getint('Mailbox', 'maxsize', fallback=0),
+                details.get('Mailbox', 'policy', fallback=None),
+            )
+        if details.has_section('Execution'):
+            mode = details.get('Execution', 'mode', fallback='thread')
+            if hasattr(plugin, 'set_execution'):
+                plugin.set_execution(mode, details.getint('Execution', 'workers', fallback=1))
+            elif mode != 'thread':
+                logging.getLogger('PluginManager').warning(
+                    '%s does not support execution mode %s', plugin_info.name, mode)
+
     def getPluginByName(self, name, category='Default'):
         """
         Get a plugin by its name and category
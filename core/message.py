@@ -0,0 +1,79 @@
+# Desc: 在actor之间传递的消息类型
+import time
+from typing import Any, NamedTuple, Optional
+
+
+class Frame(NamedTuple):
+    """
+    一帧数据, 不可修改, 可以被多个actor同时共享
+        data: 数据内容
+        source: 数据来源, 如串口名
+        ts: 时间戳, time.monotonic_ns()整数, 显示时用core.timestamp.format_ts格式化
+        mode: 模式, 见core.topics
+            'text': 文本(source发布的原始bytes或分好的行), 'hex': hex模式的文本
+            'styled': data为core.ansi.StyledText
+            'packet', 'bad_packet': 按协议分包的一帧bytes, CRC正确/错误
+    """
+    data: Any
+    source: Optional[str] = None
+    ts: int = 0
+    mode: str = 'text'
+
+    @classmethod
+    def now(cls, data, source=None, mode='text'):
+        """
+        以当前时间创建Frame
+        """
+        return cls(data, source, time.monotonic_ns(), mode)
+
+    def derive(self, data, mode=None):
+        """
+        创建一个来源和时间戳都相同的新Frame
+        """
+        return Frame(data, self.source, self.ts, mode or self.mode)
+
+
+class Routed:
+    """
+    投递给订阅者的单帧消息, 路由信息不放在Frame中
+        topic: 目标topic
+        frame: Frame
+    """
+    __slots__ = ('topic', 'frame')
+
+    def __init__(self, topic, frame):
+        self.topic = topic
+        self.frame = frame
+
+    def __repr__(self):
+        return f'Routed(topic={self.topic!r}, frame={self.frame!r})'
+
+
+class Batch:
+    """
+    一批数据消息, 作为一个mailbox消息投递, 减少队列的put/get和线程唤醒
+        topic: 目标topic
+        items: Frame列表, 接收方不能修改
+    """
+    __slots__ = ('topic', 'items')
+
+    def __init__(self, topic, items):
+        self.topic = topic
+        self.items = items
+
+    def __len__(self):
+        return len(self.items)
+
+    def __repr__(self):
+        return f'Batch(topic={self.topic!r}, items={len(self.items)})'
+
+
+def unpack(message):
+    """
+    将Routed/Batch消息拆分为(topic, frames), 其他消息返回(None, ())
+    """
+    if isinstance(message, Routed):
+        return message.topic, (message.frame,)
+    if isinstance(message, Batch):
+        return message.topic, message.items
+    return None, ()
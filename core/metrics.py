@@ -0,0 +1,229 @@
+# Desc: 运行时统计信息
+# 每个topic的消息数/字节数, 每个actor的inbox深度和on_receive耗时
+# 默认关闭, 关闭时TopicManager和actor只多一次属性判断
+import threading
+import time
+from collections import defaultdict
+from core.manager import TopicManager
+from core.plugintype import MyThreadActor
+from core.topics import TOPIC_STATS, TOPIC_STATS_METRICS
+
+
+class Histogram:
+    """
+    按2的幂分桶的直方图, 第i个桶统计[2^(i-1), 2^i)范围内的值, 第0个桶统计0
+    """
+    __slots__ = ('buckets', 'count', 'total', 'max')
+    BUCKETS = 32
+
+    def __init__(self):
+        self.buckets = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        value = int(value)
+        self.buckets[min(value.bit_length(), self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """
+        返回p分位所在桶的上限
+        """
+        if not self.count:
+            return 0
+        target = self.count * p
+        n = 0
+        for i, c in enumerate(self.buckets):
+            n += c
+            if n >= target:
+                return min((1 << i) - 1, self.max) if i else 0
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p99': self.percentile(0.99),
+            'buckets': list(self.buckets),
+        }
+
+
+class _TopicStats:
+    __slots__ = ('messages', 'bytes', 'last_messages', 'last_bytes')
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.last_messages = 0
+        self.last_bytes = 0
+
+
+class _ActorStats:
+    __slots__ = ('received', 'depth', 'duration', 'dropped')
+
+    def __init__(self):
+        self.received = 0
+        #inbox深度
+        self.depth = Histogram()
+        #on_receive耗时, 单位us
+        self.duration = Histogram()
+        self.dropped = 0
+
+
+def _size(data):
+    try:
+        return len(data)
+    except TypeError:
+        return 0
+
+
+class MetricsRegistry:
+    """
+    统计信息注册表
+        enable(): 开始统计, TopicManager和actor会调用on_publish/on_receive
+        snapshot(): 返回统计结果, 速率为距离上一次snapshot的平均值
+    """
+
+    @staticmethod
+    def singleton():
+        if not hasattr(MetricsRegistry, '_instance'):
+            MetricsRegistry._instance = MetricsRegistry()
+        return MetricsRegistry._instance
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.topics = defaultdict(_TopicStats)
+            self.actors = defaultdict(_ActorStats)
+            self._started = time.monotonic()
+            self._last_snapshot = self._started
+
+    def enable(self, topic_manager=None):
+        topic_manager = topic_manager or TopicManager.singleton()
+        topic_manager.metrics = self
+
+    def disable(self, topic_manager=None):
+        topic_manager = topic_manager or TopicManager.singleton()
+        topic_manager.metrics = None
+
+    def on_publish(self, topic, frames):
+        size = 0
+        for frame in frames:
+            size += _size(frame.data)
+        with self._lock:
+            stats = self.topics[topic]
+            stats.messages += len(frames)
+            stats.bytes += size
+
+    def on_receive(self, actor, depth, duration_ns, dropped=0):
+        with self._lock:
+            stats = self.actors[actor]
+            stats.received += 1
+            stats.depth.add(depth)
+            stats.duration.add(duration_ns // 1000)
+            stats.dropped = dropped
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            interval = max(now - self._last_snapshot, 1e-9)
+            self._last_snapshot = now
+            topics = {}
+            for topic, stats in self.topics.items():
+                topics[topic] = {
+                    'messages': stats.messages,
+                    'bytes': stats.bytes,
+                    'messages_per_s': (stats.messages - stats.last_messages) / interval,
+                    'bytes_per_s': (stats.bytes - stats.last_bytes) / interval,
+                }
+                stats.last_messages = stats.messages
+                stats.last_bytes = stats.bytes
+            actors = {}
+            for actor, stats in self.actors.items():
+                actors[actor] = {
+                    'received': stats.received,
+                    'dropped': stats.dropped,
+                    'inbox_depth': stats.depth.snapshot(),
+                    'receive_us': stats.duration.snapshot(),
+                }
+        return {
+            'uptime': now - self._started,
+            'interval': interval,
+            'topics': topics,
+            'actors': actors,
+        }
+
+
+class StatsActor(MyThreadActor):
+    """
+    响应TOPIC_STATS上的请求:
+        {'cmd': 'get'}: 返回MetricsRegistry.snapshot()
+        {'cmd': 'reset'}: 清空统计
+        {'cmd': 'set_interval', 'interval': 秒}: 定期在TOPIC_STATS_METRICS上发布, 0表示不发布
+    """
+    def __init__(self, interval=0, registry=None):
+        super().__init__()
+        self.registry = registry or MetricsRegistry.singleton()
+        self.interval = interval
+        self._next_publish = None
+        self.add_sub_topic(TOPIC_STATS)
+
+    def on_start(self):
+        self._schedule()
+
+    def _schedule(self):
+        self._next_publish = time.monotonic() + self.interval if self.interval else None
+
+    def publish(self):
+        self.topic_manager.tell(TOPIC_STATS_METRICS, {'stats': self.registry.snapshot()})
+
+    def on_cmd(self, msg):
+        pass
+
+    def on_receive(self, message):
+        if isinstance(message, dict) and message.get('topic') == TOPIC_STATS:
+            cmd = message.get('cmd', 'get')
+            if cmd == 'get':
+                return self.registry.snapshot()
+            elif cmd == 'reset':
+                self.registry.reset()
+            elif cmd == 'set_interval':
+                self.interval = message.get('interval', 0)
+                self._schedule()
+            return None
+        return super().on_receive(message)
+
+    def _wait_timeout(self):
+        timeout = super()._wait_timeout()
+        if self._next_publish is not None:
+            remain = max(self._next_publish - time.monotonic(), 0)
+            if timeout is None or remain < timeout:
+                timeout = remain
+        return timeout
+
+    def _on_idle(self):
+        super()._on_idle()
+        if self._next_publish is not None and time.monotonic() >= self._next_publish:
+            self.publish()
+            self._schedule()
+
+
+def enable_metrics(interval=0):
+    """
+    开始统计, 并启动StatsActor
+        interval: 定期发布统计信息的间隔(秒), 0表示只响应ask
+    """
+    MetricsRegistry.singleton().enable()
+    actor = StatsActor(interval)
+    actor.activate()
+    return actor
@@ -1,10 +1,18 @@
 from typing import Any
 import serial
-from pykka import ThreadingActor, Actor, ActorRegistry
+from pykka import ThreadingActor, Actor, ActorRegistry, ActorDeadError
 import logging
 import sys
+import os
 import queue
+import selectors
+import threading
+from collections import deque, namedtuple
 from core.manager import TopicManager
+from core.framing import PerSource
+from core.message import Batch, Frame, Routed, unpack
+from core.procpool import StagePool
+from core.topics import TOPIC_STATS_MAILBOX
 from datetime import datetime
 import time
 from stransi import Ansi, SetColor, SetAttribute
@@ -13,10 +21,174 @@ import time
 
 pykka_logger = logging.getLogger("pykka")
 
+#融合执行时代替pykka的Envelope
+_InlineEnvelope = namedtuple('_InlineEnvelope', ['message', 'reply_to'])
+#唤醒actor线程重新计算等待时间的消息, 不交给on_receive处理
+_TICK = object()
+
+
+class BoundedInbox(queue.Queue):
+    """
+    有上限的actor inbox
+    只有数据消息(Routed, Batch)计入上限, 命令、ask和停止消息总是可以放入
+    超过上限时的处理策略:
+        block: 阻塞发送方, 直到有空位
+        drop_oldest: 丢弃最早的数据消息
+        drop_newest: 丢弃新的数据消息
+        coalesce: 合并到队列中最后一个相同topic的数据消息中,
+            合并后的消息最多保留maxsize个Frame, 超过时丢弃最早的Frame
+    """
+    POLICIES = ('block', 'drop_oldest', 'drop_newest', 'coalesce')
+
+    def __init__(self, maxsize=0, policy='block'):
+        super().__init__()
+        if policy not in self.POLICIES:
+            raise ValueError(f'unknown inbox policy: {policy}')
+        self.limit = maxsize
+        self.policy = policy
+        #队列中数据消息的个数
+        self.data_count = 0
+        #丢弃的Frame个数
+        self.dropped = 0
+        #actor停止后, 不再阻塞发送方
+        self.stopped = None
+        #放入消息后的回调, asyncio runtime用来唤醒actor
+        self.notify = None
+        #block策略下, 如果发送方就在该线程中, 不能阻塞
+        self.loop_thread = None
+        #合并过的消息: id(envelope) -> deque, 取出时转换为列表
+        self._coalesced = {}
+
+    @staticmethod
+    def _is_data(envelope):
+        return envelope.reply_to is None and isinstance(envelope.message, (Routed, Batch))
+
+    @staticmethod
+    def _frame_count(message):
+        if isinstance(message, Batch):
+            return len(message.items)
+        return 1
+
+    def set_limit(self, maxsize, policy=None):
+        if policy is not None and policy not in self.POLICIES:
+            raise ValueError(f'unknown inbox policy: {policy}')
+        with self.mutex:
+            self.limit = maxsize
+            if policy is not None:
+                self.policy = policy
+            self.not_full.notify_all()
+
+    def put(self, item, block=True, timeout=None):
+        self._put_limited(item, timeout)
+        if self.notify is not None:
+            self.notify()
+
+    def _put_limited(self, item, timeout=None):
+        if not self.limit or not self._is_data(item):
+            return super().put(item, True, timeout)
+        with self.not_full:
+            if self.data_count >= self.limit:
+                policy = self.policy
+                if policy == 'block' and self.loop_thread is threading.current_thread():
+                    policy = 'coalesce'
+                if policy == 'block':
+                    end = None if timeout is None else time.monotonic() + timeout
+                    while self.data_count >= self.limit and self.limit:
+                        if self.stopped is not None and self.stopped.is_set():
+                            break
+                        wait = 0.1
+                        if end is not None:
+                            wait = min(wait, end - time.monotonic())
+                            if wait <= 0:
+                                raise queue.Full
+                        self.not_full.wait(wait)
+                elif policy == 'drop_newest':
+                    self.dropped += self._frame_count(item.message)
+                    return
+                elif policy == 'coalesce' and self._coalesce(item.message):
+                    return
+                else:
+                    self._drop_oldest()
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def _drop_oldest(self):
+        for envelope in self.queue:
+            if self._is_data(envelope):
+                self.queue.remove(envelope)
+                self._coalesced.pop(id(envelope), None)
+                self.data_count -= 1
+                self.dropped += self._frame_count(envelope.message)
+                self.unfinished_tasks -= 1
+                return
+
+    def _coalesce(self, message):
+        for envelope in reversed(self.queue):
+            if self._is_data(envelope) and envelope.message.topic == message.topic:
+                items = self._coalesced.get(id(envelope))
+                if items is None:
+                    old = envelope.message
+                    items = self._coalesced[id(envelope)] = deque(maxlen=self.limit)
+                    self._extend(items, old.items if isinstance(old, Batch) else (old.frame,))
+                    envelope.message = Batch(message.topic, items)
+                self._extend(items, message.items if isinstance(message, Batch) else (message.frame,))
+                return True
+        return False
+
+    def _extend(self, items, frames):
+        #deque超过maxlen时自动丢弃最早的Frame
+        overflow = len(items) + len(frames) - items.maxlen
+        if overflow > 0:
+            self.dropped += overflow
+        items.extend(frames)
+
+    def _put(self, item):
+        if self._is_data(item):
+            self.data_count += 1
+        self.queue.append(item)
+
+    def _get(self):
+        item = self.queue.popleft()
+        if self._is_data(item):
+            self.data_count -= 1
+            items = self._coalesced.pop(id(item), None)
+            if items is not None:
+                item.message = Batch(item.message.topic, list(items))
+        return item
+
+
 class MyThreadActor(ThreadingActor):
+    #输出批处理: batch_size条消息或等待batch_latency秒后, 作为一个Batch发送
+    #batch_size <= 1 时不做批处理
+    batch_size = 1
+    batch_latency = 0.01
+    #inbox中数据消息的上限, 0表示不限制; 以及超过上限时的策略, 见BoundedInbox
+    inbox_maxsize = 0
+    inbox_policy = 'block'
+    #丢弃数据的统计信息发布间隔(秒)
+    inbox_report_interval = 1.0
+    #是否可以融合到上游actor的线程中执行, 见TopicManager.fused_stage
+    fusable = False
+    #actor的运行方式, None表示每个actor一个线程, 见core.aio.use_asyncio_runtime
+    runtime = None
+
+    @classmethod
+    def _create_actor_inbox(cls):
+        return BoundedInbox(cls.inbox_maxsize, cls.inbox_policy)
+
     def __init__(self):
         super().__init__()
         self.is_activated = False
+        self._pending = []
+        self._pending_since = 0
+        self.actor_inbox.stopped = self.actor_stopped
+        self._reported_dropped = 0
+        self._reported_time = 0
+        #融合执行时, 上游线程和本actor线程通过该锁串行处理消息
+        self._stage_lock = threading.RLock()
+        #本actor线程下一次醒来的时间(time.monotonic()), None表示只等待inbox
+        self._wake_at = None
         self.topic_manager = TopicManager.singleton()
         #默认订阅topic：/cmd, /class_name/input
         self.topic_manager.subscribe('/cmd', self.actor_ref)
@@ -26,6 +198,8 @@ class MyThreadActor(ThreadingActor):
             'pub': set([f'/{self.__class__.__name__}/output'])
         }
         self.logger = logging.getLogger(self.__class__.__name__)
+        if self.fusable:
+            self.topic_manager.register_stage(self)
     
     def __get_topics(self):
         return self.__topics
@@ -67,9 +241,182 @@ class MyThreadActor(ThreadingActor):
     def data_output_topic(self):
         return f'/{self.__class__.__name__}/output'
 
+    def set_batch(self, size, latency=None):
+        """
+        设置输出批处理的最大条数和最大等待时间(秒)
+        """
+        self.flush()
+        self.batch_size = max(int(size), 1)
+        if latency is not None:
+            self.batch_latency = float(latency)
+
     def tell(self, msg):
+        if self.batch_size <= 1:
+            for topic in self.topics['pub']:
+                self.topic_manager.tell(topic, msg)
+            return
+        if not self._pending:
+            self._pending_since = time.monotonic()
+        self._pending.append(msg)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def tell_batch(self, msgs):
+        """
+        一次发送多条消息
+        """
+        if self._pending:
+            self._pending.extend(msgs)
+            self.flush()
+            return
+        self._publish(msgs)
+
+    def flush(self):
+        """
+        发送所有缓存的消息
+        """
+        if not self._pending:
+            return
+        msgs = self._pending
+        self._pending = []
+        self._publish(msgs)
+
+    def _publish(self, msgs):
         for topic in self.topics['pub']:
-            self.topic_manager.tell(topic, msg)
+            self.topic_manager.tell_batch(topic, msgs)
+
+    def set_inbox_limit(self, maxsize, policy=None):
+        """
+        设置inbox中数据消息的上限和超过上限时的策略
+        """
+        self.actor_inbox.set_limit(int(maxsize), policy)
+
+    def _report_dropped(self):
+        """
+        inbox有数据被丢弃时, 定期在TOPIC_STATS_MAILBOX上发布统计信息
+        """
+        now = time.monotonic()
+        if now - self._reported_time < self.inbox_report_interval:
+            return
+        dropped = self.actor_inbox.dropped
+        self._reported_dropped = dropped
+        self._reported_time = now
+        self.topic_manager.tell(TOPIC_STATS_MAILBOX, {
+            'actor': self.__class__.__name__,
+            'dropped': dropped,
+            'policy': self.actor_inbox.policy,
+            'maxsize': self.actor_inbox.limit,
+        })
+
+    def _after_receive(self):
+        if self._pending and self._flush_timeout() == 0:
+            self.flush()
+        if self.actor_inbox.dropped != self._reported_dropped:
+            self._report_dropped()
+
+    def _flush_timeout(self):
+        """
+        距离缓存消息必须发送的剩余时间, 没有缓存消息时返回None
+        """
+        if not self._pending:
+            return None
+        return max(self._pending_since + self.batch_latency - time.monotonic(), 0)
+
+    def _handle_envelope(self, envelope):
+        metrics = self.topic_manager.metrics
+        if metrics is None:
+            self._process_envelope(envelope)
+            return
+        depth = self.actor_inbox.qsize()
+        start = time.perf_counter_ns()
+        self._process_envelope(envelope)
+        metrics.on_receive(self.__class__.__name__, depth,
+                           time.perf_counter_ns() - start, self.actor_inbox.dropped)
+
+    def _process_envelope(self, envelope):
+        if envelope.message is _TICK:
+            return
+        try:
+            response = self._handle_receive(envelope.message)
+            if envelope.reply_to is not None:
+                envelope.reply_to.set(response)
+        except Exception:
+            if envelope.reply_to is not None:
+                pykka_logger.info(
+                    f"Exception returned from {self} to caller:",
+                    exc_info=sys.exc_info(),
+                )
+                envelope.reply_to.set_exception()
+            else:
+                self._handle_failure(*sys.exc_info())
+                try:
+                    self.on_failure(*sys.exc_info())
+                except Exception:
+                    self._handle_failure(*sys.exc_info())
+        except BaseException:
+            exception_value = sys.exc_info()[1]
+            pykka_logger.debug(f"{exception_value!r} in {self}. Stopping all actors.")
+            self._stop()
+            ActorRegistry.stop_all()
+
+    def receive_inline(self, message):
+        """
+        在调用者的线程中处理消息(流水线融合), 处理完后立即发送输出
+        """
+        with self._stage_lock:
+            self._handle_envelope(_InlineEnvelope(message, None))
+            self.flush()
+            self._wake_if_needed()
+
+    def _wait_timeout(self):
+        """
+        等待inbox的最长时间(秒), None表示一直等待
+        """
+        return self._flush_timeout()
+
+    def _next_wait(self):
+        """
+        在_stage_lock中调用, 返回_wait_timeout()并记录下一次醒来的时间
+        """
+        timeout = self._wait_timeout()
+        self._wake_at = None if timeout is None else time.monotonic() + timeout
+        return timeout
+
+    def _wake_if_needed(self):
+        """
+        在_stage_lock中调用, 本actor线程之外(融合执行, 子进程返回结果)产生了需要定时处理的状态时,
+        如果actor线程不会按时醒来, 向inbox发送_TICK唤醒它; 没有定时状态时不唤醒, 空闲时不占用CPU
+        """
+        timeout = self._wait_timeout()
+        if timeout is None:
+            return
+        due = time.monotonic() + timeout
+        if self._wake_at is not None and self._wake_at <= due:
+            return
+        self._wake_at = due
+        self.actor_ref.tell(_TICK)
+
+    def _on_idle(self):
+        """
+        等待inbox超时后调用
+        """
+        self.flush()
+
+    def _actor_loop_running(self) -> None:
+        while not self.actor_stopped.is_set():
+            with self._stage_lock:
+                timeout = self._next_wait()
+            try:
+                envelope = self.actor_inbox.get(timeout=timeout)
+            except queue.Empty:
+                with self._stage_lock:
+                    self._on_idle()
+                continue
+            with self._stage_lock:
+                self._handle_envelope(envelope)
+                self._after_receive()
+        with self._stage_lock:
+            self.flush()
 
 
     def activate(self):
@@ -85,7 +432,10 @@ class MyThreadActor(ThreadingActor):
         )
         ActorRegistry.register(self.actor_ref)
         pykka_logger.debug(f"Starting {self}")
-        self._start_actor_loop()  # noqa: SLF001
+        if self.runtime is not None:
+            self.runtime.attach(self)
+        else:
+            self._start_actor_loop()  # noqa: SLF001
 
     def deactivate(self):
         """
@@ -98,12 +448,27 @@ class MyThreadActor(ThreadingActor):
     
     def on_input(self, msg):
         raise NotImplementedError
+
+    def on_input_batch(self, msgs):
+        """
+        处理一批输入消息, 默认逐条调用on_input
+        """
+        for msg in msgs:
+            self.on_input(msg)
     
     def on_cmd(self, msg):
         raise NotImplementedError
     
     def on_receive(self, message):
-        self.logger.debug(f'on_receive {message}')
+        self.logger.debug('on_receive %s', message)
+        if isinstance(message, Routed):
+            if message.topic.endswith('/input'):
+                return self.on_input(message.frame)
+            return None
+        if isinstance(message, Batch):
+            if message.topic.endswith('/input'):
+                return self.on_input_batch(message.items)
+            return None
         if 'topic' not in message:
             return
         topic = message['topic']
@@ -119,43 +484,154 @@ class LoopActor(MyThreadActor):
         super().__init__()
         self.timeout = timeout
         self.block = block
+        #上一次on_poll读到了数据
+        self._busy = False
+        #线程模式下等待poll_fileno可读, inbox有新消息时通过管道唤醒
+        self._selector = None
+        self._wakeup_fds = None
+        self._wakeup_pending = False
+        #selector中已注册的fd -> mask, 只在poll_filenos()/poll_write_filenos()变化时修改
+        self._registered = {}
+        #处理inbox消息后fd可能被关闭后重新打开, 下次等待时重新注册
+        self._reregister = False
     
-    def on_poll(self) -> None:
+    def on_poll(self) -> bool:
         """
         Called on every loop iteration.
+        返回True表示读到了数据, 会立即再次调用; 不要在on_poll中sleep, 空闲时由actor loop等待inbox
         """
         raise NotImplementedError
 
+    def poll_fileno(self):
+        """
+        可以等待可读的文件描述符, 有数据时才调用on_poll; None表示定时调用on_poll
+        """
+        return None
+
+    def poll_filenos(self):
+        """
+        可以等待可读的所有文件描述符, 一个actor同时读多个设备时重载; 默认为poll_fileno()
+        """
+        fd = self.poll_fileno()
+        return () if fd is None else (fd,)
+
+    def poll_write_filenos(self):
+        """
+        有数据等待发送的文件描述符, 可写时调用on_poll
+        """
+        return ()
+
+    def _poll(self):
+        self._busy = bool(self.on_poll())
+
+    def _wait_timeout(self):
+        timeout = 0 if self._busy and not self.block else self.timeout
+        flush = self._flush_timeout()
+        if flush is not None and flush < timeout:
+            timeout = flush
+        return timeout
+
+    def _on_idle(self):
+        self._after_receive()
+
+    def _wakeup(self):
+        if self._wakeup_pending:
+            return
+        self._wakeup_pending = True
+        try:
+            os.write(self._wakeup_fds[1], b'\0')
+        except OSError:
+            pass
+
+    def _setup_wakeup(self):
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_fds = os.pipe()
+        for fd in self._wakeup_fds:
+            os.set_blocking(fd, False)
+        self._selector.register(self._wakeup_fds[0], selectors.EVENT_READ)
+        self.actor_inbox.notify = self._wakeup
+
+    def _close_wakeup(self):
+        if self._selector is None:
+            return
+        self.actor_inbox.notify = None
+        self._selector.close()
+        self._selector = None
+        self._registered = {}
+        for fd in self._wakeup_fds:
+            os.close(fd)
+        self._wakeup_fds = None
+
+    def wait_readable(self, timeout):
+        """
+        线程模式下等待poll_filenos()中任意一个可读, poll_write_filenos()中任意一个可写, 或者inbox中有新消息
+        最多等待timeout秒(None表示一直等待)
+        返回是否可读写, 返回None表示不支持, 由actor loop定时调用on_poll
+        """
+        masks = {}
+        for fd in self.poll_filenos():
+            masks[fd] = selectors.EVENT_READ
+        for fd in self.poll_write_filenos():
+            masks[fd] = masks.get(fd, 0) | selectors.EVENT_WRITE
+        if not masks:
+            self._update_registered(masks)
+            return None
+        if self._selector is None:
+            self._setup_wakeup()
+        if not self.actor_inbox.empty():
+            return False
+        self._update_registered(masks)
+        events = self._selector.select(timeout)
+        readable = False
+        for key, _ in events:
+            if key.fd != self._wakeup_fds[0]:
+                readable = True
+            else:
+                try:
+                    os.read(key.fd, 4096)
+                except OSError:
+                    pass
+                self._wakeup_pending = False
+        return readable
+
+    def _update_registered(self, masks):
+        registered = self._registered
+        if self._reregister:
+            #fd可能在on_cmd中被关闭后重新打开, 新fd可能和旧fd相同
+            self._reregister = False
+            for fd in registered:
+                self._selector.unregister(fd)
+            registered.clear()
+        for fd in [fd for fd in registered if fd not in masks]:
+            self._selector.unregister(fd)
+            del registered[fd]
+        for fd, mask in masks.items():
+            old = registered.get(fd)
+            if old is None:
+                self._selector.register(fd, mask)
+            elif old != mask:
+                self._selector.modify(fd, mask)
+            registered[fd] = mask
+
     def _actor_loop_running(self) -> None:
         while not self.actor_stopped.is_set():
             if not self.block:
-                self.on_poll()
+                self._poll()
+            timeout = self._wait_timeout()
+            if not self.block and timeout:
+                #有数据或者有新消息时才醒来
+                if self.wait_readable(self._flush_timeout()) is not None:
+                    timeout = 0
             try:
-                envelope = self.actor_inbox.get(timeout=self.timeout, block=self.block)
+                envelope = self.actor_inbox.get(timeout=timeout)
             except queue.Empty:
+                self._on_idle()
                 continue
-            try:
-                response = self._handle_receive(envelope.message)
-                if envelope.reply_to is not None:
-                    envelope.reply_to.set(response)
-            except Exception:
-                if envelope.reply_to is not None:
-                    pykka_logger.info(
-                        f"Exception returned from {self} to caller:",
-                        exc_info=sys.exc_info(),
-                    )
-                    envelope.reply_to.set_exception()
-                else:
-                    self._handle_failure(*sys.exc_info())
-                    try:
-                        self.on_failure(*sys.exc_info())
-                    except Exception:
-                        self._handle_failure(*sys.exc_info())
-            except BaseException:
-                exception_value = sys.exc_info()[1]
-                pykka_logger.debug(f"{exception_value!r} in {self}. Stopping all actors.")
-                self._stop()
-                ActorRegistry.stop_all()
+            self._handle_envelope(envelope)
+            self._reregister = True
+            self._after_receive()
+        self._close_wakeup()
+        self.flush()
 
 class SourceActor(LoopActor):
     def __init__(self, timeout=0.1, block=True):
@@ -182,8 +658,91 @@ class FilterActor(MyThreadActor):
         super().deactivate() 
 
 class ConvertActor(MyThreadActor):
+    fusable = True
+
     def __init__(self):
         super().__init__()
+        #进程池模式下, 转换在子进程中执行, 见set_execution
+        self._pool = None
+
+    def set_execution(self, mode, workers=1):
+        """
+        设置执行方式:
+            thread: 在actor线程中转换
+            process: 输入按批发送到workers个子进程中转换, 同一来源的数据保持顺序
+                转换的状态(如不完整的行)在子进程中, 定时输出和停止时的输出也在子进程中执行
+                /cmd在所有子进程中执行, 一个子进程时返回它的返回值, 多个时返回每个子进程的返回值列表
+        """
+        if self._pool is not None:
+            #缓存的输入先交给原来的进程池转换, 子进程中缓存的数据也输出
+            self.flush()
+            self._pool.shutdown(self._publish_converted)
+            self._pool = None
+        if mode == 'process':
+            self._pool = StagePool(self.__class__, workers, self._wakeup_pool)
+        elif mode != 'thread':
+            raise ValueError(f'unknown execution mode: {mode}')
+
+    def on_receive(self, message):
+        if self._pool is None:
+            return super().on_receive(message)
+        topic, frames = unpack(message)
+        if topic is not None:
+            if topic.endswith('/input'):
+                #输入先缓存, 由flush()按批提交到进程池
+                if not self._pending:
+                    self._pending_since = time.monotonic()
+                self._pending.extend(frames)
+                if len(self._pending) >= self.batch_size:
+                    self.flush()
+            return None
+        if message.get('topic') == '/cmd':
+            #缓存的输入先提交, 保证命令在这些输入之后执行
+            self.flush()
+            replies = self._pool.broadcast(message, self._publish_converted)
+            return replies[0] if len(replies) == 1 else replies
+        return super().on_receive(message)
+
+    def _publish(self, msgs):
+        if self._pool is None:
+            return super()._publish(msgs)
+        self._pool.submit(msgs, self._publish_converted)
+
+    def _publish_converted(self, msgs):
+        """
+        发布子进程转换的结果, 在进程池的回调线程中执行
+        """
+        super()._publish(msgs)
+
+    def _wakeup_pool(self):
+        #在进程池的回调线程中执行, 不能获取_stage_lock(actor线程可能持有该锁等待/cmd的结果)
+        try:
+            self.actor_ref.tell(_TICK)
+        except ActorDeadError:
+            #停止时on_stop等待子进程输出缓存的数据
+            pass
+
+    def _wait_timeout(self):
+        timeout = super()._wait_timeout()
+        if self._pool is not None:
+            pending = self._pool.next_timeout()
+            if pending is not None and (timeout is None or pending < timeout):
+                timeout = pending
+        return timeout
+
+    def _on_idle(self):
+        super()._on_idle()
+        if self._pool is not None:
+            #缓存的输入已经提交, 再让定时任务到期的子进程输出超时的数据
+            self._pool.expire(self._publish_converted)
+
+    def on_stop(self):
+        if self._pool is not None:
+            #停止前把缓存的输入提交到进程池, 子进程输出缓存的数据, 等待结果发布后再关闭进程池
+            with self._stage_lock:
+                self.flush()
+            self._pool.shutdown(self._publish_converted)
+            self._pool = None
 
     def activate(self):
         super().activate() 
@@ -191,6 +750,52 @@ class ConvertActor(MyThreadActor):
     def deactivate(self):
         super().deactivate() 
 
+class FramerActor(ConvertActor):
+    """
+    按协议分包的ConvertActor, 每个来源一个core.framing中的增量解码器, 输出完整的帧
+    Frame.mode: 'packet' 正确的帧, 'bad_packet' CRC或格式错误的帧
+    子类设置options(configure可以修改的参数), 实现make_decoder
+    /cmd:
+        {'cmd':'configure', 参数...}: 重新创建解码器, 丢弃缓存的数据, 没有指定的参数保持不变
+        {'cmd':'stats'}: 返回 frames, errors, overruns, discarded, buffered
+    yapsy加载插件模块中第一个(按名字排序)ConvertActor的子类, 插件中通过模块引用FramerActor, 不要直接import
+    """
+    #configure可以修改的参数
+    options = ()
+
+    def __init__(self, **kwargs):
+        super().__init__()
+        self._decoders = PerSource(self.make_decoder, **kwargs)
+
+    def make_decoder(self, **kwargs):
+        """
+        创建一个解码器, 参数错误时抛出ValueError或TypeError
+        """
+        raise NotImplementedError
+
+    def on_input(self, frame):
+        if not frame.data:
+            return
+        data = frame.data
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        for source, payload, valid, ts in self._decoders.feed(frame.source, data, frame.ts):
+            self.tell(Frame(payload, source, ts, 'packet' if valid else 'bad_packet'))
+
+    def on_cmd(self, msg):
+        cmd = msg.get('cmd')
+        if cmd == 'configure':
+            kwargs = dict(self._decoders.kwargs)
+            kwargs.update((k, msg[k]) for k in self.options if k in msg)
+            try:
+                self._decoders = PerSource(self.make_decoder, **kwargs)
+            except (ValueError, TypeError) as e:
+                self.logger.error("configure failed: %s", e)
+                return False
+            return True
+        elif cmd == 'stats':
+            return self._decoders.stats()
+
 class HighlightActor(MyThreadActor):
     def __init__(self):
         super().__init__()
@@ -203,6 +808,8 @@ class HighlightActor(MyThreadActor):
 
 
 class StorageActor(MyThreadActor):
+    fusable = True
+
     def __init__(self):
         super().__init__()
 
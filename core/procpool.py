@@ -0,0 +1,162 @@
+# Desc: 在子进程中执行ConvertActor的转换逻辑
+# 每个子进程中有一个插件类的实例, 同一来源的Frame总是交给同一个子进程, 保证顺序
+# 实例的定时状态(如不完整的行)也在子进程中: 每次返回结果时带上_wait_timeout(), 到期后由主进程提交_on_idle
+import importlib.util
+import inspect
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger('StagePool')
+
+#actor是多线程的, fork会复制其他线程持有的锁, 子进程使用forkserver或spawn启动
+_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+#子进程中的插件实例: (文件路径, 类名) -> (实例, 输出列表)
+_stages = {}
+
+
+def _load_stage(path, name):
+    key = (path, name)
+    if key in _stages:
+        return _stages[key]
+    spec = importlib.util.spec_from_file_location(f'_stagepool_{name}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    stage = getattr(module, name)()
+    #输出不发布到topic, 而是收集起来返回给主进程
+    output = []
+    stage.tell = output.append
+    stage.tell_batch = output.extend
+    _stages[key] = (stage, output)
+    return _stages[key]
+
+
+def _collect(stage, output):
+    """
+    返回(输出的Frame, 距离下一次需要调用_on_idle的时间)
+    """
+    ret = output[:]
+    output.clear()
+    return ret, stage._wait_timeout()
+
+
+def _run_batch(path, name, frames):
+    stage, output = _load_stage(path, name)
+    stage.on_input_batch(frames)
+    return (None,) + _collect(stage, output)
+
+
+def _run_idle(path, name):
+    stage, output = _load_stage(path, name)
+    stage._on_idle()
+    return (None,) + _collect(stage, output)
+
+
+def _run_cmd(path, name, msg):
+    stage, output = _load_stage(path, name)
+    reply = stage.on_cmd(msg)
+    return (reply,) + _collect(stage, output)
+
+
+def _run_stop(path, name):
+    stage, output = _load_stage(path, name)
+    stage.on_stop()
+    return (None,) + _collect(stage, output)
+
+
+class StagePool:
+    """
+    运行某个插件类的进程池
+        cls: 插件类, 必须可以在子进程中通过文件路径重新加载
+        workers: 子进程个数
+        wakeup: 子进程中的实例有了更早的定时任务时调用, 在进程池的回调线程中执行, 不能阻塞
+    每个子进程只有一个worker, 按Frame.source分配, 同一来源的结果按提交顺序返回
+    """
+    def __init__(self, cls, workers=1, wakeup=None):
+        self._path = inspect.getfile(cls)
+        self._name = cls.__name__
+        self._wakeup = wakeup
+        context = multiprocessing.get_context(_START_METHOD)
+        self._executors = [ProcessPoolExecutor(max_workers=1, mp_context=context) for _ in range(max(workers, 1))]
+        #每个子进程下一次需要调用_on_idle的时间(time.monotonic()), None表示没有定时状态
+        self._deadlines = [None] * len(self._executors)
+
+    def _slot(self, source):
+        return hash(source) % len(self._executors)
+
+    def _submit(self, slot, fn, args, callback):
+        future = self._executors[slot].submit(fn, self._path, self._name, *args)
+        future.add_done_callback(lambda f: self._done(slot, f, callback))
+        return future
+
+    def submit(self, frames, callback):
+        """
+        提交一批Frame, 每个子进程的结果就绪后调用callback(frames)
+        """
+        groups = {}
+        for frame in frames:
+            groups.setdefault(self._slot(frame.source), []).append(frame)
+        for slot, group in groups.items():
+            self._submit(slot, _run_batch, (group,), callback)
+
+    def _done(self, slot, future, callback):
+        try:
+            _, frames, timeout = future.result()
+        except Exception:
+            logger.exception('%s failed in worker process', self._name)
+            return
+        old = self._deadlines[slot]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._deadlines[slot] = deadline
+        if frames:
+            callback(frames)
+        if deadline is not None and (old is None or deadline < old) and self._wakeup is not None:
+            self._wakeup()
+
+    def next_timeout(self):
+        """
+        距离最早的子进程定时任务的时间(秒), 没有时返回None
+        """
+        deadlines = [deadline for deadline in self._deadlines if deadline is not None]
+        if not deadlines:
+            return None
+        return max(min(deadlines) - time.monotonic(), 0)
+
+    def expire(self, callback):
+        """
+        定时任务到期的子进程执行_on_idle, 输出的Frame交给callback
+        """
+        now = time.monotonic()
+        for slot, deadline in enumerate(self._deadlines):
+            if deadline is not None and deadline <= now:
+                #结果返回时更新
+                self._deadlines[slot] = None
+                self._submit(slot, _run_idle, (), callback)
+
+    def broadcast(self, msg, callback):
+        """
+        在所有子进程中执行命令, 等待执行完成, 返回每个子进程on_cmd的返回值; 命令产生的Frame交给callback
+        """
+        futures = [self._submit(slot, _run_cmd, (msg,), callback) for slot in range(len(self._executors))]
+        replies = []
+        for future in futures:
+            try:
+                replies.append(future.result()[0])
+            except Exception:
+                replies.append(None)
+        return replies
+
+    def shutdown(self, callback=None):
+        """
+        等待已提交的Frame转换完成并发布结果, 然后停止子进程
+        callback不为None时, 先在子进程中调用on_stop, 输出缓存的数据(如不完整的行)
+        """
+        if callback is not None:
+            for slot in range(len(self._executors)):
+                self._submit(slot, _run_stop, (), callback)
+        for executor in self._executors:
+            executor.shutdown(wait=True)
+        self._executors = []
+        self._deadlines = []
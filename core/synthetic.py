@@ -0,0 +1,145 @@
+# Desc: 基于pty的模拟串口设备, 用于端到端的性能测试
+# 只支持有pty模块的系统(Linux, macOS)
+import os
+import random
+import re
+import threading
+import time
+
+#每行开头的序号, 用于在sink端计算延迟
+SEQ_PATTERN = re.compile(rb'#(\d+) ')
+_ANSI_COLORS = (31, 32, 33, 34, 35, 36)
+
+
+class TrafficPattern:
+    """
+    模拟设备的发送模式
+        lines: 发送的行数
+        line_rate: 每秒发送的行数, 0表示尽快发送
+        line_length: 每行的字节数(不含换行)
+        ansi_density: 包含ANSI颜色的行的比例, 0~1
+        burst_size: 二进制数据的字节数, 每burst_every行发送一次, 0表示不发送
+        pause: 每pause_every行暂停的秒数
+        baudrate: 模拟的波特率, 限制每秒发送baudrate/10字节, 0表示不限制
+    """
+    def __init__(self, lines=10000, line_rate=0, line_length=80, ansi_density=0.0,
+                 burst_size=0, burst_every=0, pause=0.0, pause_every=0, baudrate=0, seed=0):
+        self.lines = lines
+        self.line_rate = line_rate
+        self.line_length = line_length
+        self.ansi_density = ansi_density
+        self.burst_size = burst_size
+        self.burst_every = burst_every
+        self.pause = pause
+        self.pause_every = pause_every
+        self.baudrate = baudrate
+        self.seed = seed
+
+    def line(self, seq, rnd):
+        head = b'#%d ' % seq
+        body_len = max(self.line_length - len(head), 0)
+        if self.ansi_density and rnd.random() < self.ansi_density:
+            color = b'\x1b[%dm' % rnd.choice(_ANSI_COLORS)
+            body = b'x' * max(body_len - len(color) - 4, 0)
+            return head + color + body + b'\x1b[0m\n'
+        return head + b'x' * body_len + b'\n'
+
+    def burst(self, rnd):
+        data = bytes(rnd.getrandbits(8) for _ in range(self.burst_size))
+        #不能出现序号的前缀和换行, 否则sink会解析出错误的序号
+        return data.replace(b'#', b'.').replace(b'\n', b'.') + b'\n'
+
+
+class SyntheticDevice:
+    """
+    一对pty, 从master端按TrafficPattern写数据, slave端(port)由SerialSourceActor打开
+        sent: 每行序号的发送时间(time.monotonic_ns())
+        written: 已写入的字节数
+        received: 从master端读到的字节数(SerialSourceActor写入的数据)
+    """
+    #尽快发送时每次写入的最大字节数
+    CHUNK = 4096
+
+    def __init__(self, pattern=None):
+        import pty
+        import tty
+        self.pattern = pattern or TrafficPattern()
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        tty.setraw(self.master)
+        self.port = os.ttyname(self.slave)
+        self.sent = {}
+        self.written = 0
+        self.received = 0
+        self._stop = threading.Event()
+        self._writer = None
+        self._reader = threading.Thread(target=self._read_loop, name=f'pty-read {self.port}', daemon=True)
+        self._reader.start()
+
+    def start(self):
+        self._writer = threading.Thread(target=self._write_loop, name=f'pty-write {self.port}', daemon=True)
+        self._writer.start()
+
+    def wait(self, timeout=None):
+        if self._writer:
+            self._writer.join(timeout)
+        return not (self._writer and self._writer.is_alive())
+
+    def _read_loop(self):
+        while not self._stop.is_set():
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+            if not data:
+                break
+            self.received += len(data)
+
+    def _write(self, chunk, seqs):
+        now = time.monotonic_ns()
+        for seq in seqs:
+            self.sent[seq] = now
+        view = memoryview(chunk)
+        while view:
+            n = os.write(self.master, view)
+            view = view[n:]
+        self.written += len(chunk)
+
+    def _write_loop(self):
+        p = self.pattern
+        rnd = random.Random(p.seed)
+        start = time.monotonic()
+        line_interval = 1.0 / p.line_rate if p.line_rate else 0
+        byte_interval = 10.0 / p.baudrate if p.baudrate else 0
+        chunk = bytearray()
+        seqs = []
+        nbytes = 0
+        for seq in range(p.lines):
+            if self._stop.is_set():
+                return
+            chunk += p.line(seq, rnd)
+            seqs.append(seq)
+            if p.burst_size and p.burst_every and seq % p.burst_every == p.burst_every - 1:
+                chunk += p.burst(rnd)
+            pause = p.pause and p.pause_every and seq % p.pause_every == p.pause_every - 1
+            #按行速率和波特率计算这一行应该发送完的时间
+            due = max((seq + 1) * line_interval, (nbytes + len(chunk)) * byte_interval)
+            if due or pause or len(chunk) >= self.CHUNK or seq == p.lines - 1:
+                delay = start + due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                self._write(bytes(chunk), seqs)
+                nbytes += len(chunk)
+                chunk.clear()
+                seqs = []
+            if pause:
+                time.sleep(p.pause)
+                start += p.pause
+
+    def close(self):
+        self._stop.set()
+        for fd in (self.slave, self.master):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
@@ -0,0 +1,44 @@
+# Desc: 时间戳格式化
+# Frame.ts是time.monotonic_ns()的整数, 可以直接排序和相减
+# 只有显示或保存文本时才转为字符串, 同一秒内只格式化一次日期和秒, 每行只拼接毫秒
+import time
+
+NS_PER_MS = 1000000
+NS_PER_SEC = 1000000000
+
+
+class TimestampFormatter:
+    """
+    将monotonic_ns时间戳格式化为本地时间字符串, 如 "05-01 12:30:45.123"
+        fmt: 秒及以上部分的strftime格式
+    """
+    def __init__(self, fmt="%m-%d %H:%M:%S"):
+        self.fmt = fmt
+        #monotonic时钟到epoch的偏移, 创建时确定, 之后系统时间调整不影响顺序
+        self.offset = time.time_ns() - time.monotonic_ns()
+        #(秒, 前缀), 作为一个元组替换, 多线程共享时不会读到不一致的值
+        self._cache = (None, '')
+
+    def to_epoch_ns(self, ts):
+        return ts + self.offset
+
+    def format(self, ts):
+        ns = ts + self.offset
+        sec, rem = divmod(ns, NS_PER_SEC)
+        cached_sec, prefix = self._cache
+        if sec != cached_sec:
+            prefix = time.strftime(self.fmt, time.localtime(sec))
+            self._cache = (sec, prefix)
+        return f'{prefix}.{rem // NS_PER_MS:03d}'
+
+    __call__ = format
+
+
+_default = TimestampFormatter()
+
+
+def format_ts(ts):
+    """
+    用默认格式格式化Frame.ts
+    """
+    return _default.format(ts)
@@ -2,16 +2,29 @@
 # 标准数据流
 # /data/source --> /data/segment --> /data/convert --> /data/highlighten
 # 原始数据，从source plugin发出的数据
-#   数据格式：{'data':data, 'ts':时间戳, 'mode':模式（text， hex）}
+#   数据格式：core.message.Frame(data, source, ts, mode), data为原始bytes
+#   需要文本的actor使用core.codec.StreamDecoder按source增量解码
+#   ts为time.monotonic_ns(), 显示或保存时用core.timestamp.format_ts格式化
 TOPIC_RAW_DATA = '/data/source'
 
 # 经过segment plugin处理后的数据, 
 #   对于普通文本，只是简单的分割成行；对于二进制数据，按时间分行
-#   也可以按照特定协议格式来分包
-#   数据格式：{'data':data, 'ts':时间戳, mode:模式（text， hex）}
+#   也可以按照特定协议格式来分包(SlipFramerActor, CobsFramerActor, LengthFramerActor)
+#   数据格式：core.message.Frame(data, source, ts, mode)
+#   按协议分包时data为一帧的bytes, mode为'packet'(CRC正确)或'bad_packet'(CRC或格式错误)
 TOPIC_SEGMENT_DATA = '/data/segment'
 #经过convert plugin处理后的数据
+#   AnsiStyleActor输出mode为'styled'的Frame, data为core.ansi.StyledText, 每段带(前景色, 背景色, 属性)样式元组
 TOPIC_CONVERT_DATA = '/data/convert'
 #将数据进行着色处理
 TOPIC_HIGHLIGHTEN_DATA = '/data/highlighten'
 
+# 统计信息
+#   actor inbox丢弃数据的统计：{'actor':类名, 'dropped':丢弃的Frame总数, 'policy':策略, 'maxsize':上限}
+TOPIC_STATS_MAILBOX = '/stats/mailbox'
+#   查询统计信息(ask)：{'cmd':'get'} 返回core.metrics.MetricsRegistry.snapshot()
+TOPIC_STATS = '/stats'
+#   定期发布的统计信息：{'stats':snapshot}
+TOPIC_STATS_METRICS = '/stats/metrics'
+#   JLink RTT读取统计：{'actor', 'target', 'bytes', 'reads', 'bytes_per_s', 'host_overflows':JLink主机端缓存溢出的次数(HostOverflowCount, 不是目标板上的溢出), 'interval':当前poll间隔}
+TOPIC_STATS_RTT = '/stats/rtt'
@@ -0,0 +1,154 @@
+# Desc: 单个处理阶段的性能测试, 不经过actor和串口
+# 例: python microbench.py hexdump --size 4096
+#     python microbench.py ansi --ansi 0.3
+import argparse
+import os
+import random
+import time
+from core.ansi import DEFAULT, HtmlCache, StyledCache, to_html, to_styled, styled_to_html
+from core.hexdump import HexDumper
+from core.synthetic import TrafficPattern
+from core.timestamp import format_ts
+
+
+def timeit(fn, repeat):
+    """
+    返回repeat次中最快的一次的秒数
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_hexdump(args):
+    data = os.urandom(args.total)
+    chunks = [data[i:i + args.size] for i in range(0, len(data), args.size)]
+    dumper = HexDumper()
+
+    def dump():
+        for chunk in chunks:
+            dumper.dump(chunk)
+
+    def hex_line():
+        for chunk in chunks:
+            chunk.hex(' ')
+
+    def dump_many():
+        #LineSegmentActor一批输入的包一起格式化
+        for start in range(0, len(chunks), args.batch):
+            dumper.dump_many(chunks[start:start + args.batch])
+
+    for name, fn in [('hexdump', dump), ('hexdump batch', dump_many), ('hex line', hex_line)]:
+        elapsed = timeit(fn, args.repeat)
+        print(f'{name}: {len(data) / elapsed / 1e6:.1f} MB/s ({args.size} bytes per packet)')
+
+
+def legacy_ansi2html(lines):
+    """
+    之前Ansi2HtmlConverter的实现: 每行都用stransi解析, 每段文本一个带内联样式的<span>, 用+=拼接
+    """
+    from stransi import Ansi, SetAttribute, SetColor
+    fg_color = default_fg = "black"
+    bg_color = default_bg = "white"
+    bold = False
+    for data in lines:
+        html = "<p>"
+        for t in Ansi(data).instructions():
+            if isinstance(t, str):
+                html += '<span style="color:{};background-color:{};font-weight:{};">{}</span>'.format(
+                    fg_color, bg_color, "bold" if bold else "normal", t)
+            elif isinstance(t, SetAttribute):
+                if t.attribute.name == "BOLD":
+                    bold = True
+                elif t.attribute.name == "NORMAL":
+                    fg_color, bg_color, bold = default_fg, default_bg, False
+            elif isinstance(t, SetColor):
+                if t.role.name == "FOREGROUND":
+                    fg_color = t.color.web_color.name if t.color else default_fg
+                else:
+                    bg_color = t.color.web_color.name if t.color else default_bg
+        html += "</p><br/>"
+
+
+def bench_ansi(args):
+    #和LineSegmentActor的输出相同: 绿色的时间戳 + 行, 每行间隔1ms
+    pattern = TrafficPattern(line_length=args.length, ansi_density=args.ansi)
+    rnd = random.Random(0)
+    start = time.monotonic_ns()
+    if args.distinct:
+        #重复的日志: 从distinct种行中随机选择
+        pool = [pattern.line(seq, rnd).decode() for seq in range(args.distinct)]
+        bodies = [rnd.choice(pool) for _ in range(args.lines)]
+    else:
+        bodies = [pattern.line(seq, rnd).decode() for seq in range(args.lines)]
+    lines = ["\033[32m[" + format_ts(start + i * 1000000) + " \033[0m]" + body for i, body in enumerate(bodies)]
+
+    def convert():
+        style = DEFAULT
+        for line in lines:
+            html, style = to_html(line, style)
+
+    def parse_render():
+        #AnsiStyleActor解析一次, 前端只渲染
+        style = DEFAULT
+        for line in lines:
+            styled, style = to_styled(line, style)
+            styled_to_html(styled)
+
+    caches = {}
+
+    def cached_convert():
+        cache = caches['html'] = HtmlCache(args.cache)
+        style = DEFAULT
+        for line in lines:
+            html, style = cache.convert(line, style)
+
+    def cached_parse_render():
+        cache = caches['styled'] = StyledCache(args.cache)
+        style = DEFAULT
+        for line in lines:
+            styled, style = cache.convert(line, style)
+            styled_to_html(styled)
+
+    for name, fn in [('core.ansi', convert), ('core.ansi styled + html', parse_render),
+                     ('HtmlCache', cached_convert), ('StyledCache + html', cached_parse_render)]:
+        elapsed = timeit(fn, args.repeat)
+        print(f'{name}: {len(lines) / elapsed:.0f} lines/s ({args.ansi:.0%} colored lines)')
+    for name, cache in caches.items():
+        print(f'{name} cache: hit rate {cache.stats()["hit_rate"]:.1%}')
+    if args.legacy:
+        #之前的实现每秒只能处理几百行, 只测试一部分
+        legacy = lines[:1000]
+        elapsed = timeit(lambda: legacy_ansi2html(legacy), 1)
+        print(f'legacy stransi: {len(legacy) / elapsed:.0f} lines/s ({args.ansi:.0%} colored lines)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SevenSerial stage micro benchmarks')
+    sub = parser.add_subparsers(dest='bench', required=True)
+    p = sub.add_parser('hexdump', help='hex dump formatter')
+    p.add_argument('--size', type=int, default=4096, help='bytes per packet')
+    p.add_argument('--total', type=int, default=4 << 20, help='total bytes')
+    p.add_argument('--batch', type=int, default=256, help='packets per dump_many call')
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_hexdump)
+    p = sub.add_parser('ansi', help='ANSI to html converter')
+    p.add_argument('--lines', type=int, default=20000)
+    p.add_argument('--length', type=int, default=80, help='bytes per line')
+    p.add_argument('--ansi', type=float, default=0.1, help='fraction of lines with ANSI colors')
+    p.add_argument('--distinct', type=int, default=0, help='number of distinct lines (without timestamp), 0 = all distinct')
+    p.add_argument('--cache', type=int, default=4096, help='line cache size')
+    p.add_argument('--no-legacy', dest='legacy', action='store_false', help='skip the stransi based implementation')
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_ansi)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
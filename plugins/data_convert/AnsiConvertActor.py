@@ -1,78 +1,46 @@
+from html import escape
 from core.plugintype import ConvertActor
-from stransi import Ansi, SetAttribute, SetColor
+from core.ansi import DEFAULT, STYLESHEET, HtmlCache, styled_to_html
 
 class Ansi2HtmlConverter(ConvertActor):
     """
-    将Ansi转为html
+    将Ansi转为html, 每行一个<p>, 颜色和属性使用core.ansi.STYLESHEET中的css class
+    输入为AnsiStyleActor输出的StyledText时只渲染, 否则自己解析, 颜色状态按来源跨行保持
+    hex模式的数据转义后放在<pre>中
+    自己解析时, 去掉时间戳后相同的行从LRU缓存中取html
+    /cmd:
+        {'cmd':'stylesheet'}: 返回css, 显示html的控件或者文件需要包含
+        {'cmd':'stats'}: 返回缓存的 hits, misses, size, hit_rate, styles(样式表大小)
     """
-    def __init__(self, fg_color="black", bg_color="white"):
+    #缓存的行数
+    cache_size = 4096
+
+    def __init__(self):
         super().__init__()
-        self.bg_color = bg_color
-        self.fg_color = fg_color
-        self.default_bg_color = bg_color
-        self.default_fg_color = fg_color
-        self.bold = False
-        self.stroke = False
-        self.strong = False
-    
-    def on_input(self, message): 
-        if 'data' not in message: 
+        #来源 -> 上一行结束时的样式
+        self._styles = {}
+        self._cache = HtmlCache(self.cache_size)
+
+    def on_input(self, frame):
+        if frame.data is None:
             return
-        ts = message.get('ts', None)
-        mode = message.get('mode', 'text')
-        self.on_SegmentData(message.get('data'), ts, mode)
+        self.on_SegmentData(frame)
 
-    def SetColor(self, bg_color, fg_color):
-        self.bg_color = bg_color
-        self.fg_color = fg_color
-    def SetDefaultColor(self, bg_color, fg_color):
-        self.default_bg_color = bg_color
-        self.default_fg_color = fg_color
-    
-    def _cvtColor(self, color):
-        # return "#{:x}".format(color) 
-        return color.web_color.name
-    
-    def on_SegmentData(self, data, ts, mode):
-        if mode == "hex":
-            self.tell({'data':data, 'ts':ts, 'bg_color':self.bg_color, 'fg_color':self.fg_color})
+    def on_cmd(self, msg):
+        cmd = msg.get('cmd')
+        if cmd == 'stylesheet':
+            return STYLESHEET
+        elif cmd == 'stats':
+            return self._cache.stats()
+
+    def on_SegmentData(self, frame):
+        if frame.mode == "hex":
+            #hex dump的ASCII列中可能有<>&, 转义后放在<pre>中保持列对齐
+            self.tell(frame.derive('<pre>' + escape(frame.data, False) + '</pre>'))
+            return
+        if frame.mode == "styled":
+            self.tell(frame.derive(styled_to_html(frame.data), 'text'))
             return
-        #html format <p>text<span style="color:fg_color background-color:bg_color">color</span></p>
-        #每次处理一行
-        html = "<p>"
-        for t in Ansi(data).instructions():
-            if isinstance(t, str):
-                # self.fire(DisplayData(t, ts, self.bg_color, self.fg_color), self.channel)
-                if self.bold:
-                    fontWeight = "bold"
-                else:
-                    fontWeight = "normal"
-                #TODO: 增加stroke和strong的处理
-                html += '<span style="color:{};background-color:{};font-weight:{};">{}</span>'.format(self.fg_color, self.bg_color, fontWeight, t)
-            elif isinstance(t, SetAttribute):
-                if t.attribute.name == "BOLD":
-                    self.bold = True
-                elif t.attribute.name == "STROKE":
-                    self.stroke = True
-                elif t.attribute.name == "STRONG":
-                    self.strong = True
-                elif t.attribute.name == "NORMAL":
-                    self._colorflag = False
-                    self.fg_color = self.default_fg_color
-                    self.bg_color = self.default_bg_color
-                    self.bold = False
-                    self.stroke = False
-                    self.strong = False
-            elif isinstance(t, SetColor):
-                if t.role.name == "FOREGROUND":
-                    if t.color:
-                        self.fg_color = self._cvtColor(t.color)
-                    else:
-                        self.fg_color = self.default_fg_color
-                else:
-                    if t.color:
-                        self.bg_color = self._cvtColor(t.color)
-                    else:
-                        self.bg_color = self.default_bg_color
-        html += "</p><br/>"
-        self.tell({'data':html, 'ts':ts, 'bg_color':self.bg_color, 'fg_color':self.fg_color})
+        source = frame.source
+        html, self._styles[source] = self._cache.convert(frame.data, self._styles.get(source, DEFAULT))
+        self.tell(frame.derive(html))
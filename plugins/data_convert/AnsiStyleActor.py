@@ -0,0 +1,39 @@
+from core.plugintype import ConvertActor
+from core.ansi import DEFAULT, StyledCache
+
+class AnsiStyleActor(ConvertActor):
+    """
+    解析Ansi转义序列, 输出core.ansi.StyledText(纯文本 + 每段的样式), mode为'styled'
+    每段直接带样式元组(前景色, 背景色, 属性), 不依赖本进程的状态, 可以在process模式下运行; 颜色状态按来源跨行保持
+    只解析一次, html, Tk, Qt等前端订阅输出后只做渲染; hex模式的数据直接转发
+    去掉时间戳后相同的行从LRU缓存中取结果, 不再解析
+    /cmd:
+        {'cmd':'reset'}: 所有来源的颜色状态恢复默认
+        {'cmd':'stats'}: 返回缓存的 hits, misses, size, hit_rate, styles(不同样式的个数)
+    """
+    #缓存的行数
+    cache_size = 4096
+
+    def __init__(self):
+        super().__init__()
+        #来源 -> 上一行结束时的样式
+        self._styles = {}
+        self._cache = StyledCache(self.cache_size)
+
+    def on_input(self, frame):
+        if frame.data is None:
+            return
+        if frame.mode == "hex":
+            self.tell(frame)
+            return
+        source = frame.source
+        styled, self._styles[source] = self._cache.convert(frame.data, self._styles.get(source, DEFAULT))
+        self.tell(frame.derive(styled, 'styled'))
+
+    def on_cmd(self, msg):
+        cmd = msg.get('cmd')
+        if cmd == 'reset':
+            self._styles.clear()
+            return True
+        elif cmd == 'stats':
+            return self._cache.stats()
@@ -0,0 +1,20 @@
+from core import plugintype
+from core.framing import CobsDecoder
+
+
+class CobsFramerActor(plugintype.FramerActor):
+    """
+    按COBS分包(0x00为帧结束), 'bad_packet'为CRC或编码错误的帧
+    Output Topic：
+        /CobsFramerActor/output
+    /cmd:
+        {'cmd':'configure', 'crc':None|'crc16'|'crc32', 'max_length':字节数}
+        {'cmd':'stats'}
+    """
+    options = ('crc', 'max_length')
+
+    def __init__(self, crc=None, max_length=4096):
+        super().__init__(crc=crc, max_length=max_length)
+
+    def make_decoder(self, **kwargs):
+        return CobsDecoder(**kwargs)
@@ -0,0 +1,24 @@
+from core import plugintype
+from core.framing import LengthPrefixDecoder
+
+
+class LengthFramerActor(plugintype.FramerActor):
+    """
+    按 同步头 + 长度 + 数据 + CRC 分包, CRC包括长度和数据, 长度不包括CRC, 'bad_packet'为CRC错误的帧
+    Output Topic：
+        /LengthFramerActor/output
+    /cmd:
+        {'cmd':'configure', 'sync':bytes或hex字符串, 'length_size':1|2|4, 'byteorder':'little'|'big',
+         'crc':None|'crc16'|'crc32', 'max_length':字节数}
+        {'cmd':'stats'}
+    """
+    options = ('sync', 'length_size', 'byteorder', 'crc', 'max_length')
+
+    def __init__(self, sync=b'\xaa\x55', length_size=2, byteorder='little', crc='crc16', max_length=4096):
+        super().__init__(sync=sync, length_size=length_size, byteorder=byteorder, crc=crc, max_length=max_length)
+
+    def make_decoder(self, sync=b'\xaa\x55', **kwargs):
+        if isinstance(sync, str):
+            #hex字符串错误时抛出ValueError
+            sync = bytes.fromhex(sync)
+        return LengthPrefixDecoder(sync=sync, **kwargs)
@@ -1,46 +1,133 @@
 from core.plugintype import ConvertActor
-from datetime import datetime
+from core.codec import StreamDecoder
+from core.framing import LineSplitter, IdleGapFramer
+from core.hexdump import HexDumper
+from core.message import Frame
+from core.timestamp import format_ts
 
 
 class LineSegmentActor(ConvertActor):
     """
     将数据分段：
-    1. 文本模式下，按照行来分段，并且增加时间戳
-    2. Hex模式下， 按照时间来分段, 默认50ms
+    1. 文本模式下，按照行来分段，并且增加时间戳; 输入的bytes按来源增量解码为utf-8
+       一行被拆分到多次读取中时, 保存不完整的部分, 只输出完整的行, 时间戳为该行第一个字节到达的时间
+       不完整的行超过line_timeout没有新数据或者超过max_line_length时直接输出
+    2. Hex模式下， 按照数据之间的空闲时间分包, 空闲时间默认根据波特率计算, 使用source读取数据时的时间戳
+       hex_format为'dump'时每包输出时间戳和hexdump -C格式的多行(偏移, hex, ASCII), 为'line'时每包输出一行hex
+    时间戳只在这里格式化为文本, 同一秒内复用日期和秒的部分
     Output Topic：
         /data/segment_data
+    /cmd:
+        {'cmd':'set_mode', 'mode':'text'|'hex', 'gap':秒, 'baudrate':波特率, 'format':'dump'|'line'}:
+            gap, baudrate和format只对hex模式有效
+        {'cmd':'set_line', 'timeout':秒, 'max_length':字节数}
     """
+    #不完整的行等待的最长时间(秒)
+    line_timeout = 0.1
+    #行的最大字节数
+    max_line_length = 4096
+    #hex模式每包的最大字节数
+    max_packet_length = 1024
+    #hex模式的输出格式
+    hex_format = 'dump'
+
     def __init__(self, mode="text"):
         super().__init__()
         self._mode = mode
-        self._last_hex_time = None
-    
-    def on_input(self, msg):
-        if 'data' in msg and 'ts' in msg:
-            self.on_data(msg.get('data'), msg.get('ts'))
-    
+        self._decoder = StreamDecoder()
+        self._splitter = LineSplitter(self.max_line_length, self.line_timeout)
+        self._packer = IdleGapFramer(max_length=self.max_packet_length)
+        self._dumper = HexDumper()
+
+    @property
+    def _framer(self):
+        return self._splitter if self._mode == "text" else self._packer
+
+    def on_input(self, frame):
+        if frame.data:
+            self.on_data(frame)
+
     def on_cmd(self, msg):
         if 'cmd' in msg:
             cmd = msg.get('cmd')
             if cmd == 'set_mode':
+                self._emit(self._framer.flush())
                 self._mode = msg.get('mode')
-    
-    def on_data(self, data, ts):
+                self._decoder.reset()
+                if 'gap' in msg or 'baudrate' in msg:
+                    self._packer.idle_timeout = msg.get('gap') or IdleGapFramer.default_gap(msg.get('baudrate'))
+                if 'format' in msg:
+                    self.hex_format = msg.get('format')
+            elif cmd == 'set_line':
+                self._splitter.idle_timeout = float(msg.get('timeout', self._splitter.idle_timeout))
+                self._splitter.max_length = int(msg.get('max_length', self._splitter.max_length))
+
+    def _emit(self, items):
         if self._mode == "text":
-            #文本模式
-            for line in data.splitlines(keepends=True):
-                #为每行数据增加时间戳
-                line = "\033[32m[" + ts + " \033[0m]" + line
-                self.tell({'data':line, 'ts':ts, 'mode':'text'})
-
-        else :
-            #HEX模式,将数据转为hex string
-            #每隔50ms分段
-            #TODO: 使用component来实现Hex数据的分段
-            if self._last_hex_time:
-                datetime.now() - self._last_hex_time > 0.05
-                self.tell({'data':'\n'+ts, 'ts':ts, 'mode':'hex'})
-            data = data.hex()
-            self.tell({'data':data, 'ts':ts, 'mode':'hex'})
-            self._last_hex_time = datetime.now()
-    
+            self._emit_lines(items)
+        else:
+            self._emit_packets(items)
+
+    def _emit_lines(self, lines):
+        """
+        lines: [(来源, 行, 时间戳), ...]
+        """
+        head_ts = None
+        for source, line, ts in lines:
+            if ts != head_ts:
+                #同一次读取的行时间戳相同, 只格式化一次
+                head = "\033[32m[" + format_ts(ts) + " \033[0m]"
+                head_ts = ts
+            #为每行数据增加时间戳
+            self.tell(Frame(head + self._decoder.decode(source, line), source, ts, 'text'))
+
+    def _emit_packets(self, packets):
+        """
+        packets: [(来源, 包, 时间戳), ...], 每包一次转为hex
+        """
+        if self.hex_format == 'dump':
+            dumps = self._dumper.dump_many([packet for _, packet, _ in packets])
+            for (source, packet, ts), dump in zip(packets, dumps):
+                self.tell(Frame("[" + format_ts(ts) + "] %d bytes\n" % len(packet) + dump, source, ts, 'hex'))
+        else:
+            for source, packet, ts in packets:
+                self.tell(Frame("[" + format_ts(ts) + "] " + packet.hex(' ') + "\n", source, ts, 'hex'))
+
+    def _wait_timeout(self):
+        timeout = super()._wait_timeout()
+        framer = self._framer
+        #融合执行时数据在上游线程中处理, 有不完整的行时由receive_inline唤醒本actor线程
+        pending = framer.next_timeout()
+        if pending is not None and (timeout is None or pending < timeout):
+            timeout = pending
+        return timeout
+
+    def _on_idle(self):
+        self._emit(self._framer.expire())
+        super()._on_idle()
+
+    def on_stop(self):
+        self._emit(self._framer.flush())
+        self.flush()
+        super().on_stop()
+
+    def on_input_batch(self, frames):
+        #一批输入分出的行或包一起输出, hex模式下的小包可以一起格式化
+        items = []
+        for frame in frames:
+            if frame.data:
+                items += self._feed(frame)
+        if items:
+            self._emit(items)
+
+    def on_data(self, frame):
+        items = self._feed(frame)
+        if items:
+            self._emit(items)
+
+    def _feed(self, frame):
+        data = frame.data
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        source = frame.source
+        return [(source, item, ts) for item, ts in self._framer.feed(source, data, frame.ts)]
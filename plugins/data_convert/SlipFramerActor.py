@@ -0,0 +1,20 @@
+from core import plugintype
+from core.framing import SlipDecoder
+
+
+class SlipFramerActor(plugintype.FramerActor):
+    """
+    按SLIP(RFC 1055)分包, 'bad_packet'为CRC或转义错误的帧
+    Output Topic：
+        /SlipFramerActor/output
+    /cmd:
+        {'cmd':'configure', 'crc':None|'crc16'|'crc32', 'max_length':字节数}
+        {'cmd':'stats'}
+    """
+    options = ('crc', 'max_length')
+
+    def __init__(self, crc=None, max_length=4096):
+        super().__init__(crc=crc, max_length=max_length)
+
+    def make_decoder(self, **kwargs):
+        return SlipDecoder(**kwargs)
@@ -1,26 +1,149 @@
 import re
+import time
+from operator import attrgetter
+import numpy as np
 from core.plugintype import ConvertActor
-from dataclasses import dataclass
+from core.columns import Column
+from core.ansi import strip
+
+#key=value中的数值: 整数, 小数, 科学计数法
+NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?'
+
+_get_ts = attrgetter('ts')
+
+
+def _to_float(value):
+    """
+    自定义的正则匹配到的不是十进制数时, 尝试按0x/0o/0b解析, 失败返回nan
+    """
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return float(int(value, 0))
+        except ValueError:
+            return float('nan')
 
-@dataclass
-class Word:
-    ts_str: str
-    ts: int
-    word: str 
-    val:[]
 
 class TextWordConvert(ConvertActor):
-    def __init__(self):
+    """
+    从文本行中提取数值, 按(来源, key)保存到core.columns.Column, 用于跟踪日志中的传感器数值
+    一批行拼接成一个字符串, 每个key的正则在整批上匹配一次, 匹配位置通过行首偏移找到所在行的时间戳
+    输入可以是LineSegmentActor的文本(匹配前去掉转义序列), 或者AnsiStyleActor的StyledText; hex模式的数据忽略
+    不发布输出, 通过/cmd的query取数值
+    /cmd:
+        {'cmd':'add', 'key':..., 'pattern':正则(可选)}: 没有pattern时匹配 key=数值 或 key: 数值,
+            pattern需要有一个捕获组为数值
+        {'cmd':'remove', 'key':...}
+        {'cmd':'keys'}: 返回{key: pattern}
+        {'cmd':'query', 'key':..., 'source':..., 'start':ns, 'end':ns, 'last':秒}:
+            返回{来源: (ts数组, 数值数组)}, 不指定source时返回所有来源, last表示最近多少秒
+        {'cmd':'clear'}: 清空所有数据
+    """
+    #每列最多保存的数值个数
+    max_samples = 1 << 24
+
+    def __init__(self, keys=None):
         super().__init__()
-    
-    def on_input(self, msg):
-        if 'data' in msg and 'ts' in msg:
-            self.process_line(msg.get('data'), msg.get('ts'))
-    
-    def on_cmd(self, msg):
-        pass
-    
-    def process_line(self, line, ts):
-        #将一行文本分解为单词
-        #单词可以用空格，逗号，分号分隔
+        #key -> 编译后的正则
+        self._patterns = {}
+        #(来源, key) -> Column
+        self._columns = {}
+        for key in keys or ():
+            self.add_key(key)
+
+    def add_key(self, key, pattern=None):
+        if pattern is None:
+            #只匹配行内的空白, 不会跨过拼接时的'\n'匹配到下一行
+            pattern = rf'(?<![\w.]){re.escape(key)}[ \t]*[=:][ \t]*({NUMBER})'
+        compiled = re.compile(pattern)
+        if compiled.groups < 1:
+            raise ValueError(f'pattern of {key} has no capture group')
+        self._patterns[key] = compiled
 
+    def on_input(self, frame):
+        self.on_input_batch([frame])
+
+    def on_input_batch(self, frames):
+        if not self._patterns:
+            return
+        frames = [frame for frame in frames if frame.data is not None and frame.mode != 'hex']
+        if not frames:
+            return
+        source = frames[0].source
+        if all(frame.source == source for frame in frames):
+            self.process_lines(source, frames)
+            return
+        groups = {}
+        for frame in frames:
+            groups.setdefault(frame.source, []).append(frame)
+        for source, group in groups.items():
+            self.process_lines(source, group)
+
+    def process_lines(self, source, frames):
+        """
+        提取同一个来源的一批行中的数值
+        """
+        texts = [self._text(frame.data) for frame in frames]
+        blob = '\n'.join(texts)
+        #每行的起始偏移
+        lengths = np.fromiter(map(len, texts), np.int64, len(texts)) + 1
+        starts = np.cumsum(lengths) - lengths
+        ts = np.fromiter(map(_get_ts, frames), np.int64, len(frames))
+        for key, pattern in self._patterns.items():
+            found = [(m.start(1), m.group(1)) for m in pattern.finditer(blob)]
+            if not found:
+                continue
+            positions, values = zip(*found)
+            line = np.searchsorted(starts, positions, 'right') - 1
+            try:
+                values = np.array(values, dtype=np.float64)
+            except ValueError:
+                values = np.array([_to_float(v) for v in values], dtype=np.float64)
+            column = self._columns.get((source, key))
+            if column is None:
+                column = self._columns[(source, key)] = Column(max_length=self.max_samples)
+            column.extend(ts[line], values)
+
+    @staticmethod
+    def _text(data):
+        #LineSegmentActor输出的行带有时间戳和颜色的转义序列, 会打断key=数值
+        if isinstance(data, str):
+            return strip(data)
+        if isinstance(data, (bytes, bytearray)):
+            return strip(data.decode('utf-8', 'ignore'))
+        #AnsiStyleActor的StyledText
+        return data.text
+
+    def query(self, key, source=None, start=None, end=None):
+        result = {}
+        for (column_source, column_key), column in self._columns.items():
+            if column_key == key and (source is None or column_source == source):
+                result[column_source] = column.query(start, end)
+        return result
+
+    def on_cmd(self, msg):
+        cmd = msg.get('cmd')
+        if cmd == 'add':
+            try:
+                self.add_key(msg['key'], msg.get('pattern'))
+            except (KeyError, re.error, ValueError) as e:
+                self.logger.error("add key failed: %s", e)
+                return False
+            return True
+        elif cmd == 'remove':
+            key = msg.get('key')
+            self._patterns.pop(key, None)
+            for column_key in [k for k in self._columns if k[1] == key]:
+                del self._columns[column_key]
+            return True
+        elif cmd == 'keys':
+            return {key: pattern.pattern for key, pattern in self._patterns.items()}
+        elif cmd == 'query':
+            start = msg.get('start')
+            if msg.get('last') is not None:
+                start = time.monotonic_ns() - int(msg['last'] * 1e9)
+            return self.query(msg.get('key'), msg.get('source'), start, msg.get('end'))
+        elif cmd == 'clear':
+            self._columns.clear()
+            return True
@@ -1,26 +1,187 @@
 from typing import Any
-import pylink
 import time
-from datetime import datetime
+import pylink
 from core.plugintype import SourceActor
+from core.message import Frame
+from core.topics import TOPIC_STATS_RTT
+
+class _Channel:
+    """
+    一个RTT up buffer
+    """
+    __slots__ = ('index', 'name', 'size', 'topic', 'bytes')
+
+    def __init__(self, index, name, size, topic):
+        self.index = index
+        self.name = name
+        #读一次的字节数
+        self.size = size
+        self.topic = topic
+        self.bytes = 0
+
 
 class JLinkRttSourceActor(SourceActor):
+    """
+    读取JLink RTT所有up buffer的数据
+    找到RTT控制块后查询所有up buffer, 在同一个循环中轮流读取:
+        buffer 0(通常是文本日志)发布到/JLinkRttSourceActor/output, 和之前一样connect到LineSegmentActor
+        buffer n发布到/JLinkRttSourceActor/output/<n>, 二进制数据可以不经过文本处理
+        订阅/JLinkRttSourceActor/output*可以收到所有buffer的数据
+    每次poll连续读取每个buffer直到为空, 每次poll从下一个buffer开始, 数据多的buffer不会让其他buffer一直读不到
+    根据读到的数据量调整poll间隔:
+        读满一次buffer: 立即再次poll
+        有数据: 间隔减半, 最小min_interval
+        没有数据: 间隔加倍, 最大max_interval
+    定期在TOPIC_STATS_RTT上发布吞吐量和JLink主机端的overflow统计, /cmd {'cmd':'stats'}也返回统计
+    """
+    #最短/最长poll间隔(秒)
+    min_interval = 0.001
+    max_interval = 0.5
+    #每次poll最多读取的字节数, 避免一直读不处理/cmd
+    max_read_per_poll = 1 << 20
+    #统计发布间隔(秒)
+    stats_interval = 1.0
+    #找到控制块之前buffer 0每次读取的字节数
+    default_read_size = 4096
+    #创建JLink对象, 测试时可以替换为假的JLink
+    jlink_class = pylink.JLink
+
     def __init__(self, target=None):
-        self._timeout = 0.5
+        self._timeout = self.max_interval
         super().__init__(timeout=self._timeout, block=False)
         self._target = target
         self._jlink = None
-    
-    def on_poll(self) -> None:
-        if self._jlink : #and  self._jlink.connected():
-            data = self._jlink.rtt_read(0, 1024)
-            data = bytes(data).decode('utf-8', errors='ignore')
-            now = datetime.now().strftime("%m-%d %H:%M:%S.%f")[:-3]
-            if data:
-                self.tell({'data':data, 'ts':now})
+        self._reset_channels()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.bytes_read = 0
+        self.reads = 0
+        self.host_overflows = 0
+        self._stats_time = time.monotonic()
+        self._stats_bytes = 0
+        self._stats_snapshot = None
+
+    def _reset_channels(self):
+        #找到控制块之前只读buffer 0
+        self._channels = [_Channel(0, None, self.default_read_size, None)]
+        self._channels_probed = False
+        #下一次poll第一个读取的buffer
+        self._next_channel = 0
+
+    def channel_topic(self, index):
+        """
+        up buffer index的输出topic
+        """
+        output = self.data_output_topic()
+        return output if index == 0 else f'{output}/{index}'
+
+    def on_poll(self) -> bool:
+        if not self._jlink : #and  self._jlink.connected():
+            return False
+        if not self._channels_probed:
+            self._probe_channels()
+        total = 0
+        full = False
+        channels = self._channels
+        start = self._next_channel % len(channels)
+        self._next_channel = start + 1
+        try:
+            for channel in channels[start:] + channels[:start]:
+                nbytes = self._read_channel(channel, self.max_read_per_poll - total)
+                total += nbytes
+                if nbytes >= channel.size:
+                    full = True
+                if total >= self.max_read_per_poll:
+                    break
+        except pylink.errors.JLinkException as e:
+            self.logger.warning("rtt read failed: %s", e)
+            self.timeout = self.max_interval
+            return False
+        self._adapt(total, full)
+        self._update_stats()
+        return total >= self.max_read_per_poll
+
+    def _read_channel(self, channel, limit):
+        """
+        读取一个up buffer直到为空或者超过limit, 作为一个Frame发布, 返回读到的字节数
+        """
+        chunks = []
+        total = 0
+        while total < limit:
+            data = self._jlink.rtt_read(channel.index, channel.size)
+            self.reads += 1
+            if not data:
+                break
+            chunks.append(bytes(data))
+            total += len(data)
+            if len(data) < channel.size:
+                break
+        if total:
+            channel.bytes += total
+            self.bytes_read += total
+            frame = Frame.now(b''.join(chunks), self._target)
+            if channel.index == 0:
+                self.tell(frame)
+            else:
+                self.topic_manager.tell(channel.topic, frame)
+        return total
+
+    def _probe_channels(self):
+        try:
+            count = self._jlink.rtt_get_num_up_buffers()
+            descs = [self._jlink.rtt_get_buf_descriptor(i, True) for i in range(count)]
+        except pylink.errors.JLinkException:
+            #rtt_start之后可能还没有找到控制块
+            return
+        channels = []
+        for i, desc in enumerate(descs):
+            name = desc.acName
+            if isinstance(name, bytes):
+                name = name.decode('utf-8', 'ignore')
+            size = max(desc.SizeOfBuffer, self.default_read_size)
+            channels.append(_Channel(i, name, size, self.channel_topic(i)))
+        if channels:
+            self._channels = channels
+        self._channels_probed = True
+        self.logger.info("rtt up buffers: %s", [(c.index, c.name, c.size) for c in self._channels])
+
+    def _adapt(self, nbytes, full=False):
+        """
+        根据本次读到的数据量调整poll间隔
+        """
+        if full:
+            self.timeout = self.min_interval
+        elif nbytes:
+            self.timeout = max(self.timeout / 2, self.min_interval)
         else:
-            time.sleep(self._timeout)
-    
+            self.timeout = min(self.timeout * 2, self.max_interval)
+
+    def _update_stats(self, force=False):
+        now = time.monotonic()
+        interval = now - self._stats_time
+        if not force and interval < self.stats_interval:
+            return
+        try:
+            status = self._jlink.rtt_get_status()
+            #JLink主机端缓存的溢出次数, 不是目标板上RTT buffer满丢弃数据的次数
+            self.host_overflows = status.HostOverflowCount
+        except pylink.errors.JLinkException:
+            pass
+        self._stats_snapshot = {
+            'actor': self.__class__.__name__,
+            'target': self._target,
+            'bytes': self.bytes_read,
+            'reads': self.reads,
+            'bytes_per_s': (self.bytes_read - self._stats_bytes) / max(interval, 1e-9),
+            'host_overflows': self.host_overflows,
+            'interval': self.timeout,
+            'channels': {c.index: {'name': c.name, 'bytes': c.bytes} for c in self._channels},
+        }
+        self._stats_time = now
+        self._stats_bytes = self.bytes_read
+        self.topic_manager.tell(TOPIC_STATS_RTT, self._stats_snapshot)
+
     def on_cmd(self, msg):
         if 'cmd' not in msg:
             return
@@ -28,14 +189,22 @@ class JLinkRttSourceActor(SourceActor):
         if cmd == 'open':
             self._target = msg['target']
             if not self._jlink:
-                self._jlink = pylink.JLink()
+                self._jlink = self.jlink_class()
             self._jlink.open()
             self._jlink.set_tif(pylink.enums.JLinkInterfaces.SWD)
             self._jlink.connect(self._target)
             self._jlink.rtt_start()
+            self._reset_channels()
+            self._reset_stats()
+            self.timeout = self.min_interval
         elif cmd == 'close':
             if self._jlink and self._jlink.opened():
                 self._jlink.rtt_stop()
                 self._jlink.close()
                 self._jlink = None
+            self.timeout = self.max_interval
+        elif cmd == 'stats':
+            if self._jlink:
+                self._update_stats(force=True)
+            return self._stats_snapshot
 
@@ -0,0 +1,171 @@
+import mmap
+import os
+import time
+from core.plugintype import SourceActor
+from core.message import Frame
+from core.capture import is_capture, iter_records
+from core.timestamp import TimestampFormatter, NS_PER_SEC
+
+
+class ReplaySourceActor(SourceActor):
+    """
+    回放录制文件(core.capture格式, 或者没有时间戳的原始bytes), 发布的Frame和SerialSourceActor相同
+    Frame.ts为回放时的时间(按speed换算录制时的间隔, speed为0时为发布时间), 和实时数据一样可以与monotonic_ns比较,
+    分帧的超时不会把回放的不完整行当成已经超时; 录制时的时间只通过stats的position显示
+    文件通过mmap读取, 可以回放GB级的文件
+    /cmd:
+        {'cmd':'open', 'file':..., 'speed':0, 'loop':False, 'source':...}: 开始回放
+            speed: 0表示尽快回放, 1表示按录制时的时间回放, N表示N倍速
+            source: Frame.source, 默认为文件名
+        {'cmd':'set_speed', 'speed':...}: 修改回放速度
+        {'cmd':'close'}: 停止回放
+        {'cmd':'stats'}: 返回已回放的记录数和字节数, position为最后回放的记录录制时的时间
+    """
+    #每次poll最多发布的记录数, 避免一直发布不处理/cmd
+    max_records_per_poll = 256
+    #原始bytes文件每条记录的大小
+    raw_chunk_size = 65536
+    #没有回放时的poll间隔
+    idle_timeout = 0.1
+
+    def __init__(self):
+        super().__init__(timeout=self.idle_timeout, block=False)
+        self._file = None
+        self._mm = None
+        self._records = None
+        self._next = None
+        self._clock = TimestampFormatter()
+        self.filename = None
+        self.source = None
+        self.speed = 0
+        self.loop = False
+        self.records = 0
+        self.bytes = 0
+        #最后回放的记录录制时的时间(epoch ns)
+        self._position = None
+
+    def _iter_raw(self):
+        size = len(self._mm)
+        for start in range(0, size, self.raw_chunk_size):
+            stop = min(start + self.raw_chunk_size, size)
+            yield stop, None, start, stop
+
+    def _rewind(self):
+        if is_capture(self._mm):
+            self._records = iter_records(self._mm)
+        else:
+            self._records = self._iter_raw()
+        self._next = next(self._records, None)
+        self._rebase()
+
+    def _rebase(self):
+        """
+        以下一条记录为起点重新计算回放时间
+        """
+        self._start = time.monotonic_ns()
+        self._first_ts = self._next[1] if self._next else None
+
+    def _due(self, ts):
+        """
+        记录应该发布的时间(monotonic ns), 没有时间戳或者尽快回放时返回None
+        """
+        if not self.speed or ts is None or self._first_ts is None:
+            return None
+        return self._start + int((ts - self._first_ts) / self.speed)
+
+    def on_poll(self) -> bool:
+        if self._next is None:
+            return False
+        frames = []
+        now = time.monotonic_ns()
+        wait = None
+        mm = self._mm
+        position = None
+        while self._next is not None and len(frames) < self.max_records_per_poll:
+            _, ts, start, stop = self._next
+            due = self._due(ts)
+            if due is not None and due > now:
+                wait = due - now
+                break
+            #按回放时钟发布, 尽快回放时为当前时间
+            frames.append(Frame(mm[start:stop], self.source, now if due is None else due))
+            if ts is not None:
+                position = ts
+            self.bytes += stop - start
+            self._next = next(self._records, None)
+        self.records += len(frames)
+        if position is not None:
+            self._position = position
+        if frames:
+            self.tell_batch(frames)
+        if self._next is None:
+            self._on_end()
+            return False
+        if wait is not None:
+            self.timeout = wait / NS_PER_SEC
+            return False
+        self.timeout = self.idle_timeout
+        return True
+
+    def _on_end(self):
+        self.logger.info("replay %s done: %d records, %d bytes", self.filename, self.records, self.bytes)
+        if self.loop:
+            self._rewind()
+        else:
+            self.timeout = self.idle_timeout
+
+    def on_open(self, message):
+        self.on_close(message)
+        filename = message.get('file')
+        try:
+            self._file = open(filename, 'rb')
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            self.logger.error("open replay file failed: %s", e)
+            self.on_close(message)
+            return False
+        if hasattr(self._mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self._mm.madvise(mmap.MADV_SEQUENTIAL)
+        self.filename = filename
+        self.source = message.get('source', os.path.basename(filename))
+        self.speed = float(message.get('speed', 0))
+        self.loop = bool(message.get('loop', False))
+        self.records = 0
+        self.bytes = 0
+        self._position = None
+        self._rewind()
+        return True
+
+    def on_close(self, message):
+        self._records = None
+        self._next = None
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.timeout = self.idle_timeout
+        return True
+
+    def on_stop(self):
+        self.on_close({})
+
+    def on_cmd(self, msg):
+        if 'cmd' not in msg:
+            return None
+        cmd = msg['cmd']
+        if cmd == 'open':
+            return self.on_open(msg)
+        elif cmd == 'close':
+            return self.on_close(msg)
+        elif cmd == 'set_speed':
+            self.speed = float(msg.get('speed', 0))
+            self._rebase()
+            return True
+        elif cmd == 'stats':
+            position = self._position
+            if position is not None:
+                position = self._clock.format(position - self._clock.offset)
+            return {'file': self.filename, 'records': self.records, 'bytes': self.bytes,
+                    'done': self._next is None, 'position': position}
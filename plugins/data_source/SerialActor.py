@@ -1,23 +1,133 @@
 from core.plugintype import SourceActor
-import time, serial
-from datetime import datetime
+from core.message import Frame
+import serial
 import logging
+import os
+
+
+class _Port:
+    """
+    一个打开的串口
+    """
+    __slots__ = ('name', 'serial', 'fd', 'head', 'out', 'sent', 'dropped', 'received')
+
+    def __init__(self, name, ser):
+        self.name = name
+        self.serial = ser
+        self.fd = ser.fileno() if hasattr(ser, 'fileno') else None
+        #没有fd时wait_readable阻塞读到的字节
+        self.head = b''
+        #等待发送的数据, 多次write合并到一起发送
+        self.out = bytearray()
+        self.sent = 0
+        self.dropped = 0
+        self.received = 0
+
+    def send(self, limit):
+        """
+        不阻塞地发送out中的数据, 最多limit字节, 返回发送的字节数
+        流控(RTS/CTS, XON/XOFF)由驱动处理, 对方暂停接收时写不进去, 数据留在out中
+        """
+        view = memoryview(self.out)[:limit]
+        try:
+            if self.fd is not None:
+                n = os.write(self.fd, view)
+            else:
+                #write_timeout=0, 不阻塞, 返回写入的字节数
+                n = self.serial.write(view) or 0
+        except BlockingIOError:
+            n = 0
+        finally:
+            view.release()
+        if n:
+            del self.out[:n]
+            self.sent += n
+        return n
+
+    def stats(self):
+        return {'queued': len(self.out), 'sent': self.sent, 'dropped': self.dropped, 'received': self.received}
+
 
 class SerialSourceActor(SourceActor):
+    """
+    同时读取多个串口, 所有串口在同一个actor线程中通过selector等待可读
+    发布的Frame.source为串口名
+    /cmd:
+        {'cmd':'open', 'port':..., 'baudrate':..., 'timeout':..., 'rtscts':False, 'xonxoff':False}: 打开串口, 已经打开则重新打开
+        {'cmd':'close', 'port':...}: 关闭串口, 不指定port时关闭所有串口
+        {'cmd':'write', 'port':..., 'data':...}: 写数据, 不指定port时写到最后打开的串口
+        {'cmd':'stats'}: 返回每个串口的 queued(等待发送), sent, dropped(队列满丢弃), received 字节数
+    写数据只是放入队列, 和读在同一个循环中等待可写时不阻塞地发送, 不会延迟读
+    """
+    #每个串口等待发送的最大字节数, 超过时write返回False
+    write_queue_limit = 1 << 20
+    #每次最多发送的字节数
+    write_chunk = 65536
+
     def __init__(self):
         super().__init__(timeout=0.01, block=False)
+        #最后打开的串口, 作为不指定port时的默认串口
         self.port = None
         self.baudrate = 115200
-        self.serial = None
-
-    def on_poll(self) -> None:
-        if self.serial and self.serial.is_open and self.serial.in_waiting:
-            data = self.serial.read(self.serial.in_waiting).decode('utf-8', errors='ignore')
-            #发布消息，topic为/serial/read data为data ts为当前时间戳
-            now = datetime.now().strftime("%m-%d %H:%M:%S.%f")[:-3]
-            self.tell({'port':self.port,'data': data, 'ts': now})
-        else:
-           time.sleep(self.timeout)
+        self.ports = {}
+
+    @property
+    def serial(self):
+        port = self.ports.get(self.port)
+        return port.serial if port else None
+
+    def on_poll(self) -> bool:
+        busy = False
+        for port in self.ports.values():
+            if port.out:
+                port.send(self.write_chunk)
+            ser = port.serial
+            if port.head or ser.in_waiting:
+                #发布原始bytes, 需要文本的actor自己解码
+                data = port.head + ser.read(ser.in_waiting)
+                port.head = b''
+                port.received += len(data)
+                #发布消息，source为串口名 ts为当前时间戳
+                self.tell(Frame.now(data, port.name))
+                busy = True
+        return busy
+
+    def poll_filenos(self):
+        fds = []
+        for port in self.ports.values():
+            if port.fd is None:
+                return ()
+            fds.append(port.fd)
+        return fds
+
+    def poll_write_filenos(self):
+        return [port.fd for port in self.ports.values() if port.out and port.fd is not None]
+
+    def wait_readable(self, timeout):
+        ret = super().wait_readable(timeout)
+        if ret is not None or len(self.ports) != 1:
+            #多个串口没有fd时, 由actor loop定时调用on_poll
+            return ret
+        port = next(iter(self.ports.values()))
+        if port.out:
+            #有数据等待发送, 不能阻塞在读上
+            return None
+        #只有一个串口且没有fd(如Windows), 阻塞读1个字节, 有数据立即返回, 最多等待串口的timeout
+        port.head = port.serial.read(1)
+        return bool(port.head)
+
+    def _wait_timeout(self):
+        if not self.ports:
+            #没有打开的串口, 只等待inbox中的命令
+            return self._flush_timeout()
+        return super()._wait_timeout()
+
+    def _close_port(self, name):
+        port = self.ports.pop(name, None)
+        if port and port.serial.is_open:
+            port.serial.close()
+        if name == self.port:
+            self.port = next(reversed(self.ports), None)
 
     def on_open(self, message):
         """
@@ -28,32 +138,51 @@ class SerialSourceActor(SourceActor):
                 baudrate: 波特率
                 timeout: float
         """
-        if self.serial and self.serial.is_open:
-            self.serial.close()
-            self.serial = None
-        self.port = message.get('port')
-        self.baudrate = message.get('baudrate')
-        self.timeout = message.get('timeout', self.timeout)
+        name = message.get('port')
+        self._close_port(name)
+        baudrate = message.get('baudrate', self.baudrate)
+        timeout = message.get('timeout', self.timeout)
         try:
-            self.serial = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
+            ser = serial.Serial(name, baudrate, timeout=timeout, write_timeout=0,
+                                rtscts=bool(message.get('rtscts', False)),
+                                xonxoff=bool(message.get('xonxoff', False)))
         except Exception as e:
             self.logger.error("open serial port failed: %s", e)
-            self.serial = None
             return False
+        self.ports[name] = _Port(name, ser)
+        self.port = name
+        self.baudrate = baudrate
         return True
 
     def on_close(self, message):
-        if self.serial and self.serial.is_open:
-            self.serial.close()
-        self.serial = None
+        name = message.get('port')
+        if name is None:
+            for name in list(self.ports):
+                self._close_port(name)
+        else:
+            self._close_port(name)
         return True
 
     def on_write(self, message):
-        if self.serial and self.serial.is_open:
-            data = message.get('data')
-            self.serial.write(data)
-            return True
-        return False
+        """
+        将数据放入发送队列并尝试立即发送, 返回是否放入队列
+        """
+        port = self.ports.get(message.get('port', self.port))
+        if not (port and port.serial.is_open):
+            return False
+        data = message.get('data')
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if len(port.out) + len(data) > self.write_queue_limit:
+            port.dropped += len(data)
+            self.logger.warning("write queue of %s is full, drop %d bytes", port.name, len(data))
+            return False
+        port.out += data
+        port.send(self.write_chunk)
+        return True
+
+    def on_stop(self):
+        self.on_close({})
 
     def on_cmd(self, msg):
         if 'cmd' not in msg:
@@ -65,6 +194,10 @@ class SerialSourceActor(SourceActor):
             return self.on_close(msg)
         elif cmd == 'write':
             return self.on_write(msg)
-    
+        elif cmd == 'stats':
+            return {name: port.stats() for name, port in self.ports.items()}
+
     def on_input(self, msg):
+        if isinstance(msg, Frame):
+            msg = {'data': msg.data}
         self.on_write(msg)
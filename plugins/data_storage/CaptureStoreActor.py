@@ -0,0 +1,89 @@
+from core.plugintype import StorageActor
+from core.capture import CaptureWriter
+from core.message import unpack
+
+
+class CaptureStoreActor(StorageActor):
+    """
+    录制source发布的原始bytes到core.capture格式的文件, 可以用ReplaySourceActor回放
+    只在录制时订阅source的输出topic, 不录制时不影响流水线(如融合)
+    录制文件不保存Frame.source, 多个串口同时打开时用source只录制一个串口
+    直接订阅source的输出, inbox不能阻塞(会延迟source读数据), 写盘跟不上时合并或丢弃最旧的数据, 丢弃数计入dropped
+    /cmd:
+        {'cmd':'open', 'filename':..., 'source':只录制该来源(可选), 'topics':订阅的topic(可选)}
+        {'cmd':'close'}
+        {'cmd':'stats'}: 返回 filename, records, bytes, dropped(inbox丢弃的Frame数)
+    """
+    #默认录制的source输出topic
+    source_topics = ('/SerialSourceActor/output', '/JLinkRttSourceActor/output')
+
+    def __init__(self):
+        super().__init__()
+        self._writer = None
+        self._source = None
+        self._topics = ()
+        self.filename = None
+        self.records = 0
+        self.bytes = 0
+
+    def on_StartRecord(self, filename, source=None, topics=None):
+        if not filename:
+            return False
+        self.on_StopRecord()
+        try:
+            self._writer = CaptureWriter(filename)
+        except OSError as e:
+            self.logger.error("open capture %s failed: %s", filename, e)
+            return False
+        self.filename = filename
+        self._source = source
+        self.records = 0
+        self.bytes = 0
+        self._topics = tuple(topics or self.source_topics)
+        for topic in self._topics:
+            self.add_sub_topic(topic)
+        return True
+
+    def on_StopRecord(self):
+        for topic in self._topics:
+            self.remove_sub_topic(topic)
+        self._topics = ()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self.filename = None
+
+    def on_cmd(self, msg):
+        cmd = msg.get('cmd')
+        if cmd == 'open':
+            return self.on_StartRecord(msg.get('filename'), msg.get('source'), msg.get('topics'))
+        elif cmd == 'close':
+            self.on_StopRecord()
+            return True
+        elif cmd == 'stats':
+            return {'filename': self.filename, 'records': self.records, 'bytes': self.bytes,
+                    'dropped': self.actor_inbox.dropped}
+
+    def on_receive(self, message):
+        #source的输出topic不以/input结尾, 所有数据消息都按输入处理
+        topic, frames = unpack(message)
+        if topic is not None:
+            return self.on_input_batch(frames)
+        return super().on_receive(message)
+
+    def on_input(self, frame):
+        self.on_input_batch((frame,))
+
+    def on_input_batch(self, frames):
+        writer = self._writer
+        if writer is None:
+            return
+        source = self._source
+        for frame in frames:
+            data = frame.data
+            if not isinstance(data, (bytes, bytearray)) or (source is not None and frame.source != source):
+                continue
+            writer.write(frame.ts, data)
+            self.records += 1
+            self.bytes += len(data)
+        writer.f.flush()
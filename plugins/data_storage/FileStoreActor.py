@@ -5,6 +5,9 @@ class FileStoreActor(StorageActor):
     """
         保存数据(DisplayData)到文件,
         文件格式：串口名_时间戳.log
+        /cmd:
+            {'cmd':'open', 'filename':..., 'header':写在文件开头的内容(可选)}
+            {'cmd':'close'}
     """
     def __init__(self): 
         super().__init__()
@@ -12,13 +15,16 @@ class FileStoreActor(StorageActor):
         self._filename = None
         self._ts = time.time()
     
-    def on_StartRecord(self, filename):
+    def on_StartRecord(self, filename, header=None):
         if not filename:
             return   
         if self.f is not None:
             self.f.close()
         self._filename = filename
         self.f = open(filename, "w", encoding="utf-8")
+        if header:
+            #如html文件的css
+            self.f.write(header)
     
     def on_StopRecord(self):
         if self.f is not None:
@@ -35,9 +41,16 @@ class FileStoreActor(StorageActor):
     def on_cmd(self, msg):
         cmd = msg.get('cmd')
         if cmd == 'open':
-            self.on_StartRecord(msg.get('filename'))
+            self.on_StartRecord(msg.get('filename'), msg.get('header'))
         elif cmd == 'close':
             self.on_StopRecord()
 
-    def on_input(self, msg):
-        self.on_DisplayData(msg.get('data')) 
+    def on_input(self, frame):
+        self.on_DisplayData(frame.data)
+
+    def on_input_batch(self, frames):
+        #一批数据只flush一次
+        if self.f is None:
+            return
+        self.f.writelines(frame.data for frame in frames)
+        self.f.flush() 
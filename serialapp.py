@@ -1,9 +1,12 @@
 import serial.tools.list_ports
 from datetime import datetime
 from core.manager import TopicManager, MyConfigurablePluginManager
+from core.aio import use_asyncio_runtime
 from nicegui import ui, app
 import logging
 from core.plugintype import ConvertActor, SourceActor, StorageActor, FilterActor, HighlightActor 
+from core.message import unpack
+from core.ansi import STYLE_TAG
 from configparser import ConfigParser
 
 class SerialUI(object):
@@ -28,6 +31,11 @@ class SerialUI(object):
         self.config_parser = ConfigParser()
         self.config_file = 'app.ini'
         self.config_parser.read(self.config_file)
+        #[app] capture = true时打开串口同时录制原始数据(.sscap), 可以用ReplaySourceActor回放
+        self.capture = self.config_parser.getboolean('app', 'capture', fallback=False)
+        #[app] runtime = asyncio: 所有actor在一个asyncio事件循环中运行
+        if self.config_parser.get('app', 'runtime', fallback='thread') == 'asyncio':
+            use_asyncio_runtime()
         self.plugin_manager = MyConfigurablePluginManager(
             configparser_instance=self.config_parser,
             categories_filter={
@@ -46,11 +54,14 @@ class SerialUI(object):
         m = TopicManager.singleton()
         m.subscribe('/Ansi2HtmlConverter/output', self)
         #将各个actor的topic串联起来
-        #SerialSource/output -> LineSegment/input, LineSegment/output -> AnsiConvert/input, AnsiConvert/output -> FileStore/input
+        #SerialSource/output -> LineSegment/input, LineSegment/output -> AnsiStyle/input, AnsiStyle/output -> AnsiConvert/input, AnsiConvert/output -> FileStore/input
         m.connect(self.plugin_manager.getActorByName('SerialSourceActor', "Source"), self.plugin_manager.getActorByName('LineSegmentActor', "Convert"))
-        m.connect(self.plugin_manager.getActorByName('LineSegmentActor', "Convert"), self.plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"))
+        m.connect(self.plugin_manager.getActorByName('LineSegmentActor', "Convert"), self.plugin_manager.getActorByName('AnsiStyleActor', "Convert"))
+        m.connect(self.plugin_manager.getActorByName('AnsiStyleActor', "Convert"), self.plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"))
         m.connect(self.plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"), self.plugin_manager.getActorByName('FileStoreActor', "Storage"))
         m.connect(self.plugin_manager.getActorByName('JLinkRttSourceActor', "Source"), self.plugin_manager.getActorByName('LineSegmentActor', "Convert"))
+        #单生产者/单消费者的actor在上游线程中直接执行
+        m.enable_fusion()
 
 
         self.jlink_target = None
@@ -58,6 +69,8 @@ class SerialUI(object):
         self._enable_scroll = True
         self._context_menu_open = False
         #setup ui
+        #Ansi2HtmlConverter输出的css class
+        ui.add_head_html(STYLE_TAG)
         ui.keyboard(on_key=self.onKey)
         self.topTabs = ui.tabs().classes('w-full')
         self.tabs = []
@@ -135,6 +148,9 @@ class SerialUI(object):
         m = TopicManager.singleton()
         self.plugin_manager.activatePluginByName('LineSegmentActor', "Convert", save_state=False)
         self.plugin_manager.activatePluginByName('FileStoreActor', "Storage", save_state=False)
+        if self.capture:
+            self.plugin_manager.activatePluginByName('CaptureStoreActor', "Storage", save_state=False)
+        self.plugin_manager.activatePluginByName('AnsiStyleActor', "Convert", save_state=False)
         self.plugin_manager.activatePluginByName('Ansi2HtmlConverter', "Convert", save_state=False)
         if self.port == 'JLink':
             plugin = self.plugin_manager.activatePluginByName('JLinkRttSourceActor', "Source", save_state=False)
@@ -159,9 +175,14 @@ class SerialUI(object):
             filename = "./log/" + self.port + "_" + datetime.now().strftime("%Y_%m_%d_%H_%M_%S") + ".html"
             msg = {
                 'cmd': 'open',
-                'filename': filename
+                'filename': filename,
+                'header': STYLE_TAG
             }
             m.tell('/cmd', msg, actor_ref=self.plugin_manager.getActorRefByName('FileStoreActor', "Storage"))
+            if self.capture:
+                #同时录制原始数据
+                msg = {'cmd': 'open', 'filename': filename[:-len('.html')] + '.sscap', 'source': self.port}
+                m.tell('/cmd', msg, actor_ref=self.plugin_manager.getActorRefByName('CaptureStoreActor', "Storage"))
             ret = m.ask("/cmd", {'cmd':'open', 'port':self.port, 'baudrate':self.baud, 'timeout':0.05}, actor_ref=self.plugin_manager.getActorRefByName('SerialSourceActor', "Source"), timeout=1, block=True)
             if ret[0][1]:
                 self.openclose = "Close"
@@ -176,11 +197,14 @@ class SerialUI(object):
                 self.plugin_manager.getActorRefByName('SerialSourceActor', "Source"),
                 self.plugin_manager.getActorRefByName('FileStoreActor', "Storage"),
             ]
+            if self.capture:
+                actors.append(self.plugin_manager.getActorRefByName('CaptureStoreActor', "Storage"))
             m.tell('/cmd', msg, actor_ref=actors)
             self.openclose = "Open"
     
     def tell(self, message):
-        data = message.get('data')
+        topic, frames = unpack(message)
+        data = ''.join(frame.data for frame in frames)
         self.recvtxt += data
         if self._enable_scroll and not self._context_menu_open:
             self.scroll.scroll_to(percent=1.0)
@@ -1,12 +1,16 @@
 import serial.tools.list_ports
 from datetime import datetime
 from core.manager import TopicManager, MyConfigurablePluginManager
+from core.aio import use_asyncio_runtime
 from core.plugintype import ConvertActor, SourceActor, StorageActor, FilterActor, HighlightActor 
+from core.message import unpack
+from core.ansi import STYLE_TAG, DEFAULT, BOLD, ITALIC, UNDERLINE, css_color
 from configparser import ConfigParser
-import queue, logging, copy
+import queue, logging
 import sys,os
 from PySide6.QtWidgets import QApplication, QMainWindow, QMessageBox
 from PySide6.QtCore import Slot, QTimer
+from PySide6.QtGui import QColor, QFont, QTextCharFormat, QTextCursor
 from ui.ui_main import Ui_MainWindow
 
 
@@ -15,6 +19,8 @@ class SerialApp(QMainWindow):
         super().__init__()
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
+        #样式元组(前景色, 背景色, 属性) -> QTextCharFormat
+        self._formats = {}
         self.logger = logging.getLogger('SerialApp')
         self.port_list = None 
         self.baudrates = [
@@ -38,12 +44,17 @@ class SerialApp(QMainWindow):
         self.config_parser = ConfigParser()
         self.config_file = 'config.ini'
         self.config_parser.read(self.config_file)
+        #[app] capture = true时打开串口同时录制原始数据(.sscap), 可以用ReplaySourceActor回放
+        self.capture = self.config_parser.getboolean('app', 'capture', fallback=False)
         if getattr(sys, 'frozen', False):
             current_dir = sys._MEIPASS
         else:
             current_dir = os.path.dirname(os.path.abspath(__file__))
 
         path = os.path.join(current_dir, "plugins")
+        #[app] runtime = asyncio: 所有actor在一个asyncio事件循环中运行
+        if self.config_parser.get('app', 'runtime', fallback='thread') == 'asyncio':
+            use_asyncio_runtime()
         self.plugin_manager = MyConfigurablePluginManager(
             configparser_instance=self.config_parser,
             categories_filter={
@@ -60,16 +71,22 @@ class SerialApp(QMainWindow):
         self.plugin_manager.collectPlugins()
 
         m = TopicManager.singleton()
-        m.subscribe('/Ansi2HtmlConverter/output', self)
+        m.subscribe('/AnsiStyleActor/output', self)
         #将各个actor的topic串联起来
-        #SerialSource/output -> LineSegment/input, LineSegment/output -> AnsiConvert/input, AnsiConvert/output -> FileStore/input
+        #SerialSource/output -> LineSegment/input, LineSegment/output -> AnsiStyle/input, AnsiStyle/output -> AnsiConvert/input, AnsiConvert/output -> FileStore/input
         m.connect(self.plugin_manager.getActorByName('SerialSourceActor', "Source"), self.plugin_manager.getActorByName('LineSegmentActor', "Convert"))
-        m.connect(self.plugin_manager.getActorByName('LineSegmentActor', "Convert"), self.plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"))
+        m.connect(self.plugin_manager.getActorByName('LineSegmentActor', "Convert"), self.plugin_manager.getActorByName('AnsiStyleActor', "Convert"))
+        m.connect(self.plugin_manager.getActorByName('AnsiStyleActor', "Convert"), self.plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"))
         m.connect(self.plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"), self.plugin_manager.getActorByName('FileStoreActor', "Storage"))
         m.connect(self.plugin_manager.getActorByName('JLinkRttSourceActor', "Source"), self.plugin_manager.getActorByName('LineSegmentActor', "Convert"))
+        #单生产者/单消费者的actor在上游线程中直接执行
+        m.enable_fusion()
         #activate plugin
         self.plugin_manager.activatePluginByName('LineSegmentActor', "Convert", save_state=False)
         self.plugin_manager.activatePluginByName('FileStoreActor', "Storage", save_state=False)
+        if self.capture:
+            self.plugin_manager.activatePluginByName('CaptureStoreActor', "Storage", save_state=False)
+        self.plugin_manager.activatePluginByName('AnsiStyleActor', "Convert", save_state=False)
         self.plugin_manager.activatePluginByName('Ansi2HtmlConverter', "Convert", save_state=False)
         #注册timer
         self.timer = QTimer(self)
@@ -81,21 +98,47 @@ class SerialApp(QMainWindow):
         self.port_list = [p.device for p in ports]
 
     def tell(self, message):
-        #deep copy message
-        msg = copy.copy(message)
-        self.logger.debug("tell: %s", msg)
-        self.msg_queue.put(msg)
+        #Frame不可修改, 不需要复制
+        self.logger.debug("tell: %s", message)
+        self.msg_queue.put(message)
     
     def backgound_task(self):
         while self.msg_queue.qsize() > 0:
             msg = self.msg_queue.get(block=False)
             self.logger.debug("msg: %s", msg)
-            if msg['topic'] == '/Ansi2HtmlConverter/output':
-                # self.recvtxt += msg['data']
-                self.ui.textEdit.insertHtml(msg['data'])
+            topic, frames = unpack(msg)
+            if topic == '/AnsiStyleActor/output':
+                cursor = self.ui.textEdit.textCursor()
+                cursor.movePosition(QTextCursor.End)
+                for frame in frames:
+                    if isinstance(frame.data, str):
+                        #hex模式
+                        cursor.insertText(frame.data, self._format(DEFAULT))
+                        continue
+                    for text, style in frame.data.segments():
+                        cursor.insertText(text, self._format(style))
                 #scroll to bottom
                 self.ui.textEdit.verticalScrollBar().setValue(self.ui.textEdit.verticalScrollBar().maximum())
 
+    def _format(self, style):
+        """
+        AnsiStyleActor输出的样式对应的文本格式
+        """
+        fmt = self._formats.get(style)
+        if fmt is None:
+            fg, bg, flags = style
+            fmt = QTextCharFormat()
+            if fg is not None:
+                fmt.setForeground(QColor(css_color(fg)))
+            if bg is not None:
+                fmt.setBackground(QColor(css_color(bg)))
+            if flags & BOLD:
+                fmt.setFontWeight(QFont.Bold)
+            fmt.setFontItalic(bool(flags & ITALIC))
+            fmt.setFontUnderline(bool(flags & UNDERLINE))
+            self._formats[style] = fmt
+        return fmt
+
     @Slot(str)
     def on_comboBox_port_currentTextChanged(self, text):
         self.port = self.ui.comboBox_port.currentText()
@@ -130,9 +173,14 @@ class SerialApp(QMainWindow):
             filename = "./log/" + self.port + "_" + datetime.now().strftime("%Y_%m_%d_%H_%M_%S") + ".html"
             msg = {
                 'cmd': 'open',
-                'filename': filename
+                'filename': filename,
+                'header': STYLE_TAG
             }
             m.tell('/cmd', msg, actor_ref=self.plugin_manager.getActorRefByName('FileStoreActor', "Storage"))
+            if self.capture:
+                #同时录制原始数据
+                msg = {'cmd': 'open', 'filename': filename[:-len('.html')] + '.sscap', 'source': self.port}
+                m.tell('/cmd', msg, actor_ref=self.plugin_manager.getActorRefByName('CaptureStoreActor', "Storage"))
             ret = m.ask("/cmd", {'cmd':'open', 'port':self.port, 'baudrate':self.baud, 'timeout':0.05}, actor_ref=self.plugin_manager.getActorRefByName('SerialSourceActor', "Source"), timeout=1, block=True)
             if ret[0][1]:
                 self.ui.btn_openclose.setText("Close")
@@ -148,6 +196,8 @@ class SerialApp(QMainWindow):
                 self.plugin_manager.getActorRefByName('SerialSourceActor', "Source"),
                 self.plugin_manager.getActorRefByName('FileStoreActor', "Storage"),
             ]
+            if self.capture:
+                actors.append(self.plugin_manager.getActorRefByName('CaptureStoreActor', "Storage"))
             m.tell('/cmd', msg, actor_ref=actors)
             self.ui.btn_openclose.setText("Open")
 
@@ -3,92 +3,48 @@ from tkinter import messagebox
 import serial.tools.list_ports
 from datetime import datetime
 from core.manager import TopicManager, MyConfigurablePluginManager
+from core.aio import use_asyncio_runtime
 from core.plugintype import ConvertActor, SourceActor, StorageActor, FilterActor, HighlightActor 
+from core.message import unpack
+from core.ansi import STYLE_TAG, DEFAULT, UNDERLINE, css_color
 from configparser import ConfigParser
-import queue, logging, copy
+import queue, logging
 import sys,os,time
-from stransi import Ansi, SetAttribute, SetColor
 
 class MyAnsiTextBox(customtkinter.CTkTextbox):
     def __init__(self, master):
         super().__init__(master)
-        #create tag according to ansi color
-        self._color_names = ['black', 'red', 'green', 'yellow', 'blue', 'magenta', 'cyan', 'white']
-        self.tag_config('fg_black', foreground='black')
-        self.tag_config('fg_red', foreground='red')
-        self.tag_config('fg_green', foreground='green')
-        self.tag_config('fg_yellow', foreground='yellow')
-        self.tag_config('fg_blue', foreground='blue')
-        self.tag_config('fg_magenta', foreground='magenta')
-        self.tag_config('fg_cyan', foreground='cyan')
-        self.tag_config('fg_white', foreground='white')
-        self.tag_config('bg_black', background='black')
-        self.tag_config('bg_red', background='red')
-        self.tag_config('bg_green', background='green')
-        self.tag_config('bg_yellow', background='yellow')
-        self.tag_config('bg_blue', background='blue')
-        self.tag_config('bg_magenta', background='magenta')
-        self.tag_config('bg_cyan', background='cyan')
-        self.tag_config('bg_white', background='white')
-        self.tag_config('default', foreground='black', background='white')
-        # self.tag_config('bold', font=('Courier', 10, 'bold'))
-        # self.tag_config('stroke', font=('Courier', 10, 'underline'))
-        # self.tag_config('strong', font=('Courier', 10, 'bold'))
-        # self.tag_config('normal', font=('Courier', 10, 'normal'))
-        # self.tag_config('underline', underline=True)
-        # self.bold = False
-        # self.stroke = False
-        # self.strong = False
-        # self.underline = False
-        self.fg_color = 'fg_white'
-        self.bg_color = 'bg_black'
-    
-    def _cvtColor(self, color):
-        return color.web_color.name
-    
-    def append_ansi(self, ansi_data):
+        #样式 -> 已经创建的tag名
+        self._tags = {}
+
+    def _tag(self, style):
         """
-        将插入的数据按照ansi格式进行显示
+        AnsiStyleActor输出的样式对应的tag, 第一次使用时创建
         """
-        for t in Ansi(ansi_data).instructions():
-            if isinstance(t, str):
-                tags = [self.fg_color, self.bg_color]
-                # if self.bold:
-                #     tags.append('bold')
-                # if self.stroke:
-                #     tags.append('stroke')
-                # if self.strong:
-                #     tags.append('strong')
-                # if self.underline:
-                #     tags.append('underline')
-                # if not self.bold and not self.stroke and not self.strong:
-                #     tags.append('normal')
-                self.insert('end', t, tags)
-                self.see('end')
-            elif isinstance(t, SetAttribute):
-                if t.attribute.name == "BOLD":
-                    self.bold = True
-                elif t.attribute.name == "STROKE":
-                    self.stroke = True
-                elif t.attribute.name == "STRONG":
-                    self.strong = True
-                elif t.attribute.name == "NORMAL":
-                    self.bold = False
-                    self.stroke = False
-                    self.strong = False
-                    self.fg_color = 'fg_white'
-                    self.bg_color = 'bg_black'
-            elif isinstance(t, SetColor):
-                if t.role.name == "FOREGROUND":
-                    if t.color:
-                        self.fg_color = 'fg_' + self._cvtColor(t.color)
-                    else:
-                        self.fg_color = 'fg_white'
-                else:
-                    if t.color:
-                        self.bg_color = 'bg_' + self._cvtColor(t.color)
-                    else:
-                        self.bg_color = 'bg_black'
+        tag = self._tags.get(style)
+        if tag is None:
+            tag = 'ansi%d' % len(self._tags)
+            fg, bg, flags = style
+            options = {}
+            if fg is not None:
+                options['foreground'] = css_color(fg)
+            if bg is not None:
+                options['background'] = css_color(bg)
+            if flags & UNDERLINE:
+                options['underline'] = True
+            self.tag_config(tag, **options)
+            self._tags[style] = tag
+        return tag
+
+    def append_styled(self, data):
+        """
+        按样式插入AnsiStyleActor输出的StyledText, hex模式的文本直接插入
+        """
+        if isinstance(data, str):
+            self.insert('end', data)
+            return
+        for text, style in data.segments():
+            self.insert('end', text, None if style == DEFAULT else self._tag(style))
 
 class MyPortSelectWidget(customtkinter.CTkFrame):
     def __init__(self, master):
@@ -140,6 +96,8 @@ class App(customtkinter.CTk):
         self.config_parser = ConfigParser()
         self.config_file = 'config.ini'
         self.config_parser.read(self.config_file)
+        #[app] capture = true时打开串口同时录制原始数据(.sscap), 可以用ReplaySourceActor回放
+        self.capture = self.config_parser.getboolean('app', 'capture', fallback=False)
         if self.config_parser.has_section('window') and self.config_parser.has_option('window', 'geometry'):
             self.geometry(self.config_parser.get('window', 'geometry'))
         else:
@@ -178,6 +136,9 @@ class App(customtkinter.CTk):
             current_dir = os.path.dirname(os.path.abspath(__file__))
 
         path = os.path.join(current_dir, "plugins")
+        #[app] runtime = asyncio: 所有actor在一个asyncio事件循环中运行
+        if self.config_parser.get('app', 'runtime', fallback='thread') == 'asyncio':
+            use_asyncio_runtime()
         self.plugin_manager = MyConfigurablePluginManager(
             configparser_instance=self.config_parser,
             categories_filter={
@@ -194,16 +155,22 @@ class App(customtkinter.CTk):
         self.plugin_manager.collectPlugins()
 
         m = TopicManager.singleton()
-        m.subscribe('/LineSegmentActor/output', self)
+        m.subscribe('/AnsiStyleActor/output', self)
         #将各个actor的topic串联起来
-        #SerialSource/output -> LineSegment/input, LineSegment/output -> AnsiConvert/input, AnsiConvert/output -> FileStore/input
+        #SerialSource/output -> LineSegment/input, LineSegment/output -> AnsiStyle/input, AnsiStyle/output -> AnsiConvert/input, AnsiConvert/output -> FileStore/input
         m.connect(self.plugin_manager.getActorByName('SerialSourceActor', "Source"), self.plugin_manager.getActorByName('LineSegmentActor', "Convert"))
-        m.connect(self.plugin_manager.getActorByName('LineSegmentActor', "Convert"), self.plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"))
+        m.connect(self.plugin_manager.getActorByName('LineSegmentActor', "Convert"), self.plugin_manager.getActorByName('AnsiStyleActor', "Convert"))
+        m.connect(self.plugin_manager.getActorByName('AnsiStyleActor', "Convert"), self.plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"))
         m.connect(self.plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"), self.plugin_manager.getActorByName('FileStoreActor', "Storage"))
         m.connect(self.plugin_manager.getActorByName('JLinkRttSourceActor', "Source"), self.plugin_manager.getActorByName('LineSegmentActor', "Convert"))
+        #单生产者/单消费者的actor在上游线程中直接执行
+        m.enable_fusion()
         #activate plugin
         self.plugin_manager.activatePluginByName('LineSegmentActor', "Convert", save_state=False)
         self.plugin_manager.activatePluginByName('FileStoreActor', "Storage", save_state=False)
+        if self.capture:
+            self.plugin_manager.activatePluginByName('CaptureStoreActor', "Storage", save_state=False)
+        self.plugin_manager.activatePluginByName('AnsiStyleActor', "Convert", save_state=False)
         self.plugin_manager.activatePluginByName('Ansi2HtmlConverter', "Convert", save_state=False)
     
     def on_resize(self, event):
@@ -227,10 +194,9 @@ class App(customtkinter.CTk):
         pass
 
     def tell(self, message):
-        #deep copy message
-        msg = copy.copy(message)
-        self.logger.debug("tell: %s", msg)
-        self.msg_queue.put(msg)
+        #Frame不可修改, 不需要复制
+        self.logger.debug("tell: %s", message)
+        self.msg_queue.put(message)
 
     def update_config(self):
         """
@@ -266,9 +232,14 @@ class App(customtkinter.CTk):
             filename = "./log/" + port + "_" + datetime.now().strftime("%Y_%m_%d_%H_%M_%S") + ".html"
             msg = {
                 'cmd': 'open',
-                'filename': filename
+                'filename': filename,
+                'header': STYLE_TAG
             }
             m.tell('/cmd', msg, actor_ref=self.plugin_manager.getActorRefByName('FileStoreActor', "Storage"))
+            if self.capture:
+                #同时录制原始数据
+                msg = {'cmd': 'open', 'filename': filename[:-len('.html')] + '.sscap', 'source': port}
+                m.tell('/cmd', msg, actor_ref=self.plugin_manager.getActorRefByName('CaptureStoreActor', "Storage"))
             ret = m.ask("/cmd", {'cmd':'open', 'port':port, 'baudrate':int(baud), 'timeout':0.05}, actor_ref=self.plugin_manager.getActorRefByName('SerialSourceActor', "Source"), timeout=1, block=True)
             if ret[0][1]:
                 self.open_close_btn.configure(text="Close")
@@ -283,11 +254,19 @@ class App(customtkinter.CTk):
                 self.plugin_manager.getActorRefByName('SerialSourceActor', "Source"),
                 self.plugin_manager.getActorRefByName('FileStoreActor', "Storage"),
             ]
+            if self.capture:
+                actors.append(self.plugin_manager.getActorRefByName('CaptureStoreActor', "Storage"))
             m.tell('/cmd', msg, actor_ref=actors)
             self.open_close_btn.configure(text="Open")
 
     def on_hex_mode(self):
-        print("hex mode") 
+        port, baud = self.port_sel.get()
+        mode = 'hex' if self.hex_mode_btn.get() else 'text'
+        msg = {'cmd': 'set_mode', 'mode': mode}
+        if mode == 'hex' and port != 'JLink' and baud.isdigit():
+            #hex模式按照数据之间的空闲时间分包, 空闲时间根据波特率计算
+            msg['baudrate'] = int(baud)
+        TopicManager.singleton().tell('/cmd', msg, actor_ref=self.plugin_manager.getActorRefByName('LineSegmentActor', "Convert"))
 
     def button_callback(self):
         print("button pressed")
@@ -305,8 +284,11 @@ class App(customtkinter.CTk):
             while self.msg_queue.qsize() > 0:
                 msg = self.msg_queue.get(block=False)
                 self.logger.debug("msg: %s", msg)
-                if msg['topic'] == '/LineSegmentActor/output':
-                    self.display_widget.append_ansi(msg['data'])
+                topic, frames = unpack(msg)
+                if topic == '/AnsiStyleActor/output':
+                    for frame in frames:
+                        self.display_widget.append_styled(frame.data)
+                    self.display_widget.see('end')
             time.sleep(0.01)
 
 if __name__ == "__main__":
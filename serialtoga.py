@@ -4,12 +4,14 @@ from toga.style import Pack
 import serial.tools.list_ports
 from datetime import datetime
 from core.manager import TopicManager, MyConfigurablePluginManager
+from core.aio import use_asyncio_runtime
 from core.plugintype import ConvertActor, SourceActor, StorageActor, FilterActor, HighlightActor 
+from core.message import unpack
+from core.ansi import STYLE_TAG
 from configparser import ConfigParser
 import queue
 import asyncio
 import logging
-import copy
 
 class MyMultiLineDisplay(toga.MultilineTextInput):
     def set_rtf(self, value):
@@ -70,6 +72,11 @@ class SerialApp(toga.App):
         self.config_parser = ConfigParser()
         self.config_file = 'config.ini'
         self.config_parser.read(self.config_file)
+        #[app] capture = true时打开串口同时录制原始数据(.sscap), 可以用ReplaySourceActor回放
+        self.capture = self.config_parser.getboolean('app', 'capture', fallback=False)
+        #[app] runtime = asyncio: 所有actor在一个asyncio事件循环中运行
+        if self.config_parser.get('app', 'runtime', fallback='thread') == 'asyncio':
+            use_asyncio_runtime()
         self.plugin_manager = MyConfigurablePluginManager(
             configparser_instance=self.config_parser,
             categories_filter={
@@ -88,14 +95,20 @@ class SerialApp(toga.App):
         m = TopicManager.singleton()
         m.subscribe('/Ansi2HtmlConverter/output', self)
         #将各个actor的topic串联起来
-        #SerialSource/output -> LineSegment/input, LineSegment/output -> AnsiConvert/input, AnsiConvert/output -> FileStore/input
+        #SerialSource/output -> LineSegment/input, LineSegment/output -> AnsiStyle/input, AnsiStyle/output -> AnsiConvert/input, AnsiConvert/output -> FileStore/input
         m.connect(self.plugin_manager.getActorByName('SerialSourceActor', "Source"), self.plugin_manager.getActorByName('LineSegmentActor', "Convert"))
-        m.connect(self.plugin_manager.getActorByName('LineSegmentActor', "Convert"), self.plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"))
+        m.connect(self.plugin_manager.getActorByName('LineSegmentActor', "Convert"), self.plugin_manager.getActorByName('AnsiStyleActor', "Convert"))
+        m.connect(self.plugin_manager.getActorByName('AnsiStyleActor', "Convert"), self.plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"))
         m.connect(self.plugin_manager.getActorByName('Ansi2HtmlConverter', "Convert"), self.plugin_manager.getActorByName('FileStoreActor', "Storage"))
         m.connect(self.plugin_manager.getActorByName('JLinkRttSourceActor', "Source"), self.plugin_manager.getActorByName('LineSegmentActor', "Convert"))
+        #单生产者/单消费者的actor在上游线程中直接执行
+        m.enable_fusion()
         #activate plugin
         self.plugin_manager.activatePluginByName('LineSegmentActor', "Convert", save_state=False)
         self.plugin_manager.activatePluginByName('FileStoreActor', "Storage", save_state=False)
+        if self.capture:
+            self.plugin_manager.activatePluginByName('CaptureStoreActor', "Storage", save_state=False)
+        self.plugin_manager.activatePluginByName('AnsiStyleActor', "Convert", save_state=False)
         self.plugin_manager.activatePluginByName('Ansi2HtmlConverter', "Convert", save_state=False)
         #add background task
         self.add_background_task(self.backgound_task)
@@ -106,21 +119,22 @@ class SerialApp(toga.App):
         # self.ui_main_dispaly.set_rtf(a)
 
     def tell(self, message):
-        #deep copy message
-        msg = copy.copy(message)
-        self.logger.debug("tell: %s", msg)
-        self.msg_queue.put(msg)
+        #Frame不可修改, 不需要复制
+        self.logger.debug("tell: %s", message)
+        self.msg_queue.put(message)
     
     async def backgound_task(self, widget):
         while True:
             while self.msg_queue.qsize() > 0:
                 msg = self.msg_queue.get(block=False)
                 self.logger.debug("msg: %s", msg)
-                if msg['topic'] == '/Ansi2HtmlConverter/output':
+                topic, frames = unpack(msg)
+                if topic == '/Ansi2HtmlConverter/output':
+                    data = ''.join(frame.data for frame in frames)
                     self.logger.debug('add to display')
-                    self.recvtxt += msg['data']
-                    # self.ui_main_dispaly.value += msg['data']
-                    self.ui_main_dispaly.set_rtf(msg['data'])
+                    self.recvtxt += data
+                    # self.ui_main_dispaly.value += data
+                    self.ui_main_dispaly.set_rtf(data)
                     self.ui_main_dispaly.scroll_to_bottom()
             await asyncio.sleep(0.02)
 
@@ -154,9 +168,14 @@ class SerialApp(toga.App):
             filename = "./log/" + self.port + "_" + datetime.now().strftime("%Y_%m_%d_%H_%M_%S") + ".html"
             msg = {
                 'cmd': 'open',
-                'filename': filename
+                'filename': filename,
+                'header': STYLE_TAG
             }
             m.tell('/cmd', msg, actor_ref=self.plugin_manager.getActorRefByName('FileStoreActor', "Storage"))
+            if self.capture:
+                #同时录制原始数据
+                msg = {'cmd': 'open', 'filename': filename[:-len('.html')] + '.sscap', 'source': self.port}
+                m.tell('/cmd', msg, actor_ref=self.plugin_manager.getActorRefByName('CaptureStoreActor', "Storage"))
             ret = m.ask("/cmd", {'cmd':'open', 'port':self.port, 'baudrate':self.baud, 'timeout':0.05}, actor_ref=self.plugin_manager.getActorRefByName('SerialSourceActor', "Source"), timeout=1, block=True)
             if ret[0][1]:
                 self.ui_openclose_btn.text = "Close"
@@ -172,6 +191,8 @@ class SerialApp(toga.App):
                 self.plugin_manager.getActorRefByName('SerialSourceActor', "Source"),
                 self.plugin_manager.getActorRefByName('FileStoreActor', "Storage"),
             ]
+            if self.capture:
+                actors.append(self.plugin_manager.getActorRefByName('CaptureStoreActor', "Storage"))
             m.tell('/cmd', msg, actor_ref=actors)
             self.ui_openclose_btn.text = "Open"
 
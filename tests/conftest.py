@@ -0,0 +1,5 @@
+import os
+import sys
+
+#测试从仓库根目录导入core和plugins
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,28 @@
+from core.ansi import DEFAULT, to_html, to_styled, styled_to_html
+from core.message import Frame
+from core.procpool import StagePool
+from plugins.data_convert.AnsiStyleActor import AnsiStyleActor
+
+LINES = ['\x1b[31mred\x1b[0m plain\n', '\x1b[1;38;5;208mbold orange\x1b[44m on blue\n', 'still colored\x1b[0m\n',
+         '\x1b[32m[12.345\x1b[0m] \x1b[38;2;1;2;3mtrue color\x1b[0m\n']
+
+
+def test_styled_to_html_matches_to_html():
+    style = DEFAULT
+    for line in LINES:
+        styled, end_style = to_styled(line, style)
+        assert styled_to_html(styled) == to_html(line, style)[0]
+        style = end_style
+
+
+def test_styled_from_worker_process():
+    #子进程中解析的样式在主进程中渲染, 结果和本进程解析的相同
+    results = []
+    pool = StagePool(AnsiStyleActor, 1)
+    pool.submit([Frame(line, 'COM1', i) for i, line in enumerate(LINES)], results.extend)
+    pool.shutdown()
+    assert [frame.mode for frame in results] == ['styled'] * len(LINES)
+    style = DEFAULT
+    for frame, line in zip(results, LINES):
+        html, style = to_html(line, style)
+        assert styled_to_html(frame.data) == html
@@ -0,0 +1,219 @@
+import random
+import pytest
+from core.framing import CRC, CobsDecoder, IdleGapFramer, LengthPrefixDecoder, LineSplitter, SlipDecoder
+from core.message import Frame
+from plugins.data_convert.LengthFramerActor import LengthFramerActor
+
+
+def _chunks(data, rng, max_size=16):
+    """
+    把data随机切成块, 包括1字节的块
+    """
+    pos = 0
+    out = []
+    while pos < len(data):
+        size = rng.randint(1, max_size)
+        out.append(data[pos:pos + size])
+        pos += size
+    return out
+
+
+def _line_stream(rng, count=200):
+    words = [b'ok', b'temp=17.5', b'\xe4\xb8\xad\xe6\x96\x87', b'', b'x' * 40]
+    endings = [b'\n', b'\r\n', b'\r']
+    return b''.join(rng.choice(words) + rng.choice(endings) for _ in range(count)) + b'tail'
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_line_splitter_chunk_split_round_trip(seed):
+    rng = random.Random(seed)
+    data = _line_stream(rng)
+    splitter = LineSplitter(max_length=0)
+    lines = []
+    #每行的时间戳为第一个字节所在块的时间戳
+    starts = []
+    for ts, chunk in enumerate(_chunks(data, rng)):
+        lines += splitter.feed('COM1', chunk, ts)
+        starts += [ts] * len(chunk)
+    assert splitter.next_timeout(0) is not None
+    lines += [(line, ts) for _, line, ts in splitter.flush()]
+    expected = data.splitlines(keepends=True)
+    assert [line for line, _ in lines] == expected
+    offsets = [0]
+    for line in expected[:-1]:
+        offsets.append(offsets[-1] + len(line))
+    assert [ts for _, ts in lines] == [starts[offset] for offset in offsets]
+    assert splitter.next_timeout() is None
+
+
+def test_line_splitter_sources_are_independent():
+    splitter = LineSplitter()
+    assert splitter.feed('A', b'hel', 1) == []
+    assert splitter.feed('B', b'wor', 2) == []
+    assert splitter.feed('A', b'lo\nx', 3) == [(b'hello\n', 1)]
+    assert splitter.feed('B', b'ld\r', 4) == []
+    #\r可能是\r\n的前半部分, 等下一块数据
+    assert splitter.feed('B', b'\n', 5) == [(b'world\r\n', 2)]
+    assert sorted(splitter.flush()) == [('A', b'x', 3)]
+
+
+def test_line_splitter_max_length_and_expire():
+    splitter = LineSplitter(max_length=4, idle_timeout=0.1)
+    assert splitter.feed('A', b'abcdefghij', 10) == [(b'abcd', 10), (b'efgh', 10)]
+    assert splitter.expire(now=10 + 50 * 10 ** 6) == []
+    assert splitter.next_timeout(now=10 + 50 * 10 ** 6) == pytest.approx(0.05)
+    assert splitter.expire(now=10 + 100 * 10 ** 6) == [('A', b'ij', 10)]
+
+
+@pytest.mark.parametrize('kwargs', [{'byteorder': 'middle'}, {'length_size': 3}, {'length_size': '2'}])
+def test_length_prefix_rejects_bad_options(kwargs):
+    with pytest.raises(ValueError):
+        LengthPrefixDecoder(**kwargs)
+    actor = LengthFramerActor()
+    #configure失败时保留原来的解码器, 之后的输入不会出错
+    assert actor.on_cmd(dict(kwargs, cmd='configure')) is False
+    actor.on_input(Frame(b'\xaa\x55\x01\x00', 'COM1', 1))
+    assert actor.on_cmd({'cmd': 'stats'})['buffered'] == 4
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_idle_gap_framer_groups_chunks_by_gap(seed):
+    rng = random.Random(seed)
+    gap = 0.02
+    framer = IdleGapFramer(gap=gap, max_length=0)
+    packets = []
+    expected = []
+    ts = 0
+    for i in range(300):
+        chunk = bytes(rng.randrange(256) for _ in range(rng.randint(1, 8)))
+        #间隔超过gap时开始新的一包
+        if i == 0 or rng.random() < 0.2:
+            ts += rng.randint(21, 100) * 10 ** 6
+            expected.append([chunk, ts])
+        else:
+            ts += rng.randint(0, 20) * 10 ** 6
+            expected[-1][0] += chunk
+        packets += framer.feed('COM1', chunk, ts)
+    #最后一包由空闲超时输出
+    assert framer.expire(now=ts + int(gap * 1e9) - 1) == []
+    packets += [(packet, first) for _, packet, first in framer.expire(now=ts + int(gap * 1e9))]
+    assert packets == [tuple(item) for item in expected]
+
+
+def test_idle_gap_framer_max_length():
+    framer = IdleGapFramer(gap=0.02, max_length=4)
+    assert framer.feed('A', b'abc', 1) == []
+    assert framer.feed('A', b'defghi', 2) == [(b'abcd', 1), (b'efgh', 1)]
+    #超过max_length后剩余的部分仍属于同一包, 时间戳不变
+    assert framer.feed('A', b'jk', 3) == []
+    assert framer.flush() == [('A', b'ijk', 1)]
+
+
+def test_idle_gap_default_gap():
+    assert IdleGapFramer.default_gap(1200) == pytest.approx(3.5 * 11 / 1200)
+    #高波特率时不小于USB串口的上报间隔
+    assert IdleGapFramer.default_gap(115200) == IdleGapFramer.MIN_GAP
+    assert IdleGapFramer(baudrate=1200).idle_timeout == pytest.approx(3.5 * 11 / 1200)
+
+
+def _with_crc(payload, crc, byteorder='little'):
+    if crc is None:
+        return payload
+    size, fn = CRC[crc]
+    return payload + fn(payload).to_bytes(size, byteorder)
+
+
+def slip_encode(payload, crc=None):
+    raw = _with_crc(payload, crc)
+    return b'\xc0' + raw.replace(b'\xdb', b'\xdb\xdd').replace(b'\xc0', b'\xdb\xdc') + b'\xc0'
+
+
+def cobs_encode(payload, crc=None):
+    out = bytearray()
+    block = bytearray()
+    for b in _with_crc(payload, crc):
+        if b == 0:
+            out.append(len(block) + 1)
+            out += block
+            block.clear()
+        else:
+            block.append(b)
+            if len(block) == 254:
+                out.append(0xFF)
+                out += block
+                block.clear()
+    out.append(len(block) + 1)
+    out += block
+    return bytes(out) + b'\x00'
+
+
+def length_encode(payload, crc=None, sync=b'\xaa\x55', length_size=2, byteorder='little'):
+    body = len(payload).to_bytes(length_size, byteorder) + payload
+    return sync + _with_crc(body, crc, byteorder)
+
+
+def _payloads(rng, count=100):
+    #包括转义字节, 0, 同步字节, 空包和跨越COBS 254字节块的长包
+    special = [b'\xc0', b'\xdb', b'\x00', b'\xaa\x55', b'\xdb\xdc']
+    out = []
+    for _ in range(count):
+        parts = [rng.choice(special) if rng.random() < 0.3 else bytes([rng.randrange(1, 256)])
+                 for _ in range(rng.choice([1, 5, 20, 253, 254, 300]))]
+        out.append(b''.join(parts))
+    return out
+
+
+def _decode_chunks(decoder, stream, rng):
+    out = []
+    for ts, chunk in enumerate(_chunks(stream, rng, 64)):
+        out += decoder.feed(chunk, ts)
+    return out
+
+
+CODECS = [
+    (SlipDecoder, slip_encode, {}),
+    (CobsDecoder, cobs_encode, {}),
+    (LengthPrefixDecoder, length_encode, {}),
+    (LengthPrefixDecoder, lambda p, crc: length_encode(p, crc, b'\x7e', 4, 'big'), {'sync': b'\x7e', 'length_size': 4, 'byteorder': 'big'}),
+    (LengthPrefixDecoder, lambda p, crc: length_encode(p, crc, b'\xa5', 1), {'sync': b'\xa5', 'length_size': 1}),
+]
+
+
+@pytest.mark.parametrize('crc', [None, 'crc16', 'crc32'])
+@pytest.mark.parametrize('cls, encode, kwargs', CODECS)
+def test_packet_decoder_chunk_split_round_trip(cls, encode, kwargs, crc):
+    rng = random.Random(f'{cls.__name__}{kwargs}{crc}')
+    payloads = _payloads(rng)
+    if kwargs.get('length_size') == 1:
+        payloads = [p[:255] for p in payloads]
+    decoder = cls(crc=crc, **kwargs)
+    out = _decode_chunks(decoder, b''.join(encode(p, crc) for p in payloads), rng)
+    assert [(payload, valid) for payload, valid, _ in out] == [(p, True) for p in payloads]
+    stats = decoder.stats()
+    assert stats['frames'] == len(payloads) and stats['errors'] == 0 and stats['buffered'] == 0
+
+
+@pytest.mark.parametrize('crc', ['crc16', 'crc32'])
+@pytest.mark.parametrize('cls, encode, kwargs', CODECS[:3])
+def test_packet_decoder_reports_crc_errors(cls, encode, kwargs, crc):
+    good = [b'first', b'second', b'third']
+    frames = [encode(p, crc) for p in good]
+    #第二帧的最后一个数据字节出错(不是转义或结束字节)
+    bad = bytearray(frames[1])
+    index = bad.rindex(b'd')
+    bad[index] ^= 0x01
+    frames[1] = bytes(bad)
+    decoder = cls(crc=crc, **kwargs)
+    out = decoder.feed(b''.join(frames), 1)
+    assert [(payload, valid) for payload, valid, _ in out] == [(b'first', True), (b'secone', False), (b'third', True)]
+    assert decoder.stats()['errors'] == 1
+
+
+def test_length_prefix_resyncs_after_garbage():
+    decoder = LengthPrefixDecoder(crc='crc16', max_length=64)
+    #错误的同步头后面跟着超长的长度, 从下一个字节重新同步
+    stream = b'noise\xaa\x55\xff\xff' + length_encode(b'payload', 'crc16')
+    out = decoder.feed(stream, 1)
+    assert [(payload, valid) for payload, valid, _ in out] == [(b'payload', True)]
+    stats = decoder.stats()
+    assert stats['overruns'] == 1 and stats['discarded'] == len(b'noise') + 4
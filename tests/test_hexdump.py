@@ -0,0 +1,52 @@
+import random
+import pytest
+from core.hexdump import HexDumper, hexdump
+
+#hexdump -C的输出(不包括最后只有偏移的一行)
+HEXDUMP_C = (
+    '00000000  48 65 6c 6c 6f 2c 20 57  6f 72 6c 64 21 0a 00 01  |Hello, World!...|\n'
+    '00000010  02 03 04 05 06 07 08 09  0a 0b 0c 0d 0e 0f 7f 80  |................|\n'
+    '00000020  ff                                                |.|\n'
+)
+HEXDUMP_C_DATA = b'Hello, World!\n' + bytes(range(16)) + b'\x7f\x80\xff'
+
+
+def reference(data, offset=0, width=16, group=8):
+    """
+    逐行格式化, 和hexdump -C的每行相同
+    """
+    hex_width = 3 * width - 1 + (width - 1) // group
+    rows = []
+    for i in range(0, len(data), width):
+        chunk = data[i:i + width]
+        groups = [' '.join('%02x' % b for b in chunk[j:j + group]) for j in range(0, len(chunk), group)]
+        text = ''.join(chr(b) if 0x20 <= b < 0x7f else '.' for b in chunk)
+        rows.append('%08x  %-*s  |%s|\n' % ((offset + i) & 0xffffffff, hex_width, '  '.join(groups), text))
+    return ''.join(rows)
+
+
+def test_matches_hexdump_c():
+    assert hexdump(HEXDUMP_C_DATA) == HEXDUMP_C
+    assert reference(HEXDUMP_C_DATA) == HEXDUMP_C
+
+
+SIZES = [0, 1, 15, 16, 17, 64, 65, 81, 1000, 4096 * 16 + 7, 70000]
+
+
+@pytest.mark.parametrize('width, group', [(16, 8), (8, 4), (32, 8), (10, 3), (16, 16)])
+@pytest.mark.parametrize('offset', [0, 5, 0x10, 4095 * 16, 0xfffffff0, 0x123456789])
+def test_dump_matches_reference(width, group, offset):
+    rng = random.Random(width * 1000 + offset)
+    dumper = HexDumper(width, group)
+    for size in SIZES:
+        data = rng.randbytes(size)
+        assert dumper.dump(data, offset) == reference(data, offset, width, group), size
+
+
+@pytest.mark.parametrize('width, group', [(16, 8), (8, 4), (10, 3)])
+def test_dump_many_matches_reference(width, group):
+    rng = random.Random(width)
+    dumper = HexDumper(width, group)
+    for sizes in ([3], [0, 1, 2], [64] * 10, [rng.randint(0, 300) for _ in range(200)], [5, 4096 * width + 3, 7]):
+        packets = [rng.randbytes(size) for size in sizes]
+        assert dumper.dump_many(packets) == [reference(p, 0, width, group) for p in packets], sizes
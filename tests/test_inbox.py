@@ -0,0 +1,52 @@
+import time
+from pykka._envelope import Envelope
+from core.message import Batch, Frame, Routed
+from core.plugintype import BoundedInbox
+
+
+def _frames(inbox):
+    ret = []
+    while not inbox.empty():
+        message = inbox.get_nowait().message
+        ret.extend(message.items if isinstance(message, Batch) else (message.frame,))
+    return ret
+
+
+def test_coalesce_is_bounded():
+    inbox = BoundedInbox(100, 'coalesce')
+    total = 40000
+    start = time.perf_counter()
+    for i in range(total):
+        inbox.put(Envelope(Routed('/a/input', Frame(i))))
+    elapsed = time.perf_counter() - start
+    assert inbox.data_count == 100
+    #最后一个消息合并了后面的Frame, 最多maxsize个
+    last = inbox.queue[-1].message
+    assert len(last.items) == 100
+    frames = _frames(inbox)
+    assert len(frames) == 199
+    assert inbox.dropped == total - len(frames)
+    #保留最新的Frame
+    assert [f.data for f in frames[-100:]] == list(range(total - 100, total))
+    #合并的开销与队列中的Frame个数无关
+    assert elapsed < 2
+
+
+def test_coalesce_batches():
+    inbox = BoundedInbox(2, 'coalesce')
+    for i in range(5):
+        inbox.put(Envelope(Batch('/a/input', [Frame(i * 3 + j) for j in range(3)])))
+    frames = _frames(inbox)
+    assert [f.data for f in frames] == [0, 1, 2, 13, 14]
+    assert inbox.dropped == 10
+
+
+def test_coalesce_keeps_topics_apart():
+    inbox = BoundedInbox(2, 'coalesce')
+    inbox.put(Envelope(Routed('/a/input', Frame(0))))
+    inbox.put(Envelope(Routed('/b/input', Frame(1))))
+    inbox.put(Envelope(Routed('/a/input', Frame(2))))
+    a, b = (inbox.get_nowait().message for _ in range(2))
+    assert a.topic == '/a/input' and [f.data for f in a.items] == [0, 2]
+    assert b.topic == '/b/input' and b.frame.data == 1
+    assert inbox.dropped == 0
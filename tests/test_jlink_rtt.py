@@ -0,0 +1,127 @@
+from types import SimpleNamespace
+import pylink
+from core.manager import TopicManager
+from core.message import unpack
+from plugins.data_source.JLinkRttActor import JLinkRttSourceActor
+
+
+class FakeJLink:
+    """
+    模拟RTT up buffer的JLink, buffers为每个up buffer的(名字, 大小)
+    """
+    def __init__(self, buffers, probe_failures=0):
+        self.buffers = buffers
+        self.data = [bytearray() for _ in buffers]
+        #找到控制块之前rtt_get_num_up_buffers失败的次数
+        self.probe_failures = probe_failures
+        self.is_open = False
+
+    def open(self):
+        self.is_open = True
+
+    def opened(self):
+        return self.is_open
+
+    def close(self):
+        self.is_open = False
+
+    def set_tif(self, tif):
+        pass
+
+    def connect(self, target):
+        pass
+
+    def rtt_start(self):
+        pass
+
+    def rtt_stop(self):
+        pass
+
+    def rtt_get_num_up_buffers(self):
+        if self.probe_failures:
+            self.probe_failures -= 1
+            raise pylink.errors.JLinkRTTException('control block not found')
+        return len(self.buffers)
+
+    def rtt_get_buf_descriptor(self, index, up):
+        name, size = self.buffers[index]
+        return SimpleNamespace(acName=name.encode(), SizeOfBuffer=size)
+
+    def rtt_read(self, index, size):
+        data = self.data[index][:size]
+        del self.data[index][:size]
+        return list(data)
+
+    def rtt_get_status(self):
+        return SimpleNamespace(HostOverflowCount=0)
+
+
+class Sink:
+    def __init__(self):
+        self.frames = []
+
+    def tell(self, message):
+        topic, frames = unpack(message)
+        self.frames.extend((topic, frame) for frame in frames)
+
+
+def _open(buffers, probe_failures=0):
+    jlink = FakeJLink(buffers, probe_failures)
+    actor = JLinkRttSourceActor()
+    actor.jlink_class = lambda: jlink
+    actor.on_cmd({'cmd': 'open', 'target': 'STM32F407VE'})
+    return actor, jlink
+
+
+def test_probe_channels():
+    actor, jlink = _open([('Terminal', 1024), ('Trace', 16384), ('Scope', 512)])
+    actor.on_poll()
+    assert [(c.index, c.name, c.size) for c in actor._channels] == [
+        (0, 'Terminal', 4096), (1, 'Trace', 16384), (2, 'Scope', 4096)]
+    assert [c.topic for c in actor._channels] == [
+        '/JLinkRttSourceActor/output', '/JLinkRttSourceActor/output/1', '/JLinkRttSourceActor/output/2']
+
+
+def test_probe_retried_until_control_block_found():
+    actor, jlink = _open([('Terminal', 1024), ('Trace', 1024)], probe_failures=1)
+    jlink.data[0] += b'boot\n'
+    actor.on_poll()
+    #找到控制块之前只读buffer 0
+    assert len(actor._channels) == 1 and not actor._channels_probed
+    actor.on_poll()
+    assert len(actor._channels) == 2 and actor._channels_probed
+
+
+def test_channel_topics():
+    m = TopicManager.singleton()
+    sink = Sink()
+    m.subscribe('/JLinkRttSourceActor/output*', sink)
+    try:
+        actor, jlink = _open([('Terminal', 1024), ('Trace', 1024), ('Scope', 1024)])
+        actor.on_poll()
+        jlink.data[0] += b'hello\n'
+        jlink.data[2] += bytes(range(256)) * 40
+        actor.on_poll()
+    finally:
+        m.unsubscribe('/JLinkRttSourceActor/output*', sink)
+    #每次poll从不同的buffer开始, 按topic排序
+    frames = sorted(sink.frames, key=lambda item: item[0])
+    assert [topic for topic, _ in frames] == ['/JLinkRttSourceActor/output', '/JLinkRttSourceActor/output/2']
+    text, scope = (frame for _, frame in frames)
+    assert text.data == b'hello\n' and text.source == 'STM32F407VE'
+    #buffer一次读不完时连续读到为空, 作为一个Frame发布
+    assert scope.data == bytes(range(256)) * 40
+    assert [c.bytes for c in actor._channels] == [6, 0, 10240]
+
+
+def test_poll_rotates_first_channel():
+    actor, jlink = _open([('Terminal', 1024), ('Trace', 1024)])
+    actor.max_read_per_poll = 4096
+    actor.on_poll()
+    #buffer 0一直有大量数据
+    jlink.data[0] += bytes(1 << 20)
+    jlink.data[1] += b'trace'
+    #每次poll最多读max_read_per_poll, 从buffer 1开始的poll读到buffer 1的数据
+    actor.on_poll()
+    actor.on_poll()
+    assert [c.bytes for c in actor._channels] == [8192, 5]
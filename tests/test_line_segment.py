@@ -0,0 +1,45 @@
+import time
+from core.manager import TopicManager
+from core.message import Frame, Routed, unpack
+from plugins.data_convert.LineSegmentActor import LineSegmentActor
+
+
+class Sink:
+    def __init__(self):
+        self.frames = []
+
+    def tell(self, message):
+        self.frames.extend(unpack(message)[1])
+
+
+def _wait(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_fused_partial_line_wakes_actor_once():
+    m = TopicManager.singleton()
+    sink = Sink()
+    m.subscribe('/LineSegmentActor/output', sink)
+    actor = LineSegmentActor()
+    idle = []
+    on_idle = actor._on_idle
+    actor._on_idle = lambda: (idle.append(time.monotonic()), on_idle())
+    actor.activate()
+    try:
+        #空闲时没有不完整的行, actor线程不定时醒来
+        time.sleep(3 * actor.line_timeout)
+        assert idle == []
+        #融合执行: 在当前线程中处理, 不完整的行由actor线程超时后输出
+        actor.receive_inline(Routed('/LineSegmentActor/input', Frame.now(b'partial', 'COM1')))
+        assert sink.frames == []
+        assert _wait(lambda: len(sink.frames) == 1)
+        assert sink.frames[0].data.endswith('partial')
+        count = len(idle)
+        time.sleep(3 * actor.line_timeout)
+        assert len(idle) == count
+    finally:
+        actor.deactivate()
+        m.unsubscribe('/LineSegmentActor/output', sink)
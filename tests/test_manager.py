@@ -0,0 +1,36 @@
+from core.manager import TopicManager
+
+
+class Subscriber:
+    def __init__(self):
+        self.received = []
+
+    def tell(self, message):
+        self.received.append(message)
+
+
+def test_wildcard_subscribe_twice_then_unsubscribe():
+    m = TopicManager()
+    a, b = Subscriber(), Subscriber()
+    m.subscribe('/x/*', a)
+    m.subscribe('/x/*', a)
+    m.subscribe('/x/*', b)
+    assert m._wildcards.prefixes_of('/x/y') == ['/x/']
+    m.unsubscribe('/x/*', a)
+    assert m.route('/x/y')[0][1] == (b,)
+    m.unsubscribe('/x/*', b)
+    assert m._wildcards.prefixes_of('/x/y') == []
+    assert m.route('/x/y')[0][1] == ()
+
+
+def test_wildcard_route():
+    m = TopicManager()
+    a, b = Subscriber(), Subscriber()
+    m.subscribe('/x/y', a)
+    m.subscribe('/x/*', b)
+    m.tell('/x/y', {'v': 1})
+    assert [msg['v'] for msg in a.received] == [1]
+    assert [msg['v'] for msg in b.received] == [1]
+    m.unsubscribe('/x/*', b)
+    m.tell('/x/y', {'v': 2})
+    assert len(b.received) == 1
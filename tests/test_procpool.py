@@ -0,0 +1,79 @@
+import time
+from core.manager import TopicManager
+from core.message import Frame, Routed, unpack
+from plugins.data_convert.LineSegmentActor import LineSegmentActor
+from plugins.data_convert.SlipFramerActor import SlipFramerActor
+
+
+class Sink:
+    def __init__(self):
+        self.frames = []
+
+    def tell(self, message):
+        self.frames.extend(unpack(message)[1])
+
+
+def _wait(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def _start(cls, mode):
+    m = TopicManager.singleton()
+    sink = Sink()
+    output = f'/{cls.__name__}/output'
+    m.subscribe(output, sink)
+    actor = cls()
+    actor.set_execution(mode)
+    actor.activate()
+    return actor, sink, lambda: m.unsubscribe(output, sink)
+
+
+def _input(actor, data, source='COM1'):
+    actor.actor_ref.tell(Routed(actor.data_input_topic(), Frame.now(data, source)))
+
+
+def _cmd(actor, **msg):
+    return actor.actor_ref.ask(dict(msg, topic='/cmd'), timeout=10)
+
+
+def test_hex_packet_expires_in_worker():
+    for mode in ('thread', 'process'):
+        actor, sink, close = _start(LineSegmentActor, mode)
+        try:
+            _cmd(actor, cmd='set_mode', mode='hex')
+            _input(actor, b'\x01\x02\x03')
+            #包在子进程中按空闲时间结束
+            assert _wait(lambda: len(sink.frames) == 1), mode
+            assert sink.frames[0].mode == 'hex' and '3 bytes' in sink.frames[0].data
+        finally:
+            actor.deactivate()
+            close()
+
+
+def test_partial_line_flushed_on_stop():
+    for mode in ('thread', 'process'):
+        actor, sink, close = _start(LineSegmentActor, mode)
+        try:
+            #不完整的行超时前停止
+            _cmd(actor, cmd='set_line', timeout=60)
+            _input(actor, b'done\nno newline')
+        finally:
+            actor.actor_ref.stop(block=True)
+            close()
+        assert [frame.data.rsplit(']', 1)[1] for frame in sink.frames] == ['done\n', 'no newline'], mode
+
+
+def test_cmd_reply_from_worker():
+    actor, sink, close = _start(SlipFramerActor, 'process')
+    try:
+        _input(actor, b'abc\xc0def\xc0gh')
+        assert _wait(lambda: len(sink.frames) == 2)
+        #stats来自子进程中的解码器, 不是主进程中没有使用的实例
+        stats = _cmd(actor, cmd='stats')
+        assert stats['frames'] == 2 and stats['buffered'] == 2
+    finally:
+        actor.deactivate()
+        close()
@@ -0,0 +1,51 @@
+import time
+from core.capture import CaptureWriter
+from core.framing import LineSplitter
+from plugins.data_source.ReplayActor import ReplaySourceActor
+
+
+def _record(path, lines, gap_ms=5):
+    #每行分成两块录制, 间隔gap_ms, 录制时间在很久以前
+    ts = time.monotonic_ns() - 3600 * 10 ** 9
+    with CaptureWriter(path) as writer:
+        for line in lines:
+            half = len(line) // 2
+            writer.write(ts, line[:half])
+            ts += gap_ms * 10 ** 6
+            writer.write(ts, line[half:])
+            ts += gap_ms * 10 ** 6
+
+
+def _replay(path, speed, on_frames):
+    actor = ReplaySourceActor()
+    actor.tell_batch = on_frames
+    assert actor.on_cmd({'cmd': 'open', 'file': str(path), 'speed': speed})
+    deadline = time.monotonic() + 10
+    while actor._next is not None and time.monotonic() < deadline:
+        if not actor.on_poll() and actor._next is not None:
+            time.sleep(min(actor.timeout, 0.01))
+    return actor
+
+
+def test_replay_timestamps_do_not_expire_partial_lines(tmp_path):
+    path = tmp_path / 'lines.sscap'
+    lines = [b'line %d\n' % i for i in range(20)]
+    _record(path, lines)
+    for speed in (0, 1):
+        splitter = LineSplitter(idle_timeout=0.1)
+        frames = []
+        out = []
+
+        def on_frames(batch):
+            #收到数据时检查超时, 和LineSegmentActor相同
+            for frame in batch:
+                out.extend(line for _, line, _ in splitter.expire())
+                out.extend(line for line, _ in splitter.feed(frame.source, frame.data, frame.ts))
+            frames.extend(batch)
+
+        actor = _replay(path, speed, on_frames)
+        assert out == lines
+        #回放时钟的时间戳, 不早于开始回放的时间
+        assert frames[0].ts >= actor._start
+        assert actor.on_cmd({'cmd': 'stats'})['position'] is not None
+        actor.on_close({})
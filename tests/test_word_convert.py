@@ -0,0 +1,23 @@
+from core.message import Frame
+from plugins.data_convert.WordConvert import TextWordConvert
+
+
+def _values(actor, key, source='COM1'):
+    ts, values = actor.query(key).get(source, ((), ()))
+    return list(values)
+
+
+def test_extract_from_colored_lines():
+    actor = TextWordConvert(keys=['temp'])
+    head = '\x1b[32m[05-01 12:30:45.123 \x1b[0m]'
+    lines = [head + '\x1b[0mtemp=17.5\n', head + 'temp=\x1b[31m99\x1b[0m\n', head + 'x.temp=1\n']
+    actor.on_input_batch([Frame(line, 'COM1', i) for i, line in enumerate(lines)])
+    assert _values(actor, 'temp') == [17.5, 99.0]
+
+
+def test_match_does_not_cross_lines():
+    actor = TextWordConvert(keys=['temp'])
+    lines = ['temp=\n', '5 volts\n', 'temp: 3\n']
+    actor.on_input_batch([Frame(line, 'COM1', i) for i, line in enumerate(lines)])
+    ts, values = actor.query('temp')['COM1']
+    assert list(values) == [3.0] and list(ts) == [2]